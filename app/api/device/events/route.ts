@@ -0,0 +1,71 @@
+import { NextResponse } from "next/server";
+import { prisma } from "@/lib/prisma";
+import { pushEnabled, waitForChange } from "@/lib/device-events";
+import { TtlCache } from "@/lib/ttl-cache";
+
+export const dynamic = 'force-dynamic';
+export const maxDuration = 60;
+
+const DEFAULT_TIMEOUT_S = 25;
+const MAX_TIMEOUT_S = 55;
+
+// Devices reconnect right after every answer; resolve the token once
+const deviceIds = new TtlCache<string>(5 * 60_000, 50_000);
+
+// Long-poll for content and pairing changes. The request is held until the
+// device's version differs from `since` or `timeout` seconds pass; either
+// way the player gets the current version and decides whether to sync.
+export async function GET(request: Request) {
+    if (!pushEnabled()) {
+        // Players treat this like a server without the channel and poll
+        return NextResponse.json({ error: "Push updates are disabled" }, { status: 404 });
+    }
+    try {
+        const { searchParams } = new URL(request.url);
+        const token = searchParams.get("token");
+        const since = searchParams.get("since");
+        const timeout = Math.min(
+            Math.max(Number(searchParams.get("timeout")) || DEFAULT_TIMEOUT_S, 1),
+            MAX_TIMEOUT_S
+        );
+
+        if (!token) {
+            return NextResponse.json({ error: "Token required" }, { status: 400 });
+        }
+
+        const deviceId = await deviceIds.getOrLoad(token, async () => {
+            const device = await prisma.device.findUnique({
+                where: { token },
+                select: { id: true },
+            });
+            return device?.id ?? null;
+        });
+
+        if (!deviceId) {
+            return NextResponse.json({ error: "Invalid device token" }, { status: 401 });
+        }
+
+        const state = await waitForChange(deviceId, since, timeout * 1000, request.signal);
+
+        if (!state) {
+            deviceIds.delete(token);
+            return NextResponse.json({ error: "Invalid device token" }, { status: 401 });
+        }
+
+        return NextResponse.json(
+            {
+                version: state.version,
+                paired: state.paired,
+                changed: state.version !== since,
+            },
+            { headers: { "Cache-Control": "no-store" } }
+        );
+
+    } catch (error) {
+        console.error("Events API error:", error);
+        return NextResponse.json(
+            { error: "Internal server error" },
+            { status: 500 }
+        );
+    }
+}
@@ -1,10 +1,36 @@
 import { NextResponse } from "next/server";
 import { prisma } from "@/lib/prisma";
+import { gunzipSync } from "zlib";
+
+// A batch is at most 50 short log lines; anything near these sizes is not a
+// player. The decompressed cap stops gzip bombs before the token is checked.
+const MAX_BODY_BYTES = 256 * 1024;
+const MAX_JSON_BYTES = 1024 * 1024;
 
 export async function POST(request: Request) {
     try {
-        const json = await request.json();
-        const { device_token, logs } = json;
+        if (Number(request.headers.get("content-length") || 0) > MAX_BODY_BYTES) {
+            return NextResponse.json({ error: "Payload too large" }, { status: 413 });
+        }
+        const body = Buffer.from(await request.arrayBuffer());
+        if (body.length > MAX_BODY_BYTES) {
+            return NextResponse.json({ error: "Payload too large" }, { status: 413 });
+        }
+
+        // Players send gzip-compressed batches
+        let json;
+        try {
+            const text = request.headers.get("content-encoding") === "gzip"
+                ? gunzipSync(body, { maxOutputLength: MAX_JSON_BYTES }).toString("utf8")
+                : body.toString("utf8");
+            json = JSON.parse(text);
+        } catch (error) {
+            if (error instanceof RangeError) {
+                return NextResponse.json({ error: "Payload too large" }, { status: 413 });
+            }
+            return NextResponse.json({ error: "Malformed request body" }, { status: 400 });
+        }
+        const { device_token, logs } = json ?? {};
 
         if (!device_token || typeof device_token !== "string") {
             return NextResponse.json(
@@ -1,12 +1,18 @@
 import { NextResponse } from "next/server";
+import path from "path";
+import type { Prisma } from "@prisma/client";
 import { prisma } from "@/lib/prisma";
+import { computeSyncVersion, parseVersion, syncVersionSelect } from "@/lib/device-sync";
+import { capabilityKey, pickRendition, type DeviceCapabilities } from "@/lib/renditions";
 
 export const dynamic = 'force-dynamic';
 
 export async function POST(request: Request) {
     try {
         const json = await request.json();
-        const { device_token } = json;
+        const { device_token, since_version, stats } = json;
+        const capabilities: DeviceCapabilities | null =
+            json.capabilities && typeof json.capabilities === "object" ? json.capabilities : null;
 
         if (!device_token || typeof device_token !== "string") {
             return NextResponse.json(
@@ -15,15 +21,64 @@ export async function POST(request: Request) {
             );
         }
 
-        console.log("[SYNC API] Looking for device with token:", device_token);
+        // Cheap lookup first: enough to authorize and version the content
+        const head = await prisma.device.findUnique({
+            where: { token: device_token },
+            select: syncVersionSelect,
+        });
+
+        if (!head) {
+            return NextResponse.json(
+                { error: "Invalid device token" },
+                { status: 401 }
+            );
+        }
+
+        // Check if user is active
+        if (head.user && !head.user.isActive) {
+            console.warn(`[SYNC API] Blocked sync for device ${head.id} (User Inactive)`);
+            return NextResponse.json(
+                { error: "Account suspended" },
+                { status: 403 }
+            );
+        }
+
+        // Heartbeat: update device status and last seen. Raw SQL so
+        // updatedAt stays put: it marks content changes for the change
+        // watcher in lib/device-events.ts, and a heartbeat is not one.
+        // The capabilities are the latest hardware probe, kept for the
+        // dashboard and support.
+        await prisma.$executeRaw`
+            UPDATE "Device" SET "status" = 'online', "lastSeenAt" = NOW(),
+                "capabilities" = COALESCE(${capabilities ? JSON.stringify(capabilities) : null}::jsonb, "capabilities")
+            WHERE "id" = ${head.id}`;
+
+        // Proof-of-play summary piggybacked on the heartbeat
+        if (isPlaybackSummary(stats)) {
+            await prisma.playbackReport.create({
+                data: {
+                    deviceId: head.id,
+                    periodStart: new Date(stats.from * 1000),
+                    periodEnd: new Date(stats.to * 1000),
+                    plays: stats.plays,
+                    summary: { media: stats.media, device: stats.device ?? {} },
+                },
+            });
+        }
+
+        const version = computeSyncVersion(head, capabilityKey(capabilities));
+        const etag = `"${version}"`;
+        const clientVersion =
+            parseVersion(request.headers.get("if-none-match")) || parseVersion(since_version);
+
+        if (clientVersion === version) {
+            return new NextResponse(null, { status: 304, headers: { ETag: etag } });
+        }
 
-        // Find device by token
+        // Content changed (or first sync): resolve the full payload
         const device = await prisma.device.findUnique({
-            where: { token: device_token },
+            where: { id: head.id },
             include: {
-                user: {
-                    select: { isActive: true }
-                },
                 // Include Schedule and its relations
                 schedule: {
                     include: {
@@ -32,7 +87,7 @@ export async function POST(request: Request) {
                                 playlist: {
                                     include: {
                                         items: {
-                                            include: { mediaItem: true },
+                                            include: { mediaItem: { include: readyRenditions } },
                                             orderBy: { order: "asc" },
                                         }
                                     }
@@ -45,7 +100,7 @@ export async function POST(request: Request) {
                 defaultPlaylist: {
                     include: {
                         items: {
-                            include: { mediaItem: true },
+                            include: { mediaItem: { include: readyRenditions } },
                             orderBy: { order: "asc" },
                         }
                     }
@@ -54,7 +109,7 @@ export async function POST(request: Request) {
                 activePlaylist: {
                     include: {
                         items: {
-                            include: { mediaItem: true },
+                            include: { mediaItem: { include: readyRenditions } },
                             orderBy: { order: "asc" },
                         }
                     }
@@ -62,8 +117,6 @@ export async function POST(request: Request) {
             },
         });
 
-        console.log("[SYNC API] Device found:", device ? `Yes (${device.id})` : "No");
-
         if (!device) {
             return NextResponse.json(
                 { error: "Invalid device token" },
@@ -71,46 +124,70 @@ export async function POST(request: Request) {
             );
         }
 
-        // Check if user is active
-        if (device.user && !device.user.isActive) {
-            console.warn(`[SYNC API] Blocked sync for device ${device.id} (User Inactive)`);
-            return NextResponse.json(
-                { error: "Account suspended" },
-                { status: 403 }
-            );
-        }
-
-        // Update device status and last seen
-        await prisma.device.update({
-            where: { id: device.id },
-            data: {
-                status: "online",
-                lastSeenAt: new Date(),
-            },
-        });
-
         // Helper to format a playlist
         const protocol = request.headers.get("x-forwarded-proto") || "http";
         const host = request.headers.get("host") || "localhost:3000";
         const baseUrl = `${protocol}://${host}`;
 
+        // Resolve each media item once: the rendition that suits this
+        // device, or the original. The sha256 lets players verify media they
+        // fetch from each other instead of from us.
+        const playlists = [
+            device.activePlaylist,
+            device.defaultPlaylist,
+            ...(device.schedule?.items.map((item) => item.playlist) ?? []),
+        ];
+        const sources = new Map<string, MediaSource>();
+        for (const playlist of playlists) {
+            for (const item of playlist?.items ?? []) {
+                const media = item.mediaItem;
+                if (sources.has(media.id)) continue;
+                const downloadUrl = `${baseUrl}/api/media/download/${media.id}?token=${device_token}`;
+                const rendition = pickRendition(media, media.renditions, capabilities);
+                if (rendition) {
+                    sources.set(media.id, {
+                        filename: path.basename(rendition.filename || `file-${media.id}`),
+                        url: rendition.url?.startsWith("http")
+                            ? rendition.url
+                            : `${downloadUrl}&rendition=${encodeURIComponent(rendition.profile)}`,
+                        size: rendition.size,
+                        sha256: rendition.sha256,
+                    });
+                    continue;
+                }
+                const local = !media.url.startsWith("http");
+                sources.set(media.id, {
+                    filename: media.filename || `file-${media.id}`,
+                    url: local ? downloadUrl : media.url,
+                    size: media.size,
+                    // Hashed once by scripts/media-worker.js, never per request
+                    sha256: media.sha256,
+                });
+            }
+        }
+
         const formatPlaylist = (playlist: any) => {
             if (!playlist) return null;
             return {
                 id: playlist.id,
                 name: playlist.name,
-                items: playlist.items.map((item: any) => ({
-                    id: item.id,
-                    type: item.mediaItem.type,
-                    filename: item.mediaItem.filename || `file-${item.mediaItem.id}`,
-                    url: item.mediaItem.url.startsWith("http")
-                        ? item.mediaItem.url
-                        : `${baseUrl}/api/media/download/${item.mediaItem.id}?token=${device_token}`,
-                    order: item.order,
-                    ...(item.mediaItem.type === "image" && {
-                        duration: item.mediaItem.duration || 10,
-                    }),
-                })),
+                items: playlist.items.map((item: any) => {
+                    const source = sources.get(item.mediaItem.id)!;
+                    return {
+                        id: item.id,
+                        media_id: item.mediaItem.id,
+                        type: item.mediaItem.type,
+                        filename: source.filename,
+                        url: source.url,
+                        order: item.order,
+                        // Lets the player pre-check disk space and detect truncated downloads
+                        size: source.size,
+                        ...(source.sha256 && { sha256: source.sha256 }),
+                        ...(item.mediaItem.type === "image" && {
+                            duration: item.mediaItem.duration || 10,
+                        }),
+                    };
+                }),
             };
         };
 
@@ -118,6 +195,7 @@ export async function POST(request: Request) {
         const responsePayload = {
             device_id: device.id,
             device_name: device.name,
+            version,
             // Legacy field (deprecated but useful for fallback)
             playlist: formatPlaylist(device.activePlaylist || device.defaultPlaylist),
 
@@ -136,7 +214,7 @@ export async function POST(request: Request) {
             default_playlist: formatPlaylist(device.defaultPlaylist)
         };
 
-        return NextResponse.json(responsePayload);
+        return NextResponse.json(responsePayload, { headers: { ETag: etag } });
     } catch (error) {
         console.error("Sync API error:", error);
         return NextResponse.json(
@@ -145,3 +223,32 @@ export async function POST(request: Request) {
         );
     }
 }
+
+const readyRenditions = {
+    renditions: {
+        where: { status: "ready" },
+        select: { profile: true, url: true, filename: true, size: true, sha256: true },
+    },
+};
+
+type MediaSource = {
+    filename: string;
+    url: string;
+    size: number;
+    sha256: string | null;
+};
+
+type PlaybackSummary = {
+    from: number;
+    to: number;
+    plays: number;
+    media: Prisma.InputJsonObject;
+    device?: Prisma.InputJsonObject;
+};
+
+function isPlaybackSummary(stats: unknown): stats is PlaybackSummary {
+    if (!stats || typeof stats !== "object") return false;
+    const s = stats as Record<string, unknown>;
+    return typeof s.from === "number" && typeof s.to === "number" &&
+        typeof s.plays === "number" && !!s.media && typeof s.media === "object";
+}
@@ -1,11 +1,32 @@
 import { NextResponse } from "next/server";
 import { prisma } from "@/lib/prisma";
+import { uploadsDir } from "@/lib/uploads";
+import { TtlCache } from "@/lib/ttl-cache";
 import fs from "fs";
 import path from "path";
+import { Readable } from "stream";
 
-export async function GET(
+const contentTypeMap: { [key: string]: string } = {
+    ".mp4": "video/mp4",
+    ".webm": "video/webm",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+};
+
+type CachedDevice = { userId: string | null };
+type CachedMedia = { url: string; filename: string | null; sha256: string | null };
+
+// Resumed and parallel downloads hit this route repeatedly with the same
+// token; re-check ownership at most every 30 seconds
+const deviceCache = new TtlCache<CachedDevice>(30_000);
+const mediaCache = new TtlCache<CachedMedia>(30_000);
+
+async function serve(
     request: Request,
-    context: { params: Promise<{ id: string }> } // Force rebuild
+    context: { params: Promise<{ id: string }> },
+    includeBody: boolean
 ) {
     try {
         const { id } = await context.params;
@@ -13,6 +34,8 @@ export async function GET(
         // Get token from query params
         const url = new URL(request.url);
         const token = url.searchParams.get("token");
+        // Device-profile rendition chosen by the sync API (optional)
+        const rendition = url.searchParams.get("rendition");
 
         if (!token) {
             return NextResponse.json(
@@ -22,9 +45,12 @@ export async function GET(
         }
 
         // Verify device token
-        const device = await prisma.device.findUnique({
-            where: { token: token },
-        });
+        const device = await deviceCache.getOrLoad(token, () =>
+            prisma.device.findUnique({
+                where: { token: token },
+                select: { userId: true },
+            })
+        );
 
         if (!device) {
             return NextResponse.json(
@@ -39,14 +65,23 @@ export async function GET(
                 { status: 403 }
             );
         }
+        const userId = device.userId;
 
         // Find media item and verify it belongs to the same user as the device
-        const mediaItem = await prisma.mediaItem.findFirst({
-            where: {
-                id: id,
-                userId: device.userId,
-            },
-        });
+        const mediaItem = await mediaCache.getOrLoad(`${userId}:${id}:${rendition ?? ""}`, () =>
+            rendition
+                ? prisma.mediaRendition.findFirst({
+                    where: { profile: rendition, status: "ready", mediaItem: { id: id, userId: userId } },
+                    select: { url: true, filename: true, sha256: true },
+                }).then((r) => (r?.url ? { url: r.url, filename: r.filename, sha256: r.sha256 } : null))
+                : prisma.mediaItem.findFirst({
+                    where: {
+                        id: id,
+                        userId: userId,
+                    },
+                    select: { url: true, filename: true, sha256: true },
+                })
+        );
 
         if (!mediaItem) {
             return NextResponse.json(
@@ -67,41 +102,58 @@ export async function GET(
             );
         }
 
-        // Get file path
-        const uploadsDir = path.join(process.cwd(), "public", "uploads");
-        const filePath = path.join(uploadsDir, mediaItem.filename);
-
-        // Check if file exists
-        if (!fs.existsSync(filePath)) {
+        const filePath = path.join(uploadsDir, path.basename(mediaItem.filename));
+        let stat: fs.Stats;
+        try {
+            stat = await fs.promises.stat(filePath);
+        } catch {
             return NextResponse.json(
                 { error: "File not found throughout server" },
                 { status: 404 }
             );
         }
 
-        // Read file
-        const fileBuffer = fs.readFileSync(filePath);
-
-        // Determine content type
+        // Recorded by the media worker; until then only Last-Modified validates
+        const etag = mediaItem.sha256 ? `"${mediaItem.sha256}"` : null;
+        const lastModified = new Date(Math.floor(stat.mtimeMs / 1000) * 1000);
         const ext = path.extname(mediaItem.filename).toLowerCase();
-        const contentTypeMap: { [key: string]: string } = {
-            ".mp4": "video/mp4",
-            ".webm": "video/webm",
-            ".jpg": "image/jpeg",
-            ".jpeg": "image/jpeg",
-            ".png": "image/png",
-            ".gif": "image/gif",
+
+        const headers: Record<string, string> = {
+            "Content-Type": contentTypeMap[ext] || "application/octet-stream",
+            "Content-Disposition": `attachment; filename="${mediaItem.filename}"`,
+            "Accept-Ranges": "bytes",
+            "Last-Modified": lastModified.toUTCString(),
+            // URLs carry the device token: never store in shared caches
+            "Cache-Control": "private, max-age=3600, must-revalidate",
         };
-        const contentType = contentTypeMap[ext] || "application/octet-stream";
-
-        // Return file
-        return new NextResponse(fileBuffer, {
-            headers: {
-                "Content-Type": contentType,
-                "Content-Disposition": `attachment; filename="${mediaItem.filename}"`,
-                "Content-Length": fileBuffer.length.toString(),
-            },
-        });
+        if (etag) headers["ETag"] = etag;
+
+        if (isNotModified(request, etag, lastModified)) {
+            return new NextResponse(null, { status: 304, headers });
+        }
+
+        // Byte ranges are honoured only if the client's copy is still current
+        const range = rangeApplies(request, etag, lastModified)
+            ? parseRange(request.headers.get("range"), stat.size)
+            : null;
+
+        if (range === "unsatisfiable") {
+            return new NextResponse(null, {
+                status: 416,
+                headers: { ...headers, "Content-Range": `bytes */${stat.size}` },
+            });
+        }
+
+        const start = range ? range.start : 0;
+        const end = range ? range.end : stat.size - 1;
+        headers["Content-Length"] = String(stat.size === 0 ? 0 : end - start + 1);
+        if (range) headers["Content-Range"] = `bytes ${start}-${end}/${stat.size}`;
+
+        const body = includeBody && stat.size > 0
+            ? (Readable.toWeb(fs.createReadStream(filePath, { start, end })) as ReadableStream)
+            : null;
+
+        return new NextResponse(body, { status: range ? 206 : 200, headers });
     } catch (error) {
         console.error("Media download error:", error);
         return NextResponse.json(
@@ -110,3 +162,69 @@ export async function GET(
         );
     }
 }
+
+function isNotModified(request: Request, etag: string | null, lastModified: Date): boolean {
+    const ifNoneMatch = request.headers.get("if-none-match");
+    if (ifNoneMatch) {
+        if (!etag) return false;
+        return ifNoneMatch.split(",").some((tag) => {
+            const value = tag.trim().replace(/^W\//, "");
+            return value === "*" || value === etag;
+        });
+    }
+    const ifModifiedSince = request.headers.get("if-modified-since");
+    if (ifModifiedSince) {
+        const since = Date.parse(ifModifiedSince);
+        return !isNaN(since) && lastModified.getTime() <= since;
+    }
+    return false;
+}
+
+function rangeApplies(request: Request, etag: string | null, lastModified: Date): boolean {
+    const ifRange = request.headers.get("if-range");
+    if (!ifRange) return true;
+    if (ifRange.startsWith('"') || ifRange.startsWith("W/")) {
+        // Strong comparison only
+        return etag !== null && ifRange === etag;
+    }
+    const date = Date.parse(ifRange);
+    return !isNaN(date) && lastModified.getTime() <= date;
+}
+
+// Single ranges only ("bytes=a-b", "bytes=a-", "bytes=-n"); anything else
+// is served as a full response, as RFC 9110 allows
+function parseRange(
+    header: string | null,
+    size: number
+): { start: number; end: number } | "unsatisfiable" | null {
+    const match = header?.match(/^bytes=(\d*)-(\d*)$/);
+    if (!match || (match[1] === "" && match[2] === "")) return null;
+
+    let start: number;
+    let end: number;
+    if (match[1] === "") {
+        const suffix = parseInt(match[2], 10);
+        if (suffix === 0) return "unsatisfiable";
+        start = Math.max(0, size - suffix);
+        end = size - 1;
+    } else {
+        start = parseInt(match[1], 10);
+        end = match[2] === "" ? size - 1 : Math.min(parseInt(match[2], 10), size - 1);
+    }
+    if (start >= size || start > end) return "unsatisfiable";
+    return { start, end };
+}
+
+export async function GET(
+    request: Request,
+    context: { params: Promise<{ id: string }> } // Force rebuild
+) {
+    return serve(request, context, true);
+}
+
+export async function HEAD(
+    request: Request,
+    context: { params: Promise<{ id: string }> }
+) {
+    return serve(request, context, false);
+}
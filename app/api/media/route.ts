@@ -2,6 +2,7 @@ import { NextResponse } from "next/server";
 import { getServerSession } from "next-auth";
 import { authOptions } from "@/lib/auth";
 import { prisma } from "@/lib/prisma";
+import { profilesFor } from "@/lib/renditions";
 import { unlink } from "fs/promises";
 import { join } from "path";
 
@@ -52,6 +53,7 @@ export async function DELETE(request: Request) {
                 id: id,
                 userId: session.user.id, // Ensure ownership
             },
+            include: { renditions: { select: { filename: true, url: true } } },
         });
 
         if (!mediaItem) {
@@ -74,6 +76,12 @@ export async function DELETE(request: Request) {
             // Continue, as DB record is gone
         }
 
+        // Locally stored renditions (their rows cascade with the item)
+        for (const rendition of mediaItem.renditions) {
+            if (!rendition.filename || rendition.url?.startsWith("http")) continue;
+            await unlink(join(process.cwd(), "public", "uploads", rendition.filename)).catch(() => {});
+        }
+
         return NextResponse.json({ success: true });
     } catch (error) {
         console.error("Delete error:", error);
@@ -113,6 +121,10 @@ export async function POST(request: Request) {
                 fps: fps ? parseFloat(fps) : null,
                 size: size ? parseInt(size) : 0,
                 userId: session.user.id,
+                // Queue device-profile renditions for scripts/media-worker.js
+                renditions: {
+                    create: profilesFor(type).map((profile) => ({ profile })),
+                },
             },
         });
 
@@ -72,13 +72,12 @@ export async function PUT(
 
         // Transaction to update
         await prisma.$transaction(async (tx: any) => {
-            // 1. Update details
-            if (name) {
-                await tx.playlist.update({
-                    where: { id: playlistId },
-                    data: { name },
-                });
-            }
+            // 1. Update details (always touch updatedAt: devices use it to
+            // detect content changes during sync)
+            await tx.playlist.update({
+                where: { id: playlistId },
+                data: name ? { name, updatedAt: new Date() } : { updatedAt: new Date() },
+            });
 
             // 2. Update items (Replace all)
             if (items && Array.isArray(items)) {
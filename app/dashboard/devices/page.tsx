@@ -43,7 +43,7 @@ export default async function DevicesPage() {
         if (d.lastSeenAt) {
             const lastSeenTime = new Date(d.lastSeenAt).getTime();
             const now = Date.now();
-            const thresholdInMs = 2 * 60 * 1000; // 2 minutes (Player pings every 60s)
+            const thresholdInMs = 2 * 60 * 1000; // 2 minutes (Player syncs every 60s or holds /api/device/events open)
 
             // Device is online if it checked in within the threshold
             if (now - lastSeenTime < thresholdInMs) {
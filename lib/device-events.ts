@@ -0,0 +1,178 @@
+import { prisma } from "@/lib/prisma";
+import { computeSyncVersion, syncVersionSelect } from "@/lib/device-sync";
+
+// Change notifications for devices holding /api/device/events open.
+//
+// One watcher per server process looks for playlists, schedules and
+// devices whose updatedAt moved since its last tick and wakes only the
+// affected waiters. Its cost is a handful of indexed queries per tick no
+// matter how many devices are connected, and it also sees edits made by
+// other processes (other app instances, scripts/media-worker.js).
+//
+// The watcher only pays off on a long-lived server (`next start`, a
+// container) where all long-polls share it. On serverless hosts such as
+// Vercel every held request may run on its own instance with its own
+// watcher, which costs far more queries than plain polling. The channel is
+// therefore opt-in: set DEVICE_PUSH=1 only on long-lived deployments.
+
+export const pushEnabled = () => process.env.DEVICE_PUSH === "1";
+
+const TICK_MS = 2000;
+// Rows committed slightly out of order are still caught by this overlap
+const OVERLAP_MS = 1000;
+// A device that reconnects within this window reuses its cached state, so
+// the long-poll cycle costs no queries
+const GRACE_MS = 15_000;
+// Connected devices count as seen; written in one batch at this interval
+const PRESENCE_MS = 30_000;
+
+export type DeviceState = { version: string; paired: boolean };
+
+type Watched = {
+    state: DeviceState | null;
+    waiters: Set<() => void>;
+    leftAt: number | null;
+};
+
+const watched = new Map<string, Watched>();
+let cursor = new Date();
+let lastPresence = 0;
+let timer: NodeJS.Timeout | null = null;
+let ticking = false;
+
+async function loadState(deviceId: string): Promise<DeviceState | null> {
+    const head = await prisma.device.findUnique({
+        where: { id: deviceId },
+        select: { ...syncVersionSelect, userId: true },
+    });
+    if (!head) return null;
+    // Capabilities are left out: the device re-syncs and gets its ETag then
+    return head.userId
+        ? { version: computeSyncVersion(head), paired: true }
+        : { version: "unpaired", paired: false };
+}
+
+function subscribe(deviceId: string): Watched {
+    let entry = watched.get(deviceId);
+    if (!entry) {
+        entry = { state: null, waiters: new Set(), leftAt: null };
+        watched.set(deviceId, entry);
+    }
+    entry.leftAt = null;
+    if (!timer) {
+        cursor = new Date();
+        timer = setInterval(() => void tick(), TICK_MS);
+    }
+    return entry;
+}
+
+function wakeAll(entry: Watched) {
+    for (const wake of [...entry.waiters]) wake();
+}
+
+async function tick() {
+    if (ticking) return;
+    ticking = true;
+    try {
+        const now = Date.now();
+        for (const [id, entry] of watched) {
+            if (!entry.waiters.size && entry.leftAt !== null && now - entry.leftAt > GRACE_MS) {
+                watched.delete(id);
+            }
+        }
+        if (!watched.size) {
+            clearInterval(timer!);
+            timer = null;
+            return;
+        }
+
+        const since = new Date(cursor.getTime() - OVERLAP_MS);
+        cursor = new Date(now);
+        const ids = [...watched.keys()];
+
+        const [playlists, schedules] = await Promise.all([
+            prisma.playlist.findMany({ where: { updatedAt: { gt: since } }, select: { id: true } }),
+            prisma.schedule.findMany({ where: { updatedAt: { gt: since } }, select: { id: true } }),
+        ]);
+        const playlistIds = playlists.map((p) => p.id);
+        const scheduleIds = schedules.map((s) => s.id);
+
+        const changedIf: object[] = [{ updatedAt: { gt: since } }];
+        if (playlistIds.length) {
+            changedIf.push(
+                { activePlaylistId: { in: playlistIds } },
+                { defaultPlaylistId: { in: playlistIds } },
+                { schedule: { items: { some: { playlistId: { in: playlistIds } } } } }
+            );
+        }
+        if (scheduleIds.length) changedIf.push({ scheduleId: { in: scheduleIds } });
+
+        const changed = await prisma.device.findMany({
+            where: { id: { in: ids }, OR: changedIf },
+            select: { id: true },
+        });
+        await Promise.all(
+            changed.map(async ({ id }) => {
+                const entry = watched.get(id);
+                if (!entry) return;
+                entry.state = await loadState(id);
+                wakeAll(entry);
+            })
+        );
+
+        if (now - lastPresence >= PRESENCE_MS) {
+            lastPresence = now;
+            const present = [...watched.entries()]
+                .filter(([, entry]) => entry.waiters.size && entry.state?.paired)
+                .map(([id]) => id);
+            if (present.length) {
+                // Raw SQL so updatedAt stays put and the next tick does not
+                // treat every connected device as changed
+                await prisma.$executeRaw`
+                    UPDATE "Device" SET "lastSeenAt" = NOW(), "status" = 'online'
+                    WHERE "id" = ANY(${present})`;
+            }
+        }
+    } catch (error) {
+        console.error("[EVENTS] Watcher tick failed:", error);
+    } finally {
+        ticking = false;
+    }
+}
+
+// Resolves with the device's state once it differs from `since`, or with
+// the unchanged state when `timeoutMs` passes or the client disconnects.
+// Null means the device no longer exists.
+export async function waitForChange(
+    deviceId: string,
+    since: string | null,
+    timeoutMs: number,
+    signal: AbortSignal
+): Promise<DeviceState | null> {
+    const entry = subscribe(deviceId);
+    // Stable waiter for the watcher; each wait below points it at its resolver
+    let notify = () => {};
+    const waiter = () => notify();
+    entry.waiters.add(waiter);
+    signal.addEventListener("abort", waiter);
+    try {
+        if (!entry.state) entry.state = await loadState(deviceId);
+        const deadline = Date.now() + timeoutMs;
+        while (entry.state && entry.state.version === since && !signal.aborted) {
+            const remaining = deadline - Date.now();
+            if (remaining <= 0) break;
+            await new Promise<void>((resolve) => {
+                const timeout = setTimeout(resolve, remaining);
+                notify = () => {
+                    clearTimeout(timeout);
+                    resolve();
+                };
+            });
+        }
+        return entry.state;
+    } finally {
+        signal.removeEventListener("abort", waiter);
+        entry.waiters.delete(waiter);
+        if (!entry.waiters.size) entry.leftAt = Date.now();
+    }
+}
@@ -0,0 +1,64 @@
+import crypto from "crypto";
+
+// Minimal selection that changes whenever the resolved sync payload would.
+// Playlist and schedule edits bump their updatedAt, so this avoids loading
+// items and media just to find out nothing changed.
+export const syncVersionSelect = {
+    id: true,
+    name: true,
+    user: {
+        select: { isActive: true }
+    },
+    activePlaylistId: true,
+    defaultPlaylistId: true,
+    scheduleId: true,
+    activePlaylist: { select: { updatedAt: true } },
+    defaultPlaylist: { select: { updatedAt: true } },
+    schedule: {
+        select: {
+            updatedAt: true,
+            items: {
+                select: { playlistId: true, playlist: { select: { updatedAt: true } } },
+                orderBy: { id: "asc" as const },
+            }
+        }
+    },
+};
+
+type VersionHead = {
+    name: string | null;
+    activePlaylistId: string | null;
+    defaultPlaylistId: string | null;
+    scheduleId: string | null;
+    activePlaylist: { updatedAt: Date } | null;
+    defaultPlaylist: { updatedAt: Date } | null;
+    schedule: {
+        updatedAt: Date;
+        items: { playlistId: string; playlist: { updatedAt: Date } }[];
+    } | null;
+};
+
+// `variant` distinguishes payloads that differ per device for the same
+// assignments, such as the media renditions chosen for its capabilities
+export function computeSyncVersion(head: VersionHead, variant = ""): string {
+    const parts = [
+        variant,
+        head.name,
+        head.activePlaylistId,
+        head.activePlaylist?.updatedAt.getTime(),
+        head.defaultPlaylistId,
+        head.defaultPlaylist?.updatedAt.getTime(),
+        head.scheduleId,
+        head.schedule?.updatedAt.getTime(),
+        ...(head.schedule?.items ?? []).map(
+            (item) => `${item.playlistId}@${item.playlist.updatedAt.getTime()}`
+        ),
+    ];
+    return crypto.createHash("sha1").update(JSON.stringify(parts)).digest("hex").slice(0, 20);
+}
+
+// ETags are quoted; clients may send either form
+export function parseVersion(value: string | null | undefined): string | null {
+    if (!value) return null;
+    return value.replace(/^W\//, "").replace(/"/g, "").trim() || null;
+}
@@ -0,0 +1,96 @@
+import profiles from "@/lib/media-profiles.json";
+
+// What a player reports about itself in the sync request
+export type DeviceCapabilities = {
+    display?: { width?: number; height?: number };
+    hwdec_codecs?: string[];
+    max_video_height?: number;
+    max_fps?: number;
+};
+
+type SourceMedia = {
+    type: string;
+    width: number | null;
+    height: number | null;
+    fps: number | null;
+    codec: string | null;
+};
+
+type ReadyRendition = {
+    profile: string;
+    url: string | null;
+    filename: string | null;
+    size: number;
+    sha256: string | null;
+};
+
+// Devices that report nothing are treated like a Pi on a 1080p screen
+const DEFAULTS = {
+    display: { width: 1920, height: 1080 },
+    hwdec_codecs: ["h264"],
+    max_video_height: 1080,
+    max_fps: 30,
+};
+
+function resolve(caps: DeviceCapabilities | null | undefined) {
+    return {
+        width: caps?.display?.width || DEFAULTS.display.width,
+        height: caps?.display?.height || DEFAULTS.display.height,
+        codecs: caps?.hwdec_codecs?.length ? caps.hwdec_codecs : DEFAULTS.hwdec_codecs,
+        maxVideoHeight: caps?.max_video_height || DEFAULTS.max_video_height,
+        maxFps: caps?.max_fps || DEFAULTS.max_fps,
+    };
+}
+
+// Short stable key for the capabilities that influence rendition choice.
+// It is folded into the sync version so a device whose capabilities change
+// gets a fresh payload instead of a 304.
+export function capabilityKey(caps: DeviceCapabilities | null | undefined): string {
+    const c = resolve(caps);
+    return [c.width, c.height, [...c.codecs].sort().join("+"), c.maxVideoHeight, c.maxFps].join(":");
+}
+
+// The ready rendition a device should play instead of the original, or
+// null when the original suits it (or nothing better has been made yet)
+export function pickRendition(
+    media: SourceMedia,
+    renditions: ReadyRendition[],
+    caps: DeviceCapabilities | null | undefined
+): ReadyRendition | null {
+    if (!renditions.length || !media.width || !media.height) return null;
+    const c = resolve(caps);
+    const ready = new Map(renditions.map((r) => [r.profile, r]));
+
+    if (media.type === "video") {
+        const decodable =
+            !!media.codec && c.codecs.includes(media.codec) &&
+            Math.min(media.width, media.height) <= c.maxVideoHeight &&
+            (media.fps ?? 0) <= c.maxFps;
+        if (decodable) return null;
+        return profiles.video.map((p) => ready.get(p.name)).find((r) => r) ?? null;
+    }
+
+    if (media.type === "image") {
+        // Smallest rendition that still covers the screen. Profiles are
+        // landscape boxes applied in the image's own orientation, so compare
+        // long and short edges.
+        const screenLong = Math.max(c.width, c.height);
+        const screenShort = Math.min(c.width, c.height);
+        const long = Math.max(media.width, media.height);
+        const short = Math.min(media.width, media.height);
+        const covering = profiles.image
+            .filter((p) => p.maxWidth >= screenLong && p.maxHeight >= screenShort)
+            .filter((p) => long > p.maxWidth || short > p.maxHeight)
+            .sort((a, b) => a.maxWidth * a.maxHeight - b.maxWidth * b.maxHeight);
+        return covering.map((p) => ready.get(p.name)).find((r) => r) ?? null;
+    }
+
+    return null;
+}
+
+// Profiles to queue for a new upload
+export function profilesFor(type: string): string[] {
+    if (type === "video") return profiles.video.map((p) => p.name);
+    if (type === "image") return profiles.image.map((p) => p.name);
+    return [];
+}
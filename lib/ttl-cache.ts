@@ -0,0 +1,39 @@
+// Small in-process cache whose entries expire after a fixed time.
+// Used to skip repeated database lookups on hot device endpoints.
+export class TtlCache<V> {
+    private entries = new Map<string, { value: V; expiresAt: number }>();
+
+    constructor(private ttlMs: number, private maxEntries = 5000) {}
+
+    get(key: string): V | undefined {
+        const entry = this.entries.get(key);
+        if (!entry) return undefined;
+        if (entry.expiresAt <= Date.now()) {
+            this.entries.delete(key);
+            return undefined;
+        }
+        return entry.value;
+    }
+
+    set(key: string, value: V) {
+        if (this.entries.size >= this.maxEntries) {
+            // Maps iterate in insertion order: drop the oldest entry
+            const oldest = this.entries.keys().next().value;
+            if (oldest !== undefined) this.entries.delete(oldest);
+        }
+        this.entries.set(key, { value, expiresAt: Date.now() + this.ttlMs });
+    }
+
+    async getOrLoad(key: string, load: () => Promise<V | null>): Promise<V | null> {
+        const cached = this.get(key);
+        if (cached !== undefined) return cached;
+        const value = await load();
+        // Misses are not cached, so newly paired devices work immediately
+        if (value !== null) this.set(key, value);
+        return value;
+    }
+
+    delete(key: string) {
+        this.entries.delete(key);
+    }
+}
@@ -0,0 +1,5 @@
+import path from "path";
+
+// Local uploads. Their SHA-256 is computed once by scripts/media-worker.js
+// and stored on MediaItem.sha256; request handlers only read that column.
+export const uploadsDir = path.join(process.cwd(), "public", "uploads");
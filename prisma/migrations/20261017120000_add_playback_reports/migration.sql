@@ -0,0 +1,14 @@
+-- CreateTable
+CREATE TABLE "PlaybackReport" (
+    "id" TEXT NOT NULL PRIMARY KEY,
+    "deviceId" TEXT NOT NULL,
+    "periodStart" TIMESTAMP(3) NOT NULL,
+    "periodEnd" TIMESTAMP(3) NOT NULL,
+    "plays" INTEGER NOT NULL DEFAULT 0,
+    "summary" JSONB NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT "PlaybackReport_deviceId_fkey" FOREIGN KEY ("deviceId") REFERENCES "Device" ("id") ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+-- CreateIndex
+CREATE INDEX "PlaybackReport_deviceId_periodEnd_idx" ON "PlaybackReport"("deviceId", "periodEnd");
@@ -0,0 +1,28 @@
+-- AlterTable
+ALTER TABLE "MediaItem" ADD COLUMN "codec" TEXT;
+
+-- CreateTable
+CREATE TABLE "MediaRendition" (
+    "id" TEXT NOT NULL PRIMARY KEY,
+    "mediaItemId" TEXT NOT NULL,
+    "profile" TEXT NOT NULL,
+    "status" TEXT NOT NULL DEFAULT 'pending',
+    "url" TEXT,
+    "filename" TEXT,
+    "width" INTEGER,
+    "height" INTEGER,
+    "fps" DOUBLE PRECISION,
+    "size" INTEGER NOT NULL DEFAULT 0,
+    "sha256" TEXT,
+    "attempts" INTEGER NOT NULL DEFAULT 0,
+    "error" TEXT,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "updatedAt" TIMESTAMP(3) NOT NULL,
+    CONSTRAINT "MediaRendition_mediaItemId_fkey" FOREIGN KEY ("mediaItemId") REFERENCES "MediaItem" ("id") ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+-- CreateIndex
+CREATE UNIQUE INDEX "MediaRendition_mediaItemId_profile_key" ON "MediaRendition"("mediaItemId", "profile");
+
+-- CreateIndex
+CREATE INDEX "MediaRendition_status_idx" ON "MediaRendition"("status");
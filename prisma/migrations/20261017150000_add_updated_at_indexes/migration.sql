@@ -0,0 +1,5 @@
+-- CreateIndex
+CREATE INDEX "Schedule_updatedAt_idx" ON "Schedule"("updatedAt");
+
+-- CreateIndex
+CREATE INDEX "Playlist_updatedAt_idx" ON "Playlist"("updatedAt");
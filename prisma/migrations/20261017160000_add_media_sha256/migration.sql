@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE "MediaItem" ADD COLUMN "sha256" TEXT;
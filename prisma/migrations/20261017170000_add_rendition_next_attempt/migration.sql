@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE "MediaRendition" ADD COLUMN "nextAttemptAt" TIMESTAMP(3);
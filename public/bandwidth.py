@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Bandwidth Module
+Rate limits and off-hours windows for media downloads on shared uplinks
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from downloader import DownloadDeferred
+from scheduler import MINUTES_PER_DAY, parse_hhmm
+
+# Smallest bucket: one read of the downloader goes through without waiting
+MIN_BURST = 64 * 1024
+
+# How a prefetch (content for a later schedule slot) is fetched
+BULK = "bulk"        # now, under the bulk rate (window open, or trickling)
+URGENT = "urgent"    # now, at the full rate: needed before bulk could finish
+WAIT = "wait"        # at the next download window
+
+
+def kbps(value) -> float:
+    """Config rate in kbit/s -> bytes per second (0 = unlimited)"""
+    return max(0.0, float(value or 0)) * 1000 / 8
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by all download workers.
+
+    Holds up to one second of traffic. A consumer may take more than is
+    available; it then sleeps until the debt is repaid, so concurrent
+    workers together stay at the rate.
+    """
+
+    def __init__(self, rate: float = 0.0):
+        self.rate = rate
+        self._tokens = 0.0
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes: int, rate: Optional[float] = None):
+        rate = rate or self.rate
+        if not rate:
+            return
+        burst = max(rate, MIN_BURST)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(burst, self._tokens + (now - self._stamp) * rate) - nbytes
+            self._stamp = now
+            wait = -self._tokens / rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+def parse_windows(specs: List[str]) -> List[Tuple[int, int]]:
+    """['22:00-06:00'] -> [(start, end)] in minutes since midnight"""
+    windows = []
+    for spec in specs or []:
+        try:
+            start, end = (parse_hhmm(part) for part in spec.split("-"))
+        except ValueError:
+            print(f"[DOWNLOAD] Ignoring malformed download window {spec!r}")
+            continue
+        windows.append((start % MINUTES_PER_DAY, end % MINUTES_PER_DAY))
+    return windows
+
+
+class BandwidthPolicy:
+    """Decides how fast, and when, media may be downloaded.
+
+    ``download_rate_kbps`` caps all downloads from the server (0 = no cap).
+    Content for later schedule slots is bulk traffic: inside one of the
+    ``download_windows`` (e.g. ``["22:00-06:00"]``) it runs at the full
+    rate; outside them it trickles at ``bulk_rate_kbps``, or waits for the
+    next window when that is 0 (the default once windows are configured).
+    Without windows, bulk traffic is only held to ``bulk_rate_kbps`` if set.
+    """
+
+    def __init__(self, config: Dict):
+        self.windows = parse_windows(config.get("download_windows", []))
+        self.bucket = TokenBucket(kbps(config.get("download_rate_kbps", 0)))
+        self.bulk_bucket = TokenBucket(kbps(config.get("bulk_rate_kbps", 0)))
+
+    @property
+    def limited(self) -> bool:
+        return bool(self.windows or self.bucket.rate or self.bulk_bucket.rate)
+
+    def in_window(self, now: Optional[datetime] = None) -> bool:
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end in self.windows:
+            if start <= minute < end if start < end else (minute >= start or minute < end):
+                return True
+        return False
+
+    def next_window(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Start of the next download window after ``now``"""
+        if not self.windows:
+            return None
+        now = now or datetime.now()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        starts = []
+        for start, _ in self.windows:
+            moment = midnight + timedelta(minutes=start)
+            starts.append(moment if moment > now else moment + timedelta(days=1))
+        return min(starts)
+
+    def bulk_rate(self, now: Optional[datetime] = None) -> Optional[float]:
+        """Byte rate allowed for bulk traffic now: None for the full rate,
+        0 while it has to wait for a window"""
+        if self.windows and self.in_window(now):
+            return None
+        if self.bulk_bucket.rate:
+            return self.bulk_bucket.rate
+        return 0.0 if self.windows else None
+
+    def full_rate(self) -> Optional[float]:
+        return self.bucket.rate or None
+
+    def plan(self, nbytes: int, needed_at: datetime, now: Optional[datetime] = None) -> str:
+        """BULK, URGENT or WAIT for ``nbytes`` of content needed at ``needed_at``"""
+        now = now or datetime.now()
+        rate = self.bulk_rate(now)
+        if rate is None:
+            return BULK
+        window = self.next_window(now)
+        if rate:
+            # Trickle, unless that would not finish in time even with the
+            # window's help
+            done_at = now + timedelta(seconds=nbytes / rate)
+            if done_at <= needed_at or (window and window < needed_at):
+                return BULK
+            return URGENT
+        if window and window < needed_at:
+            return WAIT
+        return URGENT
+
+    def eta(self, nbytes: int, mode: str, now: Optional[datetime] = None) -> Optional[float]:
+        """Seconds until ``nbytes`` fetched in ``mode`` are done; None when
+        no rate limit makes that predictable"""
+        now = now or datetime.now()
+        rates = [self.full_rate()]
+        wait = 0.0
+        if mode == WAIT:
+            wait = (self.next_window(now) - now).total_seconds()
+        elif mode == BULK:
+            rates.append(self.bulk_rate(now))
+        rate = min(filter(None, rates), default=None)
+        if not rate:
+            return wait or None
+        return wait + nbytes / rate
+
+    def throttle(self, bulk: bool = False,
+                 cancelled: Optional[Callable[[], bool]] = None) -> Callable[[int], None]:
+        """Throttle for DownloadEngine. Bulk transfers also stop once
+        ``cancelled()`` is true (urgent work arrived) or a window closes
+        with no trickle rate."""
+        def consume(nbytes: int):
+            if bulk:
+                if cancelled and cancelled():
+                    raise DownloadDeferred("making way for content needed now")
+                rate = self.bulk_rate()
+                if rate == 0:
+                    raise DownloadDeferred("outside the download window")
+                if rate:
+                    self.bulk_bucket.consume(nbytes, rate)
+            self.bucket.consume(nbytes)
+        return consume
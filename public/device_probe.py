@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Device Probe Module
+Detects hardware capabilities and derives the mpv launch profile from them
+"""
+
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import time
+from typing import Dict, List, Optional, Tuple
+
+PROBE_VERSION = 1
+# Re-probe at least this often even if nothing obvious changed
+PROBE_MAX_AGE = 7 * 24 * 3600
+# A hardware decoder this fast is preferred over faster software decoding
+HWDEC_PREFERRED_FPS = 72
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path, 'r', errors='replace') as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def _run(cmd: List[str], timeout: float = 5) -> str:
+    try:
+        return subprocess.run(cmd, capture_output=True, text=True, timeout=timeout).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def meminfo_mb() -> Dict[str, int]:
+    info = {}
+    for line in _read("/proc/meminfo").splitlines():
+        key, _, value = line.partition(":")
+        if value.strip():
+            info[key] = int(value.split()[0]) // 1024
+    return info
+
+
+def cpu_info() -> Dict:
+    text = _read("/proc/cpuinfo")
+    model = ""
+    for key in ("Model", "model name", "Hardware"):
+        match = re.search(rf"^{key}\s*:\s*(.+)$", text, re.MULTILINE)
+        if match:
+            model = match.group(1).strip()
+            break
+    return {
+        "model": model,
+        "cores": os.cpu_count() or 1,
+        "arch": platform.machine(),
+        "board": _read("/proc/device-tree/model").strip("\0\n "),
+    }
+
+
+def gpu_drivers() -> List[str]:
+    """Kernel DRM drivers in use (vc4, v3d, i915, amdgpu, ...)"""
+    drivers = set()
+    base = "/sys/class/drm"
+    try:
+        cards = [c for c in os.listdir(base) if re.fullmatch(r"card\d+", c)]
+    except OSError:
+        return []
+    for card in cards:
+        link = os.path.join(base, card, "device", "driver")
+        if os.path.islink(link):
+            drivers.add(os.path.basename(os.readlink(link)))
+    return sorted(drivers)
+
+
+def hwdec_backends() -> Dict[str, List[str]]:
+    """Hardware decoders mpv offers, as codec -> [hwdec names]"""
+    # Lines look like "  vaapi (h264-vaapi)" or "  v4l2m2m-copy (h264-v4l2m2m-copy)"
+    output = _run(["mpv", "--no-config", "--hwdec=help"])
+    codecs: Dict[str, List[str]] = {}
+    for name, codec in re.findall(r"^\s+(\S+)\s+\(([a-z0-9]+)-", output, re.MULTILINE):
+        codecs.setdefault(codec, [])
+        if name not in codecs[codec]:
+            codecs[codec].append(name)
+    return codecs
+
+
+def display_mode() -> Dict:
+    """Active resolution and refresh rate (X11 first, then DRM connectors)"""
+    output = _run(["xrandr", "--current"]) if os.environ.get("DISPLAY") else ""
+    for line in output.splitlines():
+        # "   1920x1080     60.00*+  50.00"
+        match = re.match(r"^\s+(\d+)x(\d+)\S*\s+.*?(\d+\.\d+)\*", line)
+        if match:
+            return {"width": int(match.group(1)), "height": int(match.group(2)),
+                    "refresh": float(match.group(3)), "source": "xrandr"}
+
+    base = "/sys/class/drm"
+    try:
+        connectors = sorted(os.listdir(base))
+    except OSError:
+        connectors = []
+    for connector in connectors:
+        path = os.path.join(base, connector)
+        if _read(os.path.join(path, "status")).strip() != "connected":
+            continue
+        modes = _read(os.path.join(path, "modes")).split()
+        if modes:
+            width, height = modes[0].split("x")[:2]
+            return {"width": int(width), "height": int(re.sub(r"\D.*", "", height)),
+                    "refresh": None, "source": "drm"}
+    return {"width": None, "height": None, "refresh": None, "source": None}
+
+
+def fingerprint() -> str:
+    """Cheap identity of the hardware/software combination the probe describes"""
+    mpv = shutil.which("mpv") or ""
+    try:
+        mpv_stamp = str(int(os.stat(mpv).st_mtime)) if mpv else ""
+    except OSError:
+        mpv_stamp = ""
+    parts = [platform.release(), _read("/proc/device-tree/model").strip("\0\n "), mpv_stamp,
+             str(os.cpu_count()), os.environ.get("DISPLAY", "")]
+    return "|".join(parts)
+
+
+def probe() -> Dict:
+    mem = meminfo_mb()
+    return {
+        "ram_mb": mem.get("MemTotal", 0),
+        "mem_available_mb": mem.get("MemAvailable", 0),
+        "cpu": cpu_info(),
+        "gpu_drivers": gpu_drivers(),
+        "hwdec": hwdec_backends(),
+        "display": display_mode(),
+    }
+
+
+def load_probe(cache_path: str, refresh: bool = False) -> Dict:
+    """Probe results, from the on-disk cache unless stale or ``refresh``"""
+    current = fingerprint()
+    if not refresh:
+        try:
+            with open(cache_path, 'r') as f:
+                cached = json.load(f)
+            if (cached.get("version") == PROBE_VERSION and cached.get("fingerprint") == current
+                    and time.time() - cached.get("probed_at", 0) < PROBE_MAX_AGE):
+                return cached
+        except (OSError, ValueError):
+            cached = {}
+    else:
+        cached = {}
+
+    started = time.monotonic()
+    result = {"version": PROBE_VERSION, "fingerprint": current,
+              "probed_at": time.time(), "probe": probe()}
+    if cached.get("benchmark") and cached.get("fingerprint") == current:
+        # Same hardware: the measured hwdec choice still holds
+        result["benchmark"] = cached["benchmark"]
+    print(f"[PROBE] Hardware probed in {time.monotonic() - started:.2f}s")
+    save_probe(cache_path, result)
+    return result
+
+
+def save_probe(cache_path: str, result: Dict):
+    tmp = cache_path + ".tmp"
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(result, f, indent=2)
+        os.replace(tmp, cache_path)
+    except OSError as e:
+        print(f"[PROBE] Could not cache probe: {e}")
+
+
+def hwdec_mode(info: Dict, benchmark: Optional[Dict] = None) -> str:
+    """The hwdec value to launch with: a benchmark winner, else auto-safe"""
+    if benchmark and benchmark.get("best"):
+        return benchmark["best"]
+    return "auto-safe" if info.get("hwdec") else "no"
+
+
+def select_profile(result: Dict) -> Dict[str, str]:
+    """mpv options tuned to the probed device"""
+    info = result["probe"]
+    ram = info.get("ram_mb") or 1024
+    # Free memory changes between boots; read it fresh rather than cached
+    available = meminfo_mb().get("MemAvailable") or ram // 2
+    cores = info["cpu"].get("cores", 1)
+    refresh = info["display"].get("refresh")
+
+    # Demuxer cache: an eighth of free memory, within sane bounds
+    demuxer = max(16, min(150, available // 8))
+    return {
+        "hwdec": hwdec_mode(info, result.get("benchmark")),
+        "cache": "yes" if ram >= 768 else "no",
+        "demuxer-max-bytes": f"{demuxer}M",
+        "demuxer-max-back-bytes": f"{max(8, demuxer // 3)}M",
+        "prefetch-playlist": "yes" if ram >= 768 else "no",
+        # Resampling to the display clock is smooth but costs CPU
+        "video-sync": "display-resample" if refresh and cores >= 4 and ram >= 2048 else "audio",
+    }
+
+
+def decodable_codecs(info: Dict) -> List[str]:
+    """Codecs this device plays smoothly at 1080p.
+
+    mpv lists every hwaccel it was built with, not what the hardware
+    supports, so that list is narrowed by what we know of the platform.
+    """
+    board = info["cpu"].get("board", "")
+    if "Raspberry Pi" in board:
+        return ["h264", "hevc"] if re.search(r"Pi (4|5|400)|Compute Module (4|5)", board) else ["h264"]
+    if set(info.get("gpu_drivers") or []) & {"i915", "xe", "amdgpu", "radeon", "nouveau"}:
+        return sorted(set(info.get("hwdec") or {}) & {"h264", "hevc"}) or ["h264"]
+    return ["h264"]
+
+
+def capabilities(result: Dict) -> Dict:
+    """What the server needs to choose media renditions for this device"""
+    info = result["probe"]
+    display = info["display"]
+    codecs = decodable_codecs(info)
+    ram = info.get("ram_mb") or 0
+    big_screen = (display.get("height") or 0) >= 2160 or (display.get("width") or 0) >= 3840
+    return {
+        "display": {"width": display.get("width"), "height": display.get("height")},
+        "hwdec_codecs": codecs,
+        "max_video_height": 2160 if big_screen and "hevc" in codecs and ram >= 2048 else 1080,
+        "max_fps": 60 if info.get("hwdec") and info["cpu"].get("cores", 1) >= 4 and ram >= 2048 else 30,
+        "ram_mb": ram,
+        "board": info["cpu"].get("board") or info["cpu"].get("model"),
+    }
+
+
+def _decode(clip: str, mode: str, frames: int, *options: str) -> Tuple[Optional[float], str]:
+    """Wall time of an ``mpv --untimed --vo=null`` run (None if it failed) and its output"""
+    started = time.monotonic()
+    try:
+        proc = subprocess.run(
+            ["mpv", "--no-config", "--untimed", "--vo=null", "--no-audio",
+             f"--frames={frames}", f"--hwdec={mode}", *options, clip],
+            capture_output=True, text=True, timeout=300)
+    except (OSError, subprocess.SubprocessError):
+        return None, ""
+    elapsed = time.monotonic() - started
+    return (elapsed if proc.returncode == 0 else None), proc.stdout + proc.stderr
+
+
+def clip_frames(clip: str) -> Optional[int]:
+    """Frame count of a clip from its duration and frame rate, None if unknown"""
+    _, output = _decode(clip, "no", 1, "--term-playing-msg=FRAMES ${=duration} ${=container-fps}")
+    match = re.search(r"FRAMES ([\d.]+) ([\d.]+)", output)
+    return int(float(match.group(1)) * float(match.group(2))) if match else None
+
+
+def benchmark(clips: List[str], frames: int = 500) -> Dict:
+    """Decode fps of each clip under each candidate hwdec mode.
+
+    Uses ``mpv --untimed --vo=null`` so the numbers reflect decoding only,
+    not the display's refresh rate. mpv's startup is measured with a
+    one-frame run and subtracted, and clips shorter than ``frames`` are
+    skipped, since mpv would stop early and the rate would be inflated.
+    """
+    usable = []
+    for clip in clips:
+        count = clip_frames(clip)
+        if count is None or count < frames:
+            print(f"[PROBE] Skipping {os.path.basename(clip)}: "
+                  f"{'unknown length' if count is None else f'{count} frames'}, need {frames}")
+        else:
+            usable.append(clip)
+    clips = usable
+
+    modes = ["no"] + sorted({name for names in hwdec_backends().values() for name in names})
+    results: Dict[str, Dict[str, Optional[float]]] = {}
+    for mode in modes:
+        results[mode] = {}
+        for clip in clips:
+            startup, _ = _decode(clip, mode, 1)
+            elapsed, _ = _decode(clip, mode, frames)
+            decoding = elapsed - startup if elapsed and startup is not None else 0
+            results[mode][clip] = round((frames - 1) / decoding, 1) if decoding > 0 else None
+            print(f"[PROBE] {mode:>20}  {os.path.basename(clip)}: "
+                  f"{results[mode][clip] if results[mode][clip] else 'failed'} fps")
+
+    def score(mode: str) -> float:
+        values = list(results[mode].values())
+        # A mode must play every clip; rank by its slowest one
+        return min(values) if values and all(values) else 0.0
+
+    # Hardware decoding leaves the CPU free, so it wins whenever it is
+    # comfortably faster than real time even if software decodes faster
+    hardware = [m for m in modes if m != "no" and score(m) >= HWDEC_PREFERRED_FPS]
+    best = max(hardware or modes, key=score)
+    return {"frames": frames, "clips": clips, "results": results,
+            "best": best if score(best) else None, "measured_at": time.time()}
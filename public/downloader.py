@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Download Module
+Parallel, resumable media downloads over a shared HTTP connection pool
+"""
+
+import errno
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+# Small reads: a connection dropped mid-read loses what that read buffered,
+# and the resume starts from what reached the .part file
+READ_CHUNK = 64 * 1024
+WRITE_BUFFER = 1024 * 1024
+PART_SUFFIX = ".part"
+# Sidecar holding the ETag of the content a .part file was started from
+VALIDATOR_SUFFIX = ".etag"
+
+
+class VerificationError(IOError):
+    """A completed download was rejected by the on_complete hook"""
+
+
+class DownloadDeferred(Exception):
+    """Raised by a throttle to stop a transfer for now; its partial data is
+    kept and resumed by a later attempt"""
+
+
+class DownloadProgress:
+    """Thread-safe per-file and aggregate progress tracking"""
+
+    def __init__(self, report_interval: float = 2.0):
+        self.files: Dict[str, List[int]] = {}  # filename -> [done, total]
+        self.report_interval = report_interval
+        self.started_at = time.time()
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    def start(self, filename: str, done: int, total: int):
+        with self._lock:
+            self.files[filename] = [done, total]
+
+    def advance(self, filename: str, nbytes: int):
+        with self._lock:
+            self.files[filename][0] += nbytes
+            now = time.time()
+            if now - self._last_report < self.report_interval:
+                return
+            self._last_report = now
+            line = self._format(filename)
+        print(line)
+
+    def snapshot(self) -> Dict:
+        """Aggregate totals for all files seen so far"""
+        with self._lock:
+            done = sum(f[0] for f in self.files.values())
+            total = sum(f[1] for f in self.files.values())
+        elapsed = max(time.time() - self.started_at, 0.001)
+        return {"done": done, "total": total, "rate": done / elapsed}
+
+    def _format(self, filename: str) -> str:
+        done, total = self.files[filename]
+        all_done = sum(f[0] for f in self.files.values())
+        all_total = sum(f[1] for f in self.files.values())
+        elapsed = max(time.time() - self.started_at, 0.001)
+        rate = all_done / elapsed
+        eta = f", ETA {format_duration((all_total - all_done) / rate)}" if rate and all_total > all_done else ""
+        return (
+            f"[DOWNLOAD] {filename} {_percent(done, total)} "
+            f"({done / 1e6:.1f}/{total / 1e6:.1f} MB) | "
+            f"total {_percent(all_done, all_total)} @ {rate / 1e6:.2f} MB/s{eta}"
+        )
+
+
+def _percent(done: int, total: int) -> str:
+    if total <= 0:
+        return "?%"
+    return f"{min(100, done * 100 // total)}%"
+
+
+def format_duration(seconds: float) -> str:
+    """1h05m, 12m, 40s"""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m"
+    return f"{seconds}s"
+
+
+class DownloadEngine:
+    """Downloads media into dest_dir using a bounded worker pool.
+
+    Partial data is kept in ``<name>.part`` and resumed with an HTTP Range
+    request on the next attempt, guarded by ``If-Range`` with the ETag the
+    transfer started from so a changed file is never spliced onto old data.
+    The SHA-256 of the content is computed while streaming. Completed files
+    are fsynced and either renamed into place or handed to
+    ``on_complete(item, part_path, sha256)``, which takes ownership of the
+    file and returns False to reject it.
+
+    ``mirrors(item)`` may return alternative URLs (LAN peers) that are each
+    tried once before the origin ``item['url']``.
+
+    A ``throttle(nbytes)`` passed to ``download``/``download_all`` is called
+    after every read from the origin (LAN peers are not throttled). It may
+    sleep to limit the rate, or raise ``DownloadDeferred`` to stop the
+    transfer and keep the partial data for later.
+    """
+
+    def __init__(self, dest_dir: str, max_workers: int = 3, timeout: int = 30,
+                 retries: int = 3,
+                 path_for: Optional[Callable[[Dict], str]] = None,
+                 on_complete: Optional[Callable[[Dict, str, str], bool]] = None,
+                 on_progress: Optional[Callable[[Dict], None]] = None,
+                 mirrors: Optional[Callable[[Dict], List[str]]] = None):
+        self.dest_dir = dest_dir
+        self.path_for = path_for
+        self.on_complete = on_complete
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.retries = retries
+        self.on_progress = on_progress
+        self.mirrors = mirrors
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """Pooled HTTP session; requests is only imported once a download starts"""
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                self._session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.max_workers,
+                                      pool_maxsize=self.max_workers)
+                self._session.mount("http://", adapter)
+                self._session.mount("https://", adapter)
+            return self._session
+
+    def download_all(self, items: List[Dict],
+                     throttle: Optional[Callable[[int], None]] = None) -> Dict[str, bool]:
+        """Download every item concurrently. Returns filename -> success."""
+        pending = list(items)
+        results = {i['filename']: True for i in pending}
+        if not pending:
+            return results
+
+        progress = DownloadProgress()
+        print(f"[DOWNLOAD] Fetching {len(pending)} file(s) with {self.max_workers} worker(s)")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.download, item, progress, throttle): item for item in pending}
+            for future, item in futures.items():
+                results[item['filename']] = future.result()
+
+        summary = progress.snapshot()
+        print(f"[DOWNLOAD] Done: {summary['done'] / 1e6:.1f} MB at {summary['rate'] / 1e6:.2f} MB/s")
+        if self.on_progress:
+            self.on_progress(summary)
+        return results
+
+    def target_path(self, item: Dict) -> str:
+        if self.path_for:
+            return self.path_for(item)
+        return os.path.join(self.dest_dir, item['filename'])
+
+    def download(self, item: Dict, progress: Optional[DownloadProgress] = None,
+                 throttle: Optional[Callable[[int], None]] = None) -> bool:
+        """Download a single item, resuming and retrying on failure"""
+        import requests
+        import urllib3
+        # Reading the raw stream raises urllib3's own errors (ProtocolError on
+        # a dropped connection, ReadTimeoutError) rather than requests' ones
+        network_errors = (requests.exceptions.RequestException, urllib3.exceptions.HTTPError)
+        filename = item['filename']
+        progress = progress or DownloadProgress()
+
+        for url in self.mirrors(item) if self.mirrors else []:
+            try:
+                if self._fetch(item, progress, url, timeout=(2, 10)):
+                    print(f"[DOWNLOAD] ✓ {filename} downloaded from peer {url.split('/')[2]}")
+                    return True
+            except OSError as e:
+                if e.errno in (errno.ENOSPC, errno.EDQUOT):
+                    print(f"[DOWNLOAD] ✗ Disk full while downloading {filename}")
+                    self._discard_part(self.target_path(item) + PART_SUFFIX)
+                    return False
+                # Includes VerificationError: the peer's copy was rejected
+            except network_errors:
+                pass
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = min(2 ** attempt, 30)
+                print(f"[DOWNLOAD] Retrying {filename} in {delay}s (attempt {attempt + 1})")
+                time.sleep(delay)
+            try:
+                if throttle:
+                    throttle(0)  # May defer before a connection is opened
+                if self._fetch(item, progress, throttle=throttle):
+                    print(f"[DOWNLOAD] ✓ {filename} downloaded")
+                    return True
+                return False
+            except DownloadDeferred as e:
+                print(f"[DOWNLOAD] {filename} paused: {e}")
+                return False
+            except OSError as e:
+                if e.errno in (errno.ENOSPC, errno.EDQUOT):
+                    # Retrying cannot help; drop the partial data and let the
+                    # caller free space before the next sync
+                    print(f"[DOWNLOAD] ✗ Disk full while downloading {filename}")
+                    self._discard_part(self.target_path(item) + PART_SUFFIX)
+                    return False
+                print(f"[DOWNLOAD] ✗ Error downloading {filename}: {e}")
+            except network_errors as e:
+                # The .part file keeps what arrived; the next attempt resumes
+                print(f"[DOWNLOAD] ✗ Error downloading {filename}: {e}")
+
+        return False
+
+    def _fetch(self, item: Dict, progress: DownloadProgress,
+               url: Optional[str] = None, timeout=None,
+               throttle: Optional[Callable[[int], None]] = None) -> bool:
+        """Fetch one item. Returns False on a non-retryable HTTP error."""
+        filename = item['filename']
+        final_path = self.target_path(item)
+        part_path = final_path + PART_SUFFIX
+
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            validator = self._read_validator(part_path)
+            if validator:
+                headers["If-Range"] = validator
+        hasher = hashlib.sha256()
+
+        with self.session.get(url or item['url'], headers=headers, stream=True,
+                              timeout=timeout or self.timeout) as response:
+            if response.status_code == 416 and offset:
+                # Server has nothing past our offset: the part file is complete
+                self._hash_existing(part_path, hasher)
+                return self._complete(item, part_path, final_path, hasher)
+            if response.status_code == 200:
+                offset = 0  # Range ignored, start over
+            elif response.status_code != 206:
+                if not url:
+                    print(f"[DOWNLOAD] ✗ Failed to download {filename}: {response.status_code}")
+                return False
+
+            if offset:
+                self._hash_existing(part_path, hasher)
+            else:
+                self._write_validator(part_path, response.headers.get("ETag"))
+            length = int(response.headers.get("Content-Length") or 0)
+            progress.start(filename, offset, offset + length)
+
+            mode = 'ab' if offset else 'wb'
+            with open(part_path, mode, buffering=WRITE_BUFFER) as f:
+                try:
+                    self._copy(response, f, hasher, filename, progress, throttle)
+                finally:
+                    # Deferred transfers resume from what reached the disk
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        return self._complete(item, part_path, final_path, hasher)
+
+    def _complete(self, item: Dict, part_path: str, final_path: str, hasher) -> bool:
+        self._discard(part_path + VALIDATOR_SUFFIX)
+        if not self.on_complete:
+            os.replace(part_path, final_path)
+            return True
+        if not self.on_complete(item, part_path, hasher.hexdigest()):
+            raise VerificationError(f"{item['filename']} failed verification")
+        return True
+
+    def _hash_existing(self, path: str, hasher):
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(WRITE_BUFFER), b""):
+                hasher.update(block)
+
+    def _discard(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _discard_part(self, part_path: str):
+        self._discard(part_path)
+        self._discard(part_path + VALIDATOR_SUFFIX)
+
+    def _read_validator(self, part_path: str) -> Optional[str]:
+        try:
+            with open(part_path + VALIDATOR_SUFFIX, 'r') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _write_validator(self, part_path: str, etag: Optional[str]):
+        # Weak ETags are not allowed in If-Range
+        if not etag or etag.startswith("W/"):
+            self._discard(part_path + VALIDATOR_SUFFIX)
+            return
+        with open(part_path + VALIDATOR_SUFFIX, 'w') as f:
+            f.write(etag)
+
+    def _copy(self, response, f, hasher, filename: str, progress: DownloadProgress,
+              throttle: Optional[Callable[[int], None]] = None):
+        """Stream the body to f as it arrives, READ_CHUNK at a time"""
+        for data in response.iter_content(chunk_size=READ_CHUNK):
+            f.write(data)
+            hasher.update(data)
+            progress.advance(filename, len(data))
+            if throttle:
+                throttle(len(data))
@@ -28,6 +28,21 @@ echo "[3/5] Downloading player software..."
 # Always download the latest optimized player from the public URL
 wget -q "$BASE_URL/player.py" -O "$INSTALL_DIR/player.py"
 wget -q "$BASE_URL/sync.py" -O "$INSTALL_DIR/sync.py"
+wget -q "$BASE_URL/downloader.py" -O "$INSTALL_DIR/downloader.py"
+wget -q "$BASE_URL/media_cache.py" -O "$INSTALL_DIR/media_cache.py"
+wget -q "$BASE_URL/peers.py" -O "$INSTALL_DIR/peers.py"
+wget -q "$BASE_URL/scheduler.py" -O "$INSTALL_DIR/scheduler.py"
+wget -q "$BASE_URL/playlist.py" -O "$INSTALL_DIR/playlist.py"
+wget -q "$BASE_URL/mpv_ipc.py" -O "$INSTALL_DIR/mpv_ipc.py"
+wget -q "$BASE_URL/mpv_watchdog.py" -O "$INSTALL_DIR/mpv_watchdog.py"
+wget -q "$BASE_URL/telemetry.py" -O "$INSTALL_DIR/telemetry.py"
+wget -q "$BASE_URL/metrics.py" -O "$INSTALL_DIR/metrics.py"
+wget -q "$BASE_URL/device_probe.py" -O "$INSTALL_DIR/device_probe.py"
+wget -q "$BASE_URL/timeline.py" -O "$INSTALL_DIR/timeline.py"
+wget -q "$BASE_URL/screen_sync.py" -O "$INSTALL_DIR/screen_sync.py"
+wget -q "$BASE_URL/bandwidth.py" -O "$INSTALL_DIR/bandwidth.py"
+wget -q "$BASE_URL/state_store.py" -O "$INSTALL_DIR/state_store.py"
+wget -q "$BASE_URL/pairing_screen.py" -O "$INSTALL_DIR/pairing_screen.py"
 
 # Download Service Script Logic (Embedded here to handle service creation)
 SERVICE_FILE="/etc/systemd/system/signage-player.service"
@@ -55,7 +70,7 @@ echo "[5/5] Installing auto-start service..."
 sudo bash -c "cat > $SERVICE_FILE" <<EOL
 [Unit]
 Description=Digital Signage Player
-After=network-online.target
+# Not ordered after network-online: cached content plays while the network comes up
 Wants=network-online.target
 
 [Service]
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Media Cache Module
+Content-addressed media store with integrity checks and LRU eviction
+"""
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from state_store import StateStore
+
+# Index file of earlier releases; imported into the state store once
+INDEX_FILE = "index.json"
+STAGING_DIR = ".incoming"
+# Files in media_dir that the cache must never treat as strays
+RESERVED_NAMES = {INDEX_FILE, STAGING_DIR}
+HASH_BLOCK = 1024 * 1024
+
+
+def item_key(item: Dict) -> str:
+    """Stable cache key for a playlist item"""
+    return item.get('media_id') or item['filename']
+
+
+def hash_file(path: str) -> str:
+    """Streaming SHA-256 of a file"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def is_disk_full(error: BaseException) -> bool:
+    return isinstance(error, OSError) and error.errno in (errno.ENOSPC, errno.EDQUOT)
+
+
+class MediaCache:
+    """Manages media_dir as a store of ``<sha256><ext>`` blobs.
+
+    The index (kept in the state store under ``media_index``, or in
+    ``index.json`` without one) maps each asset key (server media id) to
+    the blob that holds its content, plus the size the server advertised,
+    the last time it was played and the playlists that currently reference
+    it. Blobs that no playlist references are evicted least-recently-played
+    first whenever the byte budget or free disk space runs short.
+
+    If the index is lost, blobs stay on disk under their hash and are
+    re-adopted (see ``adopt``) instead of downloaded again. Files left by
+    releases that stored media by name are moved into the store by
+    ``migrate_legacy``.
+    """
+
+    def __init__(self, media_dir: str, budget_bytes: int = 0,
+                 reserve_bytes: int = 200 * 1024 * 1024,
+                 store: Optional[StateStore] = None):
+        self.media_dir = media_dir
+        self.store = store
+        self.staging_dir = os.path.join(media_dir, STAGING_DIR)
+        self.index_path = os.path.join(media_dir, INDEX_FILE)
+        self.budget_bytes = budget_bytes  # 0 = limited only by free space
+        self.reserve_bytes = reserve_bytes
+        self.assets: Dict[str, Dict] = {}
+        self._lock = threading.RLock()
+
+        os.makedirs(self.staging_dir, exist_ok=True)
+        self._load()
+
+    # -- index persistence ------------------------------------------------
+
+    def _load(self):
+        if self.store:
+            self.store.import_json("media_index", self.index_path, field="assets")
+            self.assets = self.store.get("media_index") or {}
+        else:
+            try:
+                with open(self.index_path, 'r') as f:
+                    self.assets = json.load(f).get("assets", {})
+            except FileNotFoundError:
+                self.assets = {}
+            except (json.JSONDecodeError, AttributeError) as e:
+                print(f"[CACHE] Index unreadable ({e}), rebuilding")
+                self.assets = {}
+
+        # Drop entries whose blob vanished or was truncated behind our back
+        for key, asset in list(self.assets.items()):
+            path = self._blob_path(asset)
+            if not os.path.exists(path) or os.path.getsize(path) != asset['size']:
+                print(f"[CACHE] Dropping invalid entry {key}")
+                del self.assets[key]
+
+    def save(self):
+        """Write the index atomically"""
+        with self._lock:
+            try:
+                if self.store:
+                    self.store.put("media_index", self.assets)
+                    return
+                tmp = self.index_path + ".tmp"
+                with open(tmp, 'w') as f:
+                    json.dump({"version": 1, "assets": self.assets}, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.index_path)
+            except (OSError, sqlite3.Error) as e:
+                # A full disk must never take down playback
+                print(f"[CACHE] Could not save index: {e}")
+
+    # -- lookups ----------------------------------------------------------
+
+    def _blob_path(self, asset: Dict) -> str:
+        return os.path.join(self.media_dir, asset['hash'] + asset.get('ext', ''))
+
+    def _blob_names(self) -> Set[str]:
+        with self._lock:
+            return {a['hash'] + a.get('ext', '') for a in self.assets.values()}
+
+    def path_for(self, item: Dict) -> Optional[str]:
+        """Local path for an item, or None if it is not cached"""
+        asset = self.assets.get(item_key(item))
+        if not asset:
+            return None
+        return self._blob_path(asset)
+
+    def blob_for_hash(self, digest: str) -> Optional[str]:
+        """Path of the stored blob with this SHA-256, if we have one"""
+        with self._lock:
+            for asset in self.assets.values():
+                if asset['hash'] == digest:
+                    return self._blob_path(asset)
+        return None
+
+    def length_for(self, item: Dict) -> Optional[float]:
+        """Play length of a cached video as measured by mpv, if known"""
+        asset = self.assets.get(item_key(item))
+        return asset.get('length') if asset else None
+
+    def set_length(self, item: Dict, seconds: float):
+        with self._lock:
+            asset = self.assets.get(item_key(item))
+            if asset:
+                asset['length'] = round(seconds, 3)
+
+    def needs_fetch(self, item: Dict) -> bool:
+        """True if the item is missing or the server copy has changed"""
+        asset = self.assets.get(item_key(item))
+        if not asset:
+            return True
+        expected = item.get('size') or 0
+        if expected and expected != asset.get('source_size', asset['size']):
+            return True
+        if item.get('sha256') and item['sha256'] != asset['hash']:
+            return True
+        if item.get('url') and asset.get('url') and item['url'].split('?')[0] != asset['url']:
+            return True
+        return not os.path.exists(self._blob_path(asset))
+
+    def adopt(self, item: Dict) -> bool:
+        """Index a blob that is already on disk for ``item``, e.g. after the
+        index was lost. Only items with a server checksum qualify, and the
+        blob is verified before it is trusted."""
+        digest = item.get('sha256')
+        if not digest:
+            return False
+        ext = os.path.splitext(item['filename'])[1].lower()
+        blob = os.path.join(self.media_dir, digest + ext)
+        expected = item.get('size') or 0
+        try:
+            if expected and os.path.getsize(blob) != expected:
+                return False
+            if hash_file(blob) != digest:
+                return False
+        except OSError:
+            return False
+        self._record(item, digest, os.path.getsize(blob))
+        print(f"[CACHE] Re-adopted {item['filename']} from disk")
+        return True
+
+    def migrate_legacy(self, item: Dict) -> bool:
+        """Move the file an earlier release stored for ``item`` under its
+        filename into the store. Like a download, it is admitted only if it
+        matches the size or checksum the server advertises; what is not
+        migrated is left for ``purge_strays``."""
+        if not (item.get('size') or item.get('sha256')):
+            return False
+        name = os.path.basename(item['filename'])
+        if name in RESERVED_NAMES or name in self._blob_names():
+            return False
+        path = os.path.join(self.media_dir, name)
+        if not os.path.isfile(path):
+            return False
+        try:
+            blob = self.admit(item, path)
+        except OSError as e:
+            print(f"[CACHE] Could not migrate {name}: {e}")
+            return False
+        if blob:
+            print(f"[CACHE] Migrated {name} into the store")
+        return blob is not None
+
+    def staging_path(self, item: Dict) -> str:
+        return os.path.join(self.staging_dir, item_key(item))
+
+    # -- admission --------------------------------------------------------
+
+    def admit(self, item: Dict, path: str, digest: Optional[str] = None) -> Optional[str]:
+        """Verify a finished download and move it into the store.
+
+        ``digest`` is the SHA-256 computed while streaming; it is recomputed
+        from disk when not supplied. Returns the blob path, or None if the
+        file failed verification (in which case it is deleted).
+        """
+        size = os.path.getsize(path)
+        expected_size = item.get('size') or 0
+        if expected_size and size != expected_size:
+            print(f"[CACHE] ✗ {item['filename']}: size {size} != expected {expected_size}")
+            os.remove(path)
+            return None
+
+        digest = digest or hash_file(path)
+        expected_hash = item.get('sha256')
+        if expected_hash and digest != expected_hash:
+            print(f"[CACHE] ✗ {item['filename']}: checksum mismatch")
+            os.remove(path)
+            return None
+
+        ext = os.path.splitext(item['filename'])[1].lower()
+        blob = os.path.join(self.media_dir, digest + ext)
+        if os.path.exists(blob):
+            os.remove(path)  # Same content already stored under another key
+        else:
+            os.replace(path, blob)
+        self._record(item, digest, size)
+        return blob
+
+    def _record(self, item: Dict, digest: str, size: int):
+        """Index the stored blob ``digest`` as the content of ``item``"""
+        expected_size = item.get('size') or 0
+        asset = {
+            "hash": digest,
+            "ext": os.path.splitext(item['filename'])[1].lower(),
+            "size": size,
+            "source_size": expected_size or size,
+            "url": item.get('url', '').split('?')[0],
+            "filename": item['filename'],
+            "last_played": 0,
+            "playlists": [],
+        }
+        with self._lock:
+            previous = self.assets.get(item_key(item))
+            if previous:
+                asset['last_played'] = previous.get('last_played', 0)
+                asset['playlists'] = previous.get('playlists', [])
+                if previous['hash'] == digest and 'length' in previous:
+                    asset['length'] = previous['length']
+            self.assets[item_key(item)] = asset
+
+    # -- references and eviction ------------------------------------------
+
+    def set_references(self, playlists: Iterable[Dict]):
+        """Record which playlists reference which assets (replaces old refs)"""
+        refs: Dict[str, List[str]] = {}
+        for playlist in playlists:
+            for item in playlist.get('items', []):
+                refs.setdefault(item_key(item), []).append(playlist.get('id', ''))
+        with self._lock:
+            for key, asset in self.assets.items():
+                asset['playlists'] = sorted(set(refs.get(key, [])))
+
+    def touch(self, items: Iterable[Dict]):
+        """Mark items as just played"""
+        now = int(time.time())
+        with self._lock:
+            for item in items:
+                asset = self.assets.get(item_key(item))
+                if asset:
+                    asset['last_played'] = now
+
+    def used_bytes(self) -> int:
+        blobs = {a['hash'] + a.get('ext', ''): a['size'] for a in self.assets.values()}
+        return sum(blobs.values())
+
+    def _free_bytes(self) -> int:
+        return shutil.disk_usage(self.media_dir).free - self.reserve_bytes
+
+    def _room(self) -> int:
+        room = self._free_bytes()
+        if self.budget_bytes:
+            room = min(room, self.budget_bytes - self.used_bytes())
+        return room
+
+    def ensure_space(self, needed: int) -> bool:
+        """Evict unreferenced assets until ``needed`` bytes fit"""
+        with self._lock:
+            if self._room() >= needed:
+                return True
+            for key in self._eviction_order():
+                self._evict(key)
+                if self._room() >= needed:
+                    self.save()
+                    return True
+            self.save()
+            return self._room() >= needed
+
+    def enforce_budget(self):
+        """Evict unreferenced assets while over budget"""
+        self.ensure_space(0)
+
+    def _eviction_order(self) -> List[str]:
+        candidates = [k for k, a in self.assets.items() if not a['playlists']]
+        return sorted(candidates, key=lambda k: self.assets[k].get('last_played', 0))
+
+    def _evict(self, key: str):
+        asset = self.assets.pop(key)
+        shared = any(a['hash'] == asset['hash'] for a in self.assets.values())
+        if not shared:
+            try:
+                os.remove(self._blob_path(asset))
+            except FileNotFoundError:
+                pass
+        print(f"[CACHE] Evicted {asset.get('filename', key)} ({asset['size'] / 1e6:.1f} MB)")
+
+    def purge_strays(self):
+        """Remove files that are neither indexed blobs nor reserved"""
+        known = self._blob_names()
+        for name in os.listdir(self.media_dir):
+            if name in known or name in RESERVED_NAMES or name.endswith(".tmp"):
+                continue
+            try:
+                os.remove(os.path.join(self.media_dir, name))
+                print(f"[CACHE] Removed stray file {name}")
+            except OSError:
+                pass
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Metrics Module
+Proof-of-play records and device performance counters in a fixed-size ring
+"""
+
+import os
+import struct
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+
+MAGIC = b"SPM1"
+# magic, capacity, next slot, records written, uploaded-until timestamp
+HEADER = struct.Struct("<4sIIQd")
+# start, end, media id, expected s, actual s, dropped frames, decoder
+# dropped frames, hwdec (0/1), cpu temp (deci-C), throttled flags, mem MB
+RECORD = struct.Struct("<dd32sffIIBhII")
+FIELDS = ("start", "end", "media_id", "expected", "actual", "dropped",
+          "decoder_dropped", "hwdec", "cpu_temp", "throttled", "mem_used_mb")
+
+# Observer ids for our IPC subscriptions (the watchdog uses low ids)
+OBSERVED_PROPERTIES = {
+    101: "path",
+    102: "duration",
+    103: "hwdec-current",
+    104: "frame-drop-count",
+    105: "decoder-frame-drop-count",
+}
+
+
+class PlayRing:
+    """Fixed-size on-disk ring of play records.
+
+    The file never grows: slot ``n % capacity`` is overwritten in place
+    with a single pwrite, followed by the header, so SD card wear stays
+    flat and a torn write can cost at most one record.
+    """
+
+    def __init__(self, path: str, capacity: int = 4096):
+        self.path = path
+        self._lock = threading.Lock()
+        exists = os.path.exists(path)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        header = os.pread(self.fd, HEADER.size, 0) if exists else b""
+        if len(header) == HEADER.size and header[:4] == MAGIC:
+            _, self.capacity, self.next_slot, self.count, self.uploaded_until = HEADER.unpack(header)
+        else:
+            self.capacity, self.next_slot, self.count, self.uploaded_until = capacity, 0, 0, 0.0
+            os.ftruncate(self.fd, HEADER.size + capacity * RECORD.size)
+            self._write_header()
+
+    def _write_header(self):
+        os.pwrite(self.fd, HEADER.pack(MAGIC, self.capacity, self.next_slot,
+                                       self.count, self.uploaded_until), 0)
+
+    def append(self, record: Dict):
+        values = [record.get(f, 0) for f in FIELDS]
+        values[2] = (record.get("media_id") or "").encode()[:32]
+        data = RECORD.pack(*values)
+        with self._lock:
+            os.pwrite(self.fd, data, HEADER.size + self.next_slot * RECORD.size)
+            self.next_slot = (self.next_slot + 1) % self.capacity
+            self.count += 1
+            self._write_header()
+
+    def records(self, since: float = 0.0) -> List[Dict]:
+        """All stored records ending after ``since``, oldest first"""
+        with self._lock:
+            stored = min(self.count, self.capacity)
+            first = (self.next_slot - stored) % self.capacity
+            raw = os.pread(self.fd, self.capacity * RECORD.size, HEADER.size)
+        result = []
+        for i in range(stored):
+            slot = (first + i) % self.capacity
+            values = RECORD.unpack_from(raw, slot * RECORD.size)
+            record = dict(zip(FIELDS, values))
+            record["media_id"] = record["media_id"].rstrip(b"\0").decode(errors="replace")
+            if record["end"] > since:
+                result.append(record)
+        return result
+
+    def mark_uploaded(self, until: float):
+        with self._lock:
+            self.uploaded_until = until
+            self._write_header()
+
+
+def process_age() -> float:
+    """Seconds since this process was started, interpreter start-up included"""
+    try:
+        with open("/proc/self/stat", 'r') as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", 'r') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.process_time()
+
+
+def read_cpu_temp() -> Optional[float]:
+    try:
+        with open("/sys/class/thermal/thermal_zone0/temp") as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+
+def read_throttled() -> int:
+    """Raspberry Pi under-voltage/throttling flags (0 elsewhere)"""
+    try:
+        out = subprocess.run(["vcgencmd", "get_throttled"], capture_output=True,
+                             text=True, timeout=2).stdout
+        return int(out.strip().split("=")[1], 16)
+    except (OSError, IndexError, ValueError, subprocess.SubprocessError):
+        return 0
+
+
+def read_mem_used_mb() -> int:
+    info = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                info[key] = int(value.split()[0])
+    except (OSError, ValueError):
+        return 0
+    return (info.get("MemTotal", 0) - info.get("MemAvailable", 0)) // 1024
+
+
+def summarize(records: List[Dict]) -> Dict:
+    """Aggregate play records per media item plus device health"""
+    media: Dict[str, Dict] = {}
+    for r in records:
+        m = media.setdefault(r["media_id"] or "?", {
+            "plays": 0, "seconds": 0.0, "drift": 0.0, "dropped": 0, "sw_decode": 0,
+        })
+        m["plays"] += 1
+        m["seconds"] += r["actual"]
+        if r["expected"]:
+            m["drift"] += r["actual"] - r["expected"]
+        m["dropped"] += r["dropped"] + r["decoder_dropped"]
+        m["sw_decode"] += 0 if r["hwdec"] else 1
+    for m in media.values():
+        m["seconds"] = round(m["seconds"], 1)
+        m["drift"] = round(m["drift"] / m["plays"], 2)
+
+    temps = [r["cpu_temp"] / 10.0 for r in records if r["cpu_temp"]]
+    throttled = 0
+    for r in records:
+        throttled |= r["throttled"]
+    return {
+        "from": min((r["start"] for r in records), default=None),
+        "to": max((r["end"] for r in records), default=None),
+        "plays": len(records),
+        "media": media,
+        "device": {
+            "cpu_temp_max": max(temps, default=None),
+            "cpu_temp_avg": round(sum(temps) / len(temps), 1) if temps else None,
+            "throttled": throttled,
+            "mem_used_mb_max": max((r["mem_used_mb"] for r in records), default=0),
+        },
+    }
+
+
+class PlaybackMetrics:
+    """Builds a play record per item from mpv start-file/end-file events.
+
+    Event handling runs on the IPC reader thread and only touches memory
+    and the ring; system counters are refreshed by ``sample_system()``,
+    which the player calls periodically from a worker thread.
+    """
+
+    def __init__(self, ipc, ring: PlayRing, upload_interval: float = 300):
+        self.ipc = ipc
+        self.ring = ring
+        self.upload_interval = upload_interval
+        self._last_upload: Optional[float] = None
+        self.items: Dict[str, Dict] = {}  # local path -> playlist item
+        self.values: Dict = {}
+        self.started_at: Optional[float] = None
+        self.system = {"cpu_temp": 0, "throttled": 0, "mem_used_mb": 0}
+        self._lock = threading.Lock()
+        ipc.listeners.append(self._on_event)
+
+    def attach(self):
+        """Subscribe to per-file properties on a freshly connected mpv"""
+        with self._lock:
+            self.values = {}
+            self.started_at = None
+        for observer_id, name in OBSERVED_PROPERTIES.items():
+            self.ipc.observe_property(observer_id, name)
+
+    def detach(self):
+        """Record the item that was on screen when mpv is stopped"""
+        with self._lock:
+            self._finish()
+
+    def set_items(self, items: Dict[str, Dict]):
+        with self._lock:
+            self.items = dict(items)
+
+    def sample_system(self):
+        temp = read_cpu_temp()
+        self.system = {
+            "cpu_temp": int(temp * 10) if temp is not None else 0,
+            "throttled": read_throttled(),
+            "mem_used_mb": read_mem_used_mb(),
+        }
+
+    def _on_event(self, message: Dict):
+        event = message.get("event")
+        with self._lock:
+            if event == "property-change" and message.get("id") in OBSERVED_PROPERTIES:
+                self.values[message.get("name")] = message.get("data")
+            elif event == "start-file":
+                self._finish()
+                self.started_at = time.time()
+            elif event == "end-file":
+                self._finish()
+
+    def _finish(self):
+        if self.started_at is None:
+            return
+        start, self.started_at = self.started_at, None
+        end = time.time()
+        # end-file arrives before the next file's path change is reported
+        path = self.values.get("path") or ""
+        item = self.items.get(path, {})
+        expected = item.get("duration") or self.values.get("duration") or 0
+        record = {
+            "start": start,
+            "end": end,
+            "media_id": item.get("media_id") or os.path.basename(path),
+            "expected": float(expected),
+            "actual": end - start,
+            "dropped": int(self.values.get("frame-drop-count") or 0),
+            "decoder_dropped": int(self.values.get("decoder-frame-drop-count") or 0),
+            "hwdec": 0 if self.values.get("hwdec-current") in (None, "", "no") else 1,
+            **self.system,
+        }
+        try:
+            self.ring.append(record)
+        except OSError as e:
+            print(f"[METRICS] Failed to record play: {e}")
+
+    def pending_summary(self) -> Optional[Dict]:
+        """Summary of plays not yet uploaded, at most once per upload_interval"""
+        if self._last_upload is not None and time.monotonic() - self._last_upload < self.upload_interval:
+            return None
+        records = self.ring.records(since=self.ring.uploaded_until)
+        if not records:
+            return None
+        return summarize(records)
+
+    def mark_uploaded(self, summary: Dict):
+        self._last_upload = time.monotonic()
+        self.ring.mark_uploaded(summary["to"])
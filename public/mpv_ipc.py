@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - MPV IPC Module
+JSON IPC client used to control a running mpv instance in place
+"""
+
+import json
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# (file path, per-file options such as {"image-display-duration": "15"})
+Entry = Tuple[str, Dict[str, str]]
+
+
+class MpvIpcError(Exception):
+    """Raised when mpv rejects a command or the IPC connection is lost"""
+
+
+def format_options(options: Dict[str, str]) -> str:
+    return ",".join(f"{k}={v}" for k, v in sorted(options.items()))
+
+
+class MpvIpcClient:
+    """Client for mpv's ``--input-ipc-server`` unix socket.
+
+    A reader thread matches replies to requests by ``request_id`` and hands
+    asynchronous events (``start-file``, ``property-change``, ...) to the
+    registered listeners.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 2.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.sock: Optional[socket.socket] = None
+        self.listeners: List[Callable[[Dict], None]] = []
+        self._next_id = 1
+        self._pending: Dict[int, Dict] = {}
+        self._replies = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._reader: Optional[threading.Thread] = None
+        # Client-side mirror of the playlist we loaded, with its options
+        self._entries: List[Entry] = []
+
+    # -- connection -------------------------------------------------------
+
+    def connect(self, wait: float = 5.0) -> bool:
+        """Connect, waiting up to ``wait`` seconds for mpv to create the socket"""
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.socket_path)
+                break
+            except OSError:
+                sock.close()
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.05)
+
+        self.sock = sock
+        self._entries = []
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+        return True
+
+    @property
+    def connected(self) -> bool:
+        return self.sock is not None
+
+    def close(self):
+        sock, self.sock = self.sock, None
+        if sock:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        with self._replies:
+            self._replies.notify_all()
+
+    def _read_loop(self):
+        sock = self.sock
+        buffer = b""
+        try:
+            while sock is self.sock:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                buffer += data
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    if line.strip():
+                        self._dispatch(json.loads(line))
+        except (OSError, ValueError):
+            pass
+        if sock is self.sock:
+            self.close()
+
+    def _dispatch(self, message: Dict):
+        if "request_id" in message and "event" not in message:
+            with self._replies:
+                self._pending[message["request_id"]] = message
+                self._replies.notify_all()
+            return
+        for listener in list(self.listeners):
+            try:
+                listener(message)
+            except Exception as e:
+                print(f"[IPC] Event listener error: {e}")
+
+    # -- commands ---------------------------------------------------------
+
+    def command(self, *args: Any, timeout: Optional[float] = None) -> Any:
+        """Run an mpv command and return its ``data``; ``timeout`` overrides
+        the client's for this request only"""
+        return self._request(list(args), timeout)
+
+    def command_named(self, name: str, **kwargs: Any) -> Any:
+        """Run an mpv command with named arguments"""
+        return self._request(dict(name=name, **kwargs))
+
+    def _request(self, command: Any, timeout: Optional[float] = None) -> Any:
+        if not self.sock:
+            raise MpvIpcError("not connected")
+        with self._send_lock:
+            request_id = self._next_id
+            self._next_id += 1
+            payload = json.dumps({"command": command, "request_id": request_id}) + "\n"
+            try:
+                self.sock.sendall(payload.encode())
+            except OSError as e:
+                self.close()
+                raise MpvIpcError(f"send failed: {e}")
+
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self._replies:
+            while request_id not in self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.sock:
+                    raise MpvIpcError(f"no reply to {command!r}")
+                self._replies.wait(remaining)
+            reply = self._pending.pop(request_id)
+
+        if reply.get("error") != "success":
+            raise MpvIpcError(f"{command!r}: {reply.get('error')}")
+        return reply.get("data")
+
+    def get_property(self, name: str, default: Any = None) -> Any:
+        try:
+            return self.command("get_property", name)
+        except MpvIpcError:
+            return default
+
+    def set_property(self, name: str, value: Any):
+        self.command("set_property", name, value)
+
+    def observe_property(self, observer_id: int, name: str):
+        self.command("observe_property", observer_id, name)
+
+    # -- playlist ---------------------------------------------------------
+
+    def _mirror(self) -> List[Entry]:
+        """Current playlist, reusing our recorded options where paths agree"""
+        files = [e.get("filename") for e in self.get_property("playlist", [])]
+        if [path for path, _ in self._entries] != files:
+            self._entries = [(path, {}) for path in files]
+        return list(self._entries)
+
+    def loadfile(self, path: str, options: Dict[str, str], flags: str = "append-play"):
+        if options:
+            self.command_named("loadfile", url=path, flags=flags, options=format_options(options))
+        else:
+            self.command_named("loadfile", url=path, flags=flags)
+
+    def sync_playlist(self, entries: List[Entry]) -> bool:
+        """Transform mpv's playlist into ``entries`` without restarting.
+
+        Entries that are no longer wanted are removed with
+        ``playlist-remove``, new ones appended with ``loadfile ... append``
+        (carrying per-file options) and the result put in order with
+        ``playlist-move``. Returns True if anything changed.
+        """
+        current = self._mirror()
+        if current == entries:
+            return False
+
+        # Keep the first matches of each wanted entry, remove the rest
+        wanted = list(entries)
+        keep: List[bool] = []
+        for entry in current:
+            if entry in wanted:
+                wanted.remove(entry)
+                keep.append(True)
+            else:
+                keep.append(False)
+        for index in reversed(range(len(current))):
+            if not keep[index]:
+                self.command("playlist-remove", index)
+                del current[index]
+
+        for path, options in wanted:
+            self.loadfile(path, options)
+            current.append((path, options))
+
+        # Selection-sort into place with playlist-move
+        for target, entry in enumerate(entries):
+            source = current.index(entry, target)
+            if source != target:
+                self.command("playlist-move", source, target)
+                current.insert(target, current.pop(source))
+
+        self._entries = current
+        return True
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Watchdog Module
+Detects frozen playback over mpv IPC and paces restarts
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from mpv_ipc import MpvIpcClient, MpvIpcError
+
+# Properties observed over IPC; mpv pushes a property-change event whenever
+# one of them changes, so no polling is needed to follow playback
+OBSERVED_PROPERTIES = [
+    "time-pos",
+    "playlist-pos",
+    "estimated-vf-fps",
+    "frame-drop-count",
+    "decoder-frame-drop-count",
+    "pause",
+    "idle-active",
+]
+
+
+class PlaybackSample:
+    __slots__ = ("at", "time_pos", "playlist_pos", "fps", "dropped", "decoder_dropped")
+
+    def __init__(self, at: float, values: Dict):
+        self.at = at
+        self.time_pos = values.get("time-pos")
+        self.playlist_pos = values.get("playlist-pos")
+        self.fps = values.get("estimated-vf-fps")
+        self.dropped = values.get("frame-drop-count")
+        self.decoder_dropped = values.get("decoder-frame-drop-count")
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class MpvWatchdog:
+    """Flags a stall when mpv's playback position stops advancing.
+
+    Progress is tracked from property-change events. A monitor thread sleeps
+    until the exact moment the stall deadline would pass and is woken early
+    by every progress event, so a stall is reported as soon as the timeout
+    elapses. Stills (images) may legitimately hold position for their whole
+    display duration: ``still_allowances`` maps their playlist index to the
+    extra time allowed, so a frozen video is still caught after
+    ``stall_timeout``.
+    """
+
+    def __init__(self, ipc: MpvIpcClient, stall_timeout: float = 4.0,
+                 history: int = 240, on_stall: Optional[Callable[[str], None]] = None):
+        self.ipc = ipc
+        self.stall_timeout = stall_timeout
+        self.still_allowances: Dict[int, float] = {}
+        self.on_stall = on_stall
+        self.samples: Deque[PlaybackSample] = deque(maxlen=history)
+        self.values: Dict = {}
+        self.stalled = False
+        self.last_progress = time.monotonic()
+        self._armed = False
+        self._changed = threading.Condition()
+        self._monitor: Optional[threading.Thread] = None
+        ipc.listeners.append(self._on_event)
+
+    def attach(self):
+        """Subscribe to playback properties on a freshly connected mpv"""
+        for observer_id, name in enumerate(OBSERVED_PROPERTIES, start=1):
+            self.ipc.observe_property(observer_id, name)
+        with self._changed:
+            self.values = {}
+            self.stalled = False
+            self.last_progress = time.monotonic()
+            self._armed = True
+            self._changed.notify_all()
+        if not self._monitor or not self._monitor.is_alive():
+            self._monitor = threading.Thread(target=self._watch, daemon=True)
+            self._monitor.start()
+
+    def detach(self):
+        with self._changed:
+            self._armed = False
+            self._changed.notify_all()
+
+    def ping(self, timeout: float = 1.0) -> bool:
+        """True if mpv's core answers an IPC request (it is not deadlocked)"""
+        try:
+            self.ipc.command("get_property", "pid", timeout=timeout)
+            return True
+        except MpvIpcError:
+            return False
+
+    def _on_event(self, message: Dict):
+        if message.get("event") != "property-change":
+            return
+        name = message.get("name")
+        with self._changed:
+            previous = self.values.get(name)
+            self.values[name] = message.get("data")
+            if name in ("time-pos", "playlist-pos") and message.get("data") != previous:
+                self.last_progress = time.monotonic()
+                self.stalled = False
+                self.samples.append(PlaybackSample(time.time(), self.values))
+            elif name in ("pause", "idle-active"):
+                # Restart the clock when playback resumes
+                self.last_progress = time.monotonic()
+            self._changed.notify_all()
+
+    def _deadline(self) -> float:
+        allowance = self.still_allowances.get(self.values.get("playlist-pos"), 0.0)
+        return self.last_progress + self.stall_timeout + allowance
+
+    def _idle(self) -> bool:
+        # Paused or idle mpv is not expected to advance
+        return bool(self.values.get("pause") or self.values.get("idle-active"))
+
+    def _watch(self):
+        while True:
+            with self._changed:
+                while not self._armed or self.stalled or self._idle():
+                    self._changed.wait()
+                remaining = self._deadline() - time.monotonic()
+                if remaining > 0:
+                    self._changed.wait(remaining)
+                    continue
+                self.stalled = True
+                position = self.values.get("time-pos")
+                reason = (f"playback stalled at item {self.values.get('playlist-pos')} "
+                          f"pos {position if position is None else round(position, 2)} "
+                          f"for {time.monotonic() - self.last_progress:.1f}s")
+            print(f"[WATCHDOG] {reason}")
+            if self.on_stall:
+                self.on_stall(reason)
+
+    def recent_samples(self, count: int = 10) -> List[Dict]:
+        return [s.as_dict() for s in list(self.samples)[-count:]]
+
+
+class RestartPolicy:
+    """Exponential backoff between restarts with crash-loop detection.
+
+    Delays double from ``base_delay`` up to ``max_delay``. More than
+    ``loop_threshold`` restarts within ``loop_window`` seconds is treated as
+    a crash loop and pinned to the maximum delay. The backoff resets once
+    playback has stayed up for ``stable_after`` seconds.
+    """
+
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 60.0,
+                 loop_threshold: int = 5, loop_window: float = 300.0,
+                 stable_after: float = 120.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.loop_threshold = loop_threshold
+        self.loop_window = loop_window
+        self.stable_after = stable_after
+        self.restarts: Deque[float] = deque()
+        self.attempt = 0
+
+    def next_delay(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        if self.restarts and now - self.restarts[-1] > self.stable_after:
+            self.attempt = 0
+        while self.restarts and now - self.restarts[0] > self.loop_window:
+            self.restarts.popleft()
+        self.restarts.append(now)
+
+        if self.in_crash_loop:
+            return self.max_delay
+        delay = min(self.base_delay * (2 ** self.attempt), self.max_delay)
+        self.attempt += 1
+        return delay
+
+    @property
+    def in_crash_loop(self) -> bool:
+        return len(self.restarts) > self.loop_threshold
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Pairing Screen Module
+Shows the pairing code through the main mpv, rendered once per code and resolution
+"""
+
+import functools
+import os
+from typing import Dict, Optional, Tuple
+
+from mpv_ipc import MpvIpcClient
+
+FONT_PATHS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
+]
+DEFAULT_SIZE = (1920, 1080)
+SUBTITLE = "Go to Dashboard > Devices > Pair Device"
+# Text sizes are laid out for 1080 lines and scaled to the screen
+CODE_PX, SUBTITLE_PX, SUBTITLE_GAP = 100, 40, 150
+# osd-overlay ids are 0..63; the player uses no other overlays
+OVERLAY_ID = 63
+
+
+def screen_size(display: Dict) -> Tuple[int, int]:
+    """Resolution from the device probe's display mode, 1080p when unknown"""
+    width, height = display.get("width"), display.get("height")
+    if width and height:
+        return int(width), int(height)
+    return DEFAULT_SIZE
+
+
+@functools.lru_cache(maxsize=None)
+def font_path() -> Optional[str]:
+    for path in FONT_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+@functools.lru_cache(maxsize=8)
+def load_font(px: int):
+    """Loaded once per size: parsing the TTF is most of a render on a Pi Zero"""
+    from PIL import ImageFont
+    path = font_path()
+    if path:
+        try:
+            return ImageFont.truetype(path, px)
+        except OSError:
+            pass
+    return ImageFont.load_default()
+
+
+def render(code: str, size: Tuple[int, int], cache_dir: str) -> Optional[str]:
+    """Path of a PNG showing ``code`` at ``size``. Rendered only when not
+    already cached; None when PIL is unavailable or rendering fails."""
+    width, height = size
+    path = os.path.join(cache_dir, f"pairing-{code}-{width}x{height}.png")
+    if os.path.exists(path):
+        return path
+    try:
+        from PIL import Image, ImageDraw
+    except ImportError:
+        print("[PAIRING] PIL not installed; showing the code as on-screen text")
+        return None
+
+    try:
+        scale = height / DEFAULT_SIZE[1]
+        font = load_font(max(12, round(CODE_PX * scale)))
+        small_font = load_font(max(8, round(SUBTITLE_PX * scale)))
+
+        # Greyscale: a third of the memory of RGB, and the screen is grey anyway
+        img = Image.new("L", size, 0)
+        d = ImageDraw.Draw(img)
+        text = f"Pairing Code: {code}"
+        left, top, right, bottom = d.textbbox((0, 0), text, font=font)
+        y = (height - (bottom - top)) / 2
+        d.text(((width - (right - left)) / 2, y), text, fill=255, font=font)
+        left, _, right, _ = d.textbbox((0, 0), SUBTITLE, font=small_font)
+        d.text(((width - (right - left)) / 2, y + SUBTITLE_GAP * scale), SUBTITLE,
+               fill=200, font=small_font)
+
+        os.makedirs(cache_dir, exist_ok=True)
+        _prune(cache_dir, code)
+        tmp = path + ".tmp"
+        # Fast compression: the image is flat and written once per code
+        img.save(tmp, "PNG", compress_level=1)
+        os.replace(tmp, path)
+        return path
+    except Exception as e:
+        print(f"[PAIRING] Error rendering pairing image: {e}")
+        return None
+
+
+def _prune(cache_dir: str, code: str):
+    """Pairing codes are single-use: drop images of earlier codes"""
+    for name in os.listdir(cache_dir):
+        if name.startswith("pairing-") and not name.startswith(f"pairing-{code}-"):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+
+def overlay_text(code: str) -> str:
+    """ASS markup for the OSD fallback (OSD space is 720 lines high)"""
+    return (f"{{\\an5\\fs72\\bord0}}Pairing Code: {code}\\N"
+            f"{{\\fs29\\1c&HC8C8C8&}}{SUBTITLE}")
+
+
+class PairingScreen:
+    """The pairing code on the player's own mpv.
+
+    ``show`` loads the rendered image (or, without PIL, draws the code as
+    OSD text on the idle window); calling it again with the same code does
+    nothing and a new code replaces the old one in place. Blocking: call
+    from a worker thread.
+    """
+
+    def __init__(self, ipc: MpvIpcClient, cache_dir: str, size: Tuple[int, int]):
+        self.ipc = ipc
+        self.cache_dir = cache_dir
+        self.size = size
+        self.code: Optional[str] = None
+        self._image = False
+
+    def show(self, code: str):
+        if code == self.code:
+            return
+        path = render(code, self.size, self.cache_dir)
+        if path:
+            self.ipc.loadfile(path, {"image-display-duration": "inf"}, flags="replace")
+            self._set_overlay(None)
+        else:
+            if self._image:
+                self.ipc.command("stop")
+            self._set_overlay(overlay_text(code))
+        self.code = code
+        self._image = bool(path)
+
+    def clear(self):
+        """Blank the screen so the next playlist starts from an idle mpv"""
+        if self.code is None:
+            return
+        if self._image:
+            self.ipc.command("stop")
+        self._set_overlay(None)
+        self.code = None
+        self._image = False
+
+    def _set_overlay(self, text: Optional[str]):
+        if text:
+            self.ipc.command_named("osd-overlay", id=OVERLAY_ID, format="ass-events",
+                                   data=text, res_y=720)
+        else:
+            self.ipc.command_named("osd-overlay", id=OVERLAY_ID, format="none", data="")
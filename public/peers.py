@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Peer Sharing Module
+Discovers players on the same LAN and shares verified media blobs with them
+"""
+
+import json
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+DISCOVERY_PORT = 47800
+HTTP_PORT = 47801
+ANNOUNCE_INTERVAL = 30
+BLOB_PATH = re.compile(r"^/blobs/([0-9a-f]{64})$")
+
+
+class PeerDiscovery:
+    """UDP broadcast announcements of our blob server.
+
+    Every player binds the same discovery port with SO_REUSEPORT, so
+    several instances on one host (or a whole store's LAN) all hear each
+    other's broadcasts. Static peers (``host:port`` of their discovery
+    socket) are announced to directly, for networks that drop broadcasts
+    and for localhost testing.
+    """
+
+    def __init__(self, http_port: int, port: int = DISCOVERY_PORT,
+                 broadcast: str = "255.255.255.255",
+                 static_peers: Optional[List[str]] = None,
+                 interval: float = ANNOUNCE_INTERVAL):
+        self.http_port = http_port
+        self.port = port
+        self.broadcast = broadcast
+        self.static_peers = [_split_hostport(p, port) for p in static_peers or []]
+        self.interval = interval
+        self.instance_id = uuid.uuid4().hex
+        self.peers: Dict[Tuple[str, int], float] = {}  # (host, http port) -> last seen
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.sock: Optional[socket.socket] = None
+
+    def start(self) -> bool:
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            sock.bind(("", self.port))
+        except OSError as e:
+            print(f"[PEERS] Discovery unavailable: {e}")
+            return False
+        self.sock = sock
+        threading.Thread(target=self._listen, daemon=True).start()
+        threading.Thread(target=self._announce_loop, daemon=True).start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self.sock:
+            self.sock.close()
+
+    def urls(self) -> List[str]:
+        """Base URLs of live peers, most recently heard first"""
+        cutoff = time.monotonic() - 3 * self.interval
+        with self._lock:
+            live = sorted(((seen, peer) for peer, seen in self.peers.items() if seen >= cutoff),
+                          reverse=True)
+        return [f"http://{host}:{port}" for _, (host, port) in live]
+
+    def _announce_loop(self):
+        message = json.dumps({"signage": 1, "id": self.instance_id, "http": self.http_port}).encode()
+        targets = [(self.broadcast, self.port)] + self.static_peers
+        while not self._stop.is_set():
+            for target in targets:
+                try:
+                    self.sock.sendto(message, target)
+                except OSError:
+                    pass  # No route for broadcast, peer host down, ...
+            self._stop.wait(self.interval)
+
+    def _listen(self):
+        while not self._stop.is_set():
+            try:
+                data, (host, _) = self.sock.recvfrom(1024)
+                message = json.loads(data)
+            except OSError:
+                return
+            except ValueError:
+                continue
+            if not isinstance(message, dict) or message.get("signage") != 1:
+                continue
+            if message.get("id") == self.instance_id or not isinstance(message.get("http"), int):
+                continue
+            peer = (host, message["http"])
+            with self._lock:
+                is_new = peer not in self.peers
+                self.peers[peer] = time.monotonic()
+            if is_new:
+                print(f"[PEERS] Found peer at {host}:{message['http']}")
+
+
+class BlobServer(ThreadingHTTPServer):
+    """Serves ``GET /blobs/<sha256>`` from the media cache.
+
+    Only blobs already admitted to the cache (and therefore verified) are
+    served; receivers verify again against the hash from the origin. At
+    most ``max_uploads`` transfers run at once so sharing never starves
+    playback of disk bandwidth; extra requests get a 503 and move on to
+    the next peer or the origin.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int, blob_for_hash: Callable[[str], Optional[str]],
+                 max_uploads: int = 4):
+        super().__init__(("", port), BlobRequestHandler)
+        self.blob_for_hash = blob_for_hash
+        self.slots = threading.BoundedSemaphore(max_uploads)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class BlobRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        match = BLOB_PATH.match(self.path)
+        path = self.server.blob_for_hash(match.group(1)) if match else None
+        if not path or not os.path.exists(path):
+            self.send_error(404)
+            return
+        if not self.server.slots.acquire(blocking=False):
+            self.send_error(503)
+            return
+        try:
+            self._send_blob(path, match.group(1))
+        except OSError:
+            pass  # Receiver went away; it will resume elsewhere
+        finally:
+            self.server.slots.release()
+
+    def _send_blob(self, path: str, digest: str):
+        size = os.path.getsize(path)
+        start = 0
+        ranged = re.match(r"^bytes=(\d+)-$", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if ranged and (not if_range or if_range == f'"{digest}"'):
+            start = int(ranged.group(1))
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        # Same strong validator as the origin, so transfers can resume across sources
+        self.send_header("ETag", f'"{digest}"')
+        self.send_header("Content-Length", str(size - start))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        self.wfile.flush()
+        with open(path, 'rb') as f:
+            self.connection.sendfile(f, start, size - start)
+
+
+class PeerSharing:
+    """Discovery plus blob server; hands the downloader peer URLs to try"""
+
+    def __init__(self, config: Dict, blob_for_hash: Callable[[str], Optional[str]]):
+        self.http_port = config.get("peer_http_port", HTTP_PORT)
+        self.discovery = PeerDiscovery(
+            self.http_port,
+            port=config.get("peer_discovery_port", DISCOVERY_PORT),
+            broadcast=config.get("peer_broadcast", "255.255.255.255"),
+            static_peers=config.get("peers", []),
+        )
+        self.blob_for_hash = blob_for_hash
+        self.server: Optional[BlobServer] = None
+
+    def start(self):
+        try:
+            self.server = BlobServer(self.http_port, self.blob_for_hash)
+            self.server.start()
+        except OSError as e:
+            print(f"[PEERS] Cannot serve media on port {self.http_port}: {e}")
+            return
+        if self.discovery.start():
+            print(f"[PEERS] Sharing media on port {self.http_port}")
+
+    def stop(self):
+        self.discovery.stop()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def mirrors(self, item: Dict) -> List[str]:
+        """Peer URLs for an item. Only items with a known hash are eligible,
+        since that is what makes peer content verifiable."""
+        digest = item.get('sha256')
+        if not digest or not self.server:
+            return []
+        return [f"{base}/blobs/{digest}" for base in self.discovery.urls()]
+
+
+def _split_hostport(value: str, default_port: int) -> Tuple[str, int]:
+    host, _, port = value.rpartition(":")
+    if not host:
+        return value, default_port
+    return host, int(port)
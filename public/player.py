@@ -2,309 +2,855 @@
 """
 Digital Signage Player - Optimized for Seamless Playback
 Uses MPV playlist mode to avoid black screens between items.
+An asyncio supervisor runs sync, downloads, process monitoring, health
+checks, the schedule timer and telemetry as independent tasks, so no
+network call can delay reacting to an mpv crash.
 """
 
+import asyncio
+import logging
+import logging.handlers
 import os
 import json
+import signal
+import sqlite3
 import subprocess
+import sys
+import threading
 import time
-import signal
-import requests
 from datetime import datetime
 from typing import Dict, List, Optional
 from sync import SyncManager
+from mpv_ipc import MpvIpcClient, MpvIpcError
+from mpv_watchdog import MpvWatchdog, RestartPolicy
+from telemetry import Telemetry
+from metrics import PlayRing, PlaybackMetrics, process_age, summarize
+from playlist import Playlist
+from state_store import StateStore
+from timeline import Timeline, TimelineClock, build_timeline
+from pairing_screen import PairingScreen, screen_size
+from screen_sync import ScreenSync, SYNC_PORT, run_harness
+import device_probe
+
+# Heavy modules (requests, PIL) are imported on first use, after playback
+# has started
+IMPORTED_AT = process_age()
+BOOT_LOG_LINES = 200
+
+# Watchdog events worth an operator's attention
+EVENT_LEVELS = {
+    "mpv_stalled": "error",
+    "mpv_unresponsive": "error",
+    "mpv_not_running": "error",
+    "mpv_crash_loop": "error",
+    "mpv_restart": "warning",
+    "unclean_shutdown": "warning",
+    "state_recovered": "warning",
+    "task_failed": "error",
+}
+
+# Backoff for restarting a failed supervisor task; reset once it ran this long
+TASK_RESTART_MAX_DELAY = 60
+TASK_HEALTHY_AFTER = 300
+
 
 class Player:
     def __init__(self):
         # Dynamically find config based on user home
         home = os.path.expanduser("~")
         config_path = os.path.join(home, "signage-player", "config.json")
-            
+
         self.sync_manager = SyncManager(config_path)
         self.media_dir = self.sync_manager.media_dir
-        self.playlist_m3u = os.path.join(os.path.dirname(config_path), "playlist.m3u")
-        self.mpv_process = None
+        self.mpv_process: Optional[asyncio.subprocess.Process] = None
+        self.ipc = MpvIpcClient(os.path.join(os.path.dirname(config_path), "mpv.sock"))
+        self.timeline: Optional[Timeline] = None
+        # False while mpv runs idle (pairing screen) without the clock,
+        # watchdog and metrics subscribed
+        self.monitors_attached = False
         self.running = True
-        
+
+        # Boot-to-first-frame timing (seconds since process start), logged
+        # once mpv shows its first frame; see ``player.py boot-bench``
+        self.boot_log = os.path.join(os.path.dirname(config_path), "boot_times.jsonl")
+        self.boot: Dict = {"imports": IMPORTED_AT, "source": "network"}
+        self.ipc.listeners.append(self._on_first_frame)
+
         # Watchdog state
-        self.last_health_check = time.time()
         self.mpv_restart_count = 0
-        self.last_mpv_check_time = time.time()
         self.watchdog_log = os.path.join(os.path.dirname(config_path), "watchdog.log")
-        
+        self.event_log = self._open_event_log()
+        self.store = self.sync_manager.store
+        self.telemetry = Telemetry(
+            self.sync_manager.server_url,
+            lambda: self.sync_manager.device_token,
+            store=self.store,
+        )
+        self.telemetry.import_spool(os.path.join(os.path.dirname(config_path), "telemetry.spool"))
+        self.stall_reason = ""
+        self.watchdog = MpvWatchdog(
+            self.ipc,
+            stall_timeout=self.sync_manager.config.get("stall_timeout", 4),
+            on_stall=self._on_stall,
+        )
+        self.restart_policy = RestartPolicy()
+        self.metrics = PlaybackMetrics(
+            self.ipc,
+            PlayRing(os.path.join(os.path.dirname(config_path), "playback.ring")),
+            upload_interval=self.sync_manager.config.get("stats_interval", 300),
+        )
+        # Proof-of-play summaries ride along with the sync heartbeat
+        self.sync_manager.stats_provider = self.metrics.pending_summary
+        self.sync_manager.on_stats_sent = self.metrics.mark_uploaded
+        # Paces images and keeps the loop on the wall-clock grid
+        self.clock = TimelineClock(
+            self.ipc,
+            anchor=self.sync_manager.config.get("timeline_anchor", 0),
+            align=self.sync_manager.config.get("timeline_align", True),
+            on_length=self._on_video_length,
+        )
+        # Video walls: one leader, the rest follow it frame by frame
+        self.screen_sync: Optional[ScreenSync] = None
+        config = self.sync_manager.config
+        if config.get("sync_group"):
+            self.screen_sync = ScreenSync(
+                self.ipc,
+                config["sync_group"],
+                leader=config.get("sync_role", "follower") == "leader",
+                port=config.get("sync_port", SYNC_PORT),
+                broadcast=config.get("peer_broadcast", "255.255.255.255"),
+                static_peers=config.get("sync_peers"),
+            )
+            self.clock.passive = not self.screen_sync.leader
+
+        # Supervisor state, created inside the event loop by supervise()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stalled: Optional[asyncio.Event] = None
+        self.mpv_started: Optional[asyncio.Event] = None
+        self.schedule_changed: Optional[asyncio.Event] = None
+        self.sync_requested: Optional[asyncio.Event] = None
+        self.download_queue: Optional[asyncio.Queue] = None
+        self.mpv_lock: Optional[asyncio.Lock] = None
+
         # Ensure DISPLAY is set
         if "DISPLAY" not in os.environ:
             os.environ["DISPLAY"] = ":0"
 
-    def generate_m3u(self, playlist: Dict) -> bool:
-        """Generate M3U playlist file for MPV"""
+        # Hardware probe (cached on disk) drives mpv tuning and is reported
+        # to the server so it can pick suitable media renditions
+        self.probe_path = os.path.join(os.path.dirname(config_path), "device_probe.json")
+        self.device = device_probe.load_probe(self.probe_path)
+        self.mpv_options = device_probe.select_profile(self.device)
+        self.sync_manager.capabilities = device_probe.capabilities(self.device)
+        print("[PLAYER] mpv profile: " + " ".join(f"{k}={v}" for k, v in self.mpv_options.items()))
+        self.pairing = PairingScreen(self.ipc, os.path.join(os.path.dirname(config_path), "pairing"),
+                                     screen_size(self.device["probe"]["display"]))
+        self.boot["init"] = process_age()
+
+    def build_timeline(self, playlist: Playlist) -> bool:
+        """Lay out the cached items of the playlist with their play times"""
         try:
-            items = sorted(playlist['items'], key=lambda x: x['order'])
-            
-            with open(self.playlist_m3u, 'w') as f:
-                for item in items:
-                    filepath = os.path.join(self.media_dir, item['filename'])
-                    if os.path.exists(filepath):
-                        f.write(f"{filepath}\n")
+            cache = self.sync_manager.cache
+            timeline = build_timeline(playlist, cache.path_for, cache.length_for,
+                                      image_duration=self.sync_manager.config.get("image_duration", 10))
+            self.timeline = timeline
+            self.clock.set_timeline(timeline)
+            self.metrics.set_items(timeline.items)
+            # Stills hold their position for their whole display duration
+            self.watchdog.still_allowances = timeline.still_allowances
+            cache.touch(timeline.items.values())
+            cache.save()
             return True
         except Exception as e:
-            print(f"[PLAYER] Error generating M3U: {e}")
+            print(f"[PLAYER] Error building timeline: {e}")
             return False
 
-    def start_mpv(self):
-        """Start MPV with the current playlist"""
+    def _on_video_length(self, item: Dict, seconds: float):
+        """Called from the clock thread once mpv reports a video's length"""
+        self.sync_manager.cache.set_length(item, seconds)
+        self.sync_manager.cache.save()
+
+    def has_new_media(self, playlist: Playlist) -> bool:
+        """True if items left out for lack of media have since been cached"""
+        available = sum(1 for item in playlist.items if self.sync_manager.media_path(item.data))
+        return available != len(self.timeline.entries if self.timeline else [])
+
+    async def reload_playlist(self):
+        """Apply the active playlist to the running mpv, restarting only if it is dead"""
+        playlist = self.sync_manager.active
+        if not playlist or not self.build_timeline(playlist):
+            return
+        async with self.mpv_lock:
+            if self.is_mpv_running() and self.ipc.connected:
+                try:
+                    if await asyncio.to_thread(self.ipc.sync_playlist, self.timeline.mpv_entries()):
+                        print("[PLAYER] Playlist updated in place")
+                    if not self.monitors_attached:
+                        # mpv was started idle for the pairing screen
+                        await self._attach_monitors()
+                    return
+                except MpvIpcError as e:
+                    print(f"[PLAYER] IPC update failed ({e}). Restarting MPV...")
+            await self.start_mpv()
+
+    async def start_mpv(self, use_ipc: bool = True, idle: bool = False):
+        """Start MPV with the current playlist, or with none when ``idle``
+        (caller holds mpv_lock)"""
         if self.mpv_process:
-            self.stop_mpv()
+            await self.stop_mpv()
 
         print("[PLAYER] Starting MPV seamless playback...")
         try:
-            # --image-display-duration=10 : Default duration for images (can be tunable later)
+            # --image-display-duration : Per image; the timeline clock advances stills
             # --loop-playlist : Loop forever
             # --fullscreen : Fullscreen
             # --no-osd-bar : Clean look
+            # --idle : Stay alive while the playlist is (re)loaded over IPC
+            # hwdec, cache and sync options come from the device probe
+            try:
+                os.remove(self.ipc.socket_path)
+            except FileNotFoundError:
+                pass
             cmd = [
                 "mpv",
-                f"--playlist={self.playlist_m3u}",
+                f"--input-ipc-server={self.ipc.socket_path}",
+                "--idle=yes",
                 "--fullscreen",
                 "--no-osd-bar",
                 "--no-audio-display",
-                "--image-display-duration=10",
                 "--loop-playlist=inf",
-                "--prefetch-playlist=yes",
                 "--force-window=immediate",
-                "--cache=yes",
-                "--demuxer-max-bytes=150M",
-                "--demuxer-max-back-bytes=50M",
                 "--hr-seek=yes",
-                "--gpu-context=auto" 
-            ]
-            
-            self.mpv_process = subprocess.Popen(cmd)
+                "--gpu-context=auto",
+            ] + [f"--{name}={value}" for name, value in self.mpv_options.items()]
+
+            if not use_ipc:
+                # No clock without IPC: mpv times each image from its option block
+                cmd += self.timeline.cli_args()
+
+            self.mpv_process = await asyncio.create_subprocess_exec(*cmd)
+            self.boot.setdefault("mpv_spawned", process_age())
+            self.mpv_started.set()
         except Exception as e:
             print(f"[PLAYER] Failed to start MPV: {e}")
+            return
+
+        if not use_ipc:
+            return
+        try:
+            if not await asyncio.to_thread(self.ipc.connect):
+                raise MpvIpcError("socket did not appear")
+            if idle:
+                return
+            await asyncio.to_thread(self.ipc.sync_playlist, self.timeline.mpv_entries())
+            await self._attach_monitors()
+        except MpvIpcError as e:
+            if idle:
+                print(f"[PLAYER] IPC unavailable ({e})")
+                return
+            # Fall back to handing mpv the playlist on the command line
+            print(f"[PLAYER] IPC unavailable ({e}). Starting without IPC...")
+            await self.start_mpv(use_ipc=False)
 
-    def stop_mpv(self):
+    async def _attach_monitors(self):
+        await asyncio.to_thread(self.watchdog.attach)
+        await asyncio.to_thread(self.metrics.attach)
+        await asyncio.to_thread(self.clock.attach)
+        self.monitors_attached = True
+
+    def _on_first_frame(self, message: Dict):
+        """Called from the IPC reader thread for every mpv event"""
+        if message.get("event") != "playback-restart" or "first_frame" in self.boot \
+                or self.pairing.code:
+            return
+        self.boot["first_frame"] = process_age()
+        record = {"at": round(time.time(), 3), "source": self.boot["source"],
+                  **{k: round(v, 3) for k, v in self.boot.items() if isinstance(v, float)}}
+        print(f"[PLAYER] First frame {record['first_frame']:.2f}s after start (from {record['source']})")
+        try:
+            with open(self.boot_log, 'r') as f:
+                lines = f.readlines()[-(BOOT_LOG_LINES - 1):]
+        except OSError:
+            lines = []
+        lines.append(json.dumps(record) + "\n")
+        try:
+            tmp = self.boot_log + ".tmp"
+            with open(tmp, 'w') as f:
+                f.writelines(lines)
+            os.replace(tmp, self.boot_log)
+        except OSError as e:
+            print(f"[PLAYER] Could not write boot log: {e}")
+
+    def _on_stall(self, reason: str):
+        """Called from the watchdog thread"""
+        self.stall_reason = reason
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.stalled.set)
+
+    async def stop_mpv(self):
         """Stop the running MPV process"""
-        if self.mpv_process:
+        self.watchdog.detach()
+        self.metrics.detach()
+        self.clock.detach()
+        self.monitors_attached = False
+        self.pairing.code = None
+        self.ipc.close()
+        process, self.mpv_process = self.mpv_process, None
+        if process and process.returncode is None:
             print("[PLAYER] Restarting/Stopping MPV...")
             try:
-                self.mpv_process.terminate()
-                self.mpv_process.wait(timeout=2)
-            except subprocess.TimeoutExpired:
-                self.mpv_process.kill()
-            self.mpv_process = None
+                process.terminate()
+                await asyncio.wait_for(process.wait(), timeout=2)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+            except ProcessLookupError:
+                pass
 
     def is_mpv_running(self) -> bool:
         """Check if MPV process is running"""
         if not self.mpv_process:
             return False
-        return self.mpv_process.poll() is None
+        return self.mpv_process.returncode is None
 
     def is_mpv_responsive(self) -> bool:
-        """Check if MPV is responsive (not frozen)"""
+        """Check if MPV is responsive (not frozen). Blocks up to 1s."""
         if not self.is_mpv_running():
             return False
-        
-        # Check if process is in a good state
-        try:
-            # If poll() returns None, process is still running
-            if self.mpv_process.poll() is None:
-                return True
-        except Exception as e:
-            print(f"[WATCHDOG] Error checking MPV responsiveness: {e}")
+
+        if not self.ipc.connected:
+            # Started without IPC: the process is all we can observe
+            return True
+
+        # A frozen decoder stops the position; a deadlocked core stops replying
+        if self.watchdog.stalled:
             return False
-        
-        return False
+        return self.watchdog.ping()
 
-    def check_mpv_health(self) -> bool:
+    async def check_mpv_health(self) -> bool:
         """Comprehensive MPV health check"""
         if not self.is_mpv_running():
             self.log_watchdog_event("mpv_not_running", "MPV process not found")
             return False
-        
-        if not self.is_mpv_responsive():
+
+        if not await asyncio.to_thread(self.is_mpv_responsive):
             self.log_watchdog_event("mpv_unresponsive", "MPV process unresponsive")
             return False
-        
+
         return True
 
+    def _open_event_log(self) -> logging.Logger:
+        """Size-capped local watchdog log, opened once"""
+        logger = logging.getLogger("signage.watchdog")
+        logger.propagate = False
+        if not logger.handlers:
+            try:
+                handler = logging.handlers.RotatingFileHandler(
+                    self.watchdog_log, maxBytes=512 * 1024, backupCount=1)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+            except OSError as e:
+                print(f"[WATCHDOG] Failed to open local log: {e}")
+        logger.setLevel(logging.INFO)
+        return logger
+
     def log_watchdog_event(self, event_type: str, details: str):
-        """Log watchdog events locally and send to dashboard"""
+        """Log watchdog events locally and queue them for the dashboard"""
         timestamp = datetime.now().isoformat()
-        log_entry = f"[{timestamp}] {event_type}: {details}\n"
-        
-        # Log locally
-        try:
-            with open(self.watchdog_log, 'a') as f:
-                f.write(log_entry)
-        except Exception as e:
-            print(f"[WATCHDOG] Failed to write local log: {e}")
-        
-        # Log to console
-        print(f"[WATCHDOG] {log_entry.strip()}")
-        
-        # Send to dashboard API (non-blocking)
-        try:
-            if self.sync_manager.device_token:
-                requests.post(
-                    f"{self.sync_manager.api_base}/devices/watchdog",
-                    json={
-                        "event_type": event_type,
-                        "details": details,
-                        "timestamp": timestamp,
-                        "restart_count": self.mpv_restart_count
-                    },
-                    headers={"Authorization": f"Bearer {self.sync_manager.device_token}"},
-                    timeout=5
-                )
-        except Exception as e:
-            # Don't fail if API is unreachable
-            print(f"[WATCHDOG] Failed to send event to API: {e}")
+        log_entry = f"[{timestamp}] {event_type}: {details}"
 
-    def restart_mpv(self, reason: str = "unknown"):
+        # Log locally and to console
+        self.event_log.info(log_entry)
+        print(f"[WATCHDOG] {log_entry}")
+
+        # Shipped in batches by the telemetry task; never blocks the caller
+        self.telemetry.log(
+            EVENT_LEVELS.get(event_type, "info"),
+            f"{event_type}: {details} (restarts: {self.mpv_restart_count})",
+            timestamp,
+        )
+
+    async def restart_mpv(self, reason: str = "unknown"):
         """Kill and restart MPV process"""
-        self.log_watchdog_event("mpv_restart", f"Restarting MPV: {reason}")
-        self.mpv_restart_count += 1
-        
-        # Kill existing process
-        if self.mpv_process:
+        async with self.mpv_lock:
+            self.log_watchdog_event("mpv_restart", f"Restarting MPV: {reason}")
+            self.mpv_restart_count += 1
             try:
-                self.mpv_process.kill()
-                self.mpv_process.wait(timeout=2)
-            except Exception as e:
-                print(f"[WATCHDOG] Error killing MPV: {e}")
-        
-        self.mpv_process = None
-        time.sleep(1)
-        
-        # Restart with current playlist
-        if os.path.exists(self.playlist_m3u):
-            self.start_mpv()
-        else:
-            print("[WATCHDOG] No playlist available for restart")
+                self.store.incr("mpv_restarts")
+            except sqlite3.Error as e:
+                print(f"[WATCHDOG] Could not count restart: {e}")
+
+            # The new mpv starts blank; put the pairing code back on it
+            pairing_code, self.pairing.code = self.pairing.code, None
 
-    def pairing_loop(self):
-        """Handle pairing (same as before)"""
+            # Kill existing process
+            self.watchdog.detach()
+            self.metrics.detach()
+            self.clock.detach()
+            self.ipc.close()
+            process, self.mpv_process = self.mpv_process, None
+            if process and process.returncode is None:
+                try:
+                    process.kill()
+                    await asyncio.wait_for(process.wait(), timeout=2)
+                except Exception as e:
+                    print(f"[WATCHDOG] Error killing MPV: {e}")
+
+            delay = self.restart_policy.next_delay()
+            if self.restart_policy.in_crash_loop:
+                self.log_watchdog_event(
+                    "mpv_crash_loop",
+                    f"{len(self.restart_policy.restarts)} restarts in {self.restart_policy.loop_window:.0f}s, "
+                    f"backing off {delay:.0f}s"
+                )
+            await asyncio.sleep(delay)
+
+            # Restart with current playlist
+            if pairing_code:
+                await self.start_mpv(idle=True)
+                await self._show_pairing(pairing_code)
+            elif self.timeline and self.timeline.entries:
+                await self.start_mpv()
+            else:
+                print("[WATCHDOG] No playlist available for restart")
+
+    async def pairing_loop(self):
+        """Register, show the pairing code and wait until paired"""
         print("\n[PLAYER] Device unpaired. Starting pairing process...")
-        
+
         # Reuse sync manager logic
-        reg_data = self.sync_manager.register()
+        reg_data = await asyncio.to_thread(self.sync_manager.register)
         if not reg_data:
             print("[PLAYER] Registration failed. Retrying in 10s...")
-            time.sleep(10)
+            await asyncio.sleep(10)
             return
 
         code = reg_data['pairing_code']
         token = reg_data['device_token']
         poll_interval = reg_data.get('poll_interval', 5000) / 1000.0
-        
+
         print(f"PAIRING CODE: {code}")
-        
-        image_path = self.sync_manager.generate_pairing_image(code)
-        viewer = None
-        
-        if image_path and os.path.exists(image_path):
+
+        await self.show_pairing(code)
+
+        try:
+            while self.running:
+                event = None
+                if self.sync_manager.push_ready:
+                    # Held open by the server; answers the moment we are paired
+                    event = await self._blocking(self.sync_manager.watch_events, token)
+                if event:
+                    if not event.get("paired"):
+                        continue
+                    status = "paired"
+                else:
+                    status = await asyncio.to_thread(self.sync_manager.poll_status, token)
+                if status == "paired":
+                    print("\n[PLAYER] Device paired successfully!")
+                    self.sync_manager.save_config(token)
+                    break
+                await asyncio.sleep(poll_interval)
+        finally:
+            await self.clear_pairing()
+
+    async def show_pairing(self, code: str):
+        """Put the pairing code on screen through the main mpv, started idle
+        if it is not running; a new code replaces the old one in place"""
+        async with self.mpv_lock:
+            if not (self.is_mpv_running() and self.ipc.connected):
+                await self.start_mpv(idle=True)
+            await self._show_pairing(code)
+
+    async def _show_pairing(self, code: str):
+        """(caller holds mpv_lock)"""
+        if not self.ipc.connected:
+            return
+        try:
+            await asyncio.to_thread(self.pairing.show, code)
+        except MpvIpcError as e:
+            print(f"[PLAYER] Could not show the pairing code: {e}")
+
+    async def clear_pairing(self):
+        """Take the pairing code off screen; mpv stays up for the playlist"""
+        async with self.mpv_lock:
+            if not self.ipc.connected:
+                return
             try:
-                # Use MPV for image display (works on X11 and DRM/Lite)
-                viewer = subprocess.Popen([
-                    "mpv", 
-                    image_path, 
-                    "--fullscreen", 
-                    "--loop-file=inf", 
-                    "--no-osd-bar",
-                    "--force-window=immediate"
-                ])
-            except:
+                await asyncio.to_thread(self.pairing.clear)
+            except MpvIpcError:
                 pass
 
-        while self.running:
-            status = self.sync_manager.poll_status(token)
-            if status == "paired":
-                print("\n[PLAYER] Device paired successfully!")
-                self.sync_manager.save_config(token)
-                break
-            time.sleep(poll_interval)
-            
-        if viewer:
-            viewer.terminate()
+    # -- supervisor tasks -------------------------------------------------
+
+    async def sync_task(self):
+        """Initial sync, then sync whenever the server pushes a change or the
+        (adaptive) poll interval passes; downloads are queued"""
+        print("[PLAYER] Performing initial sync...")
+        # Only what is needed now; download_task prefetches later slots
+        update = await asyncio.to_thread(self.sync_manager.sync, prefetch=False)
+        self.download_queue.put_nowait(None)
+        if update is None and not self.is_mpv_running():
+            print("[PLAYER] No playlist found. Waiting for sync...")
+        elif update is not None and (update or not self.is_mpv_running()
+                                     or self.has_new_media(update.playlist)):
+            await self.reload_playlist()
+
+        while True:
             try:
-                viewer.wait(timeout=1)
-            except:
-                viewer.kill()
+                await asyncio.wait_for(self.sync_requested.wait(),
+                                       timeout=self.sync_manager.next_poll_delay())
+            except asyncio.TimeoutError:
+                pass
+            self.sync_requested.clear()
+            print("[PLAYER] Checking for updates...")
+            changed = await asyncio.to_thread(self.sync_manager.refresh)
+            if changed is None:
+                continue
+            # Always queue: also retries downloads that failed earlier
+            self.download_queue.put_nowait(changed)
+
+    async def push_task(self):
+        """Hold the server's event channel open and request a sync on change"""
+        while True:
+            await asyncio.sleep(self.sync_manager.push_retry_delay())
+            event = await self._blocking(self.sync_manager.watch_events)
+            if event and event.get("changed"):
+                print("[PLAYER] Server reported new content")
+                self.sync_requested.set()
+
+    async def download_task(self):
+        """Fetch media for queued syncs, then switch content if needed"""
+        while True:
+            try:
+                changed = await asyncio.wait_for(self.download_queue.get(),
+                                                 timeout=self.sync_manager.prefetch_delay())
+            except asyncio.TimeoutError:
+                changed = None  # A download window opened for deferred prefetch
+            # Coalesce syncs that queued up behind a long download
+            while not self.download_queue.empty():
+                changed = self.download_queue.get_nowait() or changed
+            await asyncio.to_thread(self.sync_manager.download_scheduled)
+            if changed:
+                await asyncio.to_thread(self.sync_manager.cleanup_media)
+                self.schedule_changed.set()
+            update = self.sync_manager.apply_schedule()
+            if update:
+                print("[PLAYER] Content updated! Applying...")
+                await self.reload_playlist()
+            elif update is not None and self.has_new_media(update.playlist):
+                print("[PLAYER] Missing media arrived. Applying...")
+                await self.reload_playlist()
+            elif changed is False:
+                print("[PLAYER] No changes detected.")
+
+    async def mpv_monitor_task(self):
+        """Restart mpv the moment its process exits unexpectedly"""
+        while True:
+            process = self.mpv_process
+            if process is None:
+                await self.mpv_started.wait()
+                self.mpv_started.clear()
+                continue
+            await process.wait()
+            if process is self.mpv_process:
+                # Not a deliberate stop or restart
+                print("[PLAYER] MPV exited unexpectedly. Restarting...")
+                await self.restart_mpv("process exited")
+
+    async def health_task(self, interval: float = 30):
+        """React to watchdog stalls immediately, ping mpv periodically"""
+        while True:
+            try:
+                await asyncio.wait_for(self.stalled.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                if self.mpv_process and not await self.check_mpv_health():
+                    await self.restart_mpv("health check failed")
+                continue
+            self.stalled.clear()
+            if self.watchdog.stalled and self.is_mpv_running():
+                self.log_watchdog_event("mpv_stalled", self.stall_reason)
+                await self.restart_mpv("playback stalled")
+
+    async def schedule_task(self):
+        """Switch playlists exactly at schedule boundaries (works offline)"""
+        while True:
+            self.schedule_changed.clear()
+            next_transition = self.sync_manager.next_transition()
+            timeout = None
+            if next_transition:
+                timeout = max(0.0, (next_transition - datetime.now()).total_seconds())
+            try:
+                await asyncio.wait_for(self.schedule_changed.wait(), timeout=timeout)
+                continue  # New schedule: recompute the boundary
+            except asyncio.TimeoutError:
+                pass
+            if self.sync_manager.apply_schedule():
+                print("[PLAYER] Schedule slot changed. Switching playlist...")
+                await self.reload_playlist()
+            # The slot after this one is now the next: fetch it ahead of prefetch
+            self.sync_manager.interrupt_prefetch()
+            self.download_queue.put_nowait(None)
+
+    async def telemetry_task(self, interval: float = 15):
+        """Ship queued events in batches, backing off while offline"""
+        ready = asyncio.Event()
+        self.telemetry.on_ready = lambda: self.loop.call_soon_threadsafe(ready.set)
+        while True:
+            try:
+                await asyncio.wait_for(ready.wait(), timeout=self.telemetry.next_delay(interval))
+            except asyncio.TimeoutError:
+                pass
+            ready.clear()
+            await asyncio.to_thread(self.telemetry.flush)
+
+    async def metrics_task(self, interval: float = 60):
+        """Refresh the temperature/throttling/memory counters stamped on plays"""
+        while True:
+            await asyncio.to_thread(self.metrics.sample_system)
+            await asyncio.sleep(interval)
+
+    async def supervise(self):
+        self.loop = asyncio.get_running_loop()
+        self.stalled = asyncio.Event()
+        self.mpv_started = asyncio.Event()
+        self.schedule_changed = asyncio.Event()
+        self.sync_requested = asyncio.Event()
+        self.download_queue = asyncio.Queue()
+        self.mpv_lock = asyncio.Lock()
+
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            self.loop.add_signal_handler(sig, stop.set)
 
-    def run(self):
         print("=" * 50)
         print("Digital Signage Player (Seamless Mode)")
         print("=" * 50)
+        self._record_start()
 
-        # 1. Pairing Check
-        token = self.sync_manager.device_token
-        if not token or token == "":
-            self.pairing_loop()
+        tasks = []
+        try:
+            # 1. Play what is cached right away; network and pairing can wait
+            playlist = self.sync_manager.active
+            if self.sync_manager.device_token and playlist and self.build_timeline(playlist) \
+                    and self.timeline.entries:
+                self.boot["source"] = "cache"
+                async with self.mpv_lock:
+                    await self.start_mpv()
 
-        # 2. Initial Sync
-        print("[PLAYER] Performing initial sync...")
-        self.sync_manager.sync()
-        
-        # 3. Start Playback
-        playlist = self.sync_manager.load_cached_playlist()
-        if playlist and self.generate_m3u(playlist):
-            self.start_mpv()
+            # 2. Pairing Check; mpv is watched from here on, so a crash
+            # while the pairing code is up brings the code back
+            tasks.append(asyncio.create_task(
+                self._guarded("mpv-monitor", self.mpv_monitor_task), name="mpv-monitor"))
+            while not self.sync_manager.device_token:
+                await self._until(stop, self.pairing_loop())
+                if stop.is_set():
+                    return
+
+            if self.sync_manager.peers:
+                self.sync_manager.peers.start()
+            if self.screen_sync:
+                self.screen_sync.start()
+
+            # 3. Supervise; the first sync runs as part of sync_task
+            # A failing task is restarted on its own; only stop ends supervision
+            workers = {
+                "sync": self.sync_task,
+                "download": self.download_task,
+                "ipc-health": self.health_task,
+                "schedule": self.schedule_task,
+                "telemetry": self.telemetry_task,
+                "metrics": self.metrics_task,
+            }
+            if self.sync_manager.push_enabled:
+                workers["push"] = self.push_task
+            tasks += [asyncio.create_task(self._guarded(name, factory), name=name)
+                      for name, factory in workers.items()]
+            await stop.wait()
+        finally:
+            print("\n[PLAYER] Stopping...")
+            self.running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.stop_mpv()
+            if self.sync_manager.peers:
+                self.sync_manager.peers.stop()
+            if self.screen_sync:
+                self.screen_sync.stop()
+            # Unsent events survive the restart in the spool
+            self.telemetry.persist()
+            try:
+                self.store.put("running", False)
+            except sqlite3.Error as e:
+                print(f"[PLAYER] Could not record clean stop: {e}")
+
+    async def _guarded(self, name: str, factory):
+        """Run ``factory()`` for as long as the player runs, restarting it with
+        backoff when it raises (or returns, which supervisor tasks never should)"""
+        failures = 0
+        while True:
+            started = time.monotonic()
+            try:
+                await factory()
+                reason = "returned"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                reason = repr(e)
+            if time.monotonic() - started >= TASK_HEALTHY_AFTER:
+                failures = 0
+            failures += 1
+            delay = min(TASK_RESTART_MAX_DELAY, 2 ** failures)
+            self.log_watchdog_event("task_failed", f"{name} {reason}; restarting in {delay}s")
+            await asyncio.sleep(delay)
+
+    def _record_start(self):
+        """Count boots and notice when the last run ended without a clean stop"""
+        if self.store.recovered:
+            self.log_watchdog_event("state_recovered", "State database was damaged and has been rebuilt")
+        try:
+            self.store.incr("boots")
+            if self.store.get("running"):
+                self.store.incr("unclean_shutdowns")
+                self.log_watchdog_event("unclean_shutdown", "Previous run ended without a clean stop (power loss?)")
+            self.store.put("running", True)
+        except sqlite3.Error as e:
+            # A full disk must never keep the screen dark
+            print(f"[PLAYER] Could not record start: {e}")
+
+    async def _until(self, stop: asyncio.Event, coro):
+        """Run coro, abandoning it if stop is set first"""
+        task = asyncio.ensure_future(coro)
+        waiter = asyncio.create_task(stop.wait())
+        await asyncio.wait([task, waiter], return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _blocking(self, func, *args):
+        """Like asyncio.to_thread, but on a daemon thread that shutdown does
+        not wait for; for calls that block for a long time, such as the
+        push channel's long-poll"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(result, error):
+            if not future.done():
+                if error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+        def run():
+            try:
+                result, error = func(*args), None
+            except Exception as e:
+                result, error = None, e
+            try:
+                loop.call_soon_threadsafe(resolve, result, error)
+            except RuntimeError:
+                pass  # Event loop already closed
+
+        threading.Thread(target=run, daemon=True).start()
+        return await future
+
+    def run(self):
+        asyncio.run(self.supervise())
+
+def print_stats(hours: float = 24):
+    """``player.py stats [hours]``: proof-of-play summary from the local ring"""
+    ring_path = os.path.join(os.path.expanduser("~"), "signage-player", "playback.ring")
+    if not os.path.exists(ring_path):
+        print("No playback records yet")
+        return
+    ring = PlayRing(ring_path)
+    records = ring.records(since=time.time() - hours * 3600)
+    print(f"Plays in the last {hours:g}h: {len(records)} "
+          f"({ring.count} recorded in total, ring holds {ring.capacity})")
+    print(json.dumps(summarize(records), indent=2))
+    state_path = os.path.join(os.path.dirname(ring_path), "state.db")
+    if os.path.exists(state_path):
+        print("Counters:", json.dumps(StateStore(state_path).counters()))
+
+
+def run_benchmark(clips: List[str]):
+    """``player.py benchmark [clip ...]``: decode fps per hwdec mode.
+
+    Without arguments, cached videos are used. The fastest mode is stored
+    with the probe and used for hwdec from the next start on.
+    """
+    config_dir = os.path.join(os.path.expanduser("~"), "signage-player")
+    if not clips:
+        media_dir = os.path.join(config_dir, "media")
+        clips = sorted(os.path.join(media_dir, name) for name in os.listdir(media_dir)
+                       if name.lower().endswith((".mp4", ".mkv", ".webm", ".mov")))[:3] \
+            if os.path.isdir(media_dir) else []
+    if not clips:
+        print("No clips to benchmark. Pass video files as arguments.")
+        return
+    probe_path = os.path.join(config_dir, "device_probe.json")
+    result = device_probe.load_probe(probe_path, refresh=True)
+    result["benchmark"] = device_probe.benchmark(clips)
+    device_probe.save_probe(probe_path, result)
+    print(f"Best hwdec mode: {result['benchmark']['best'] or 'none (all modes failed)'}")
+
+
+def run_boot_bench(runs: int = 5):
+    """``player.py boot-bench [runs]``: time boot to first frame.
+
+    Starts the player ``runs`` times, waits for each to log its first
+    frame and stops it again. Stop the signage-player service first.
+    """
+    boot_log = os.path.join(os.path.expanduser("~"), "signage-player", "boot_times.jsonl")
+    records = []
+    for run in range(1, runs + 1):
+        started = time.time()
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        record = None
+        deadline = time.monotonic() + 60
+        while record is None and time.monotonic() < deadline and process.poll() is None:
+            time.sleep(0.1)
+            try:
+                with open(boot_log, 'r') as f:
+                    last = json.loads(f.readlines()[-1])
+                record = last if last["at"] >= started else None
+            except (OSError, ValueError, IndexError, KeyError):
+                pass
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        if record:
+            records.append(record)
+            print(f"Run {run}: first frame {record['first_frame']:.2f}s "
+                  f"(imports {record['imports']:.2f}s, init {record['init']:.2f}s, "
+                  f"mpv {record.get('mpv_spawned', 0):.2f}s, from {record['source']})")
         else:
-            print("[PLAYER] No playlist found. Waiting for sync...")
+            print(f"Run {run}: no first frame within 60s")
+        time.sleep(1)  # Let mpv release the display and socket
+
+    if records:
+        frames = sorted(r["first_frame"] for r in records)
+        print(f"First frame over {len(frames)} run(s): min {frames[0]:.2f}s, "
+              f"median {frames[len(frames) // 2]:.2f}s, max {frames[-1]:.2f}s")
 
-        # 4. Monitor Loop
-        last_sync_time = time.time()
-        last_health_check = time.time()
-        sync_interval = 60  # Check every minute
-        health_check_interval = 30  # Health check every 30 seconds
-
-        while self.running:
-            time.sleep(5) 
-            
-            # Watchdog: Health check every 30 seconds
-            if time.time() - last_health_check > health_check_interval:
-                if not self.check_mpv_health():
-                    self.restart_mpv("health check failed")
-                last_health_check = time.time()
-            
-            # Periodically sync
-            if time.time() - last_sync_time > sync_interval:
-                print("[PLAYER] Checking for updates...")
-                
-                # Check actual content change to avoid unnecessary restarts
-                old_playlist_data = ""
-                if os.path.exists(self.sync_manager.playlist_cache):
-                    with open(self.sync_manager.playlist_cache, 'r') as f:
-                        old_playlist_data = f.read()
-
-                if self.sync_manager.sync():
-                    # Sync returned success (network ok), now check if CONTENT changed
-                    new_playlist_data = ""
-                    if os.path.exists(self.sync_manager.playlist_cache):
-                        with open(self.sync_manager.playlist_cache, 'r') as f:
-                            new_playlist_data = f.read()
-                    
-                    if old_playlist_data != new_playlist_data:
-                        print("[PLAYER] Content updated! Restarting playback...")
-                        playlist = self.sync_manager.load_cached_playlist()
-                        if playlist and self.generate_m3u(playlist):
-                            self.start_mpv()
-                    else:
-                        print("[PLAYER] No changes detected.")
-                
-                last_sync_time = time.time()
-                
-            # Check if MPV crashed (redundant with health check, but kept for immediate detection)
-            if self.mpv_process and self.mpv_process.poll() is not None:
-                print("[PLAYER] MPV exited unexpectedly. Restarting...")
-                self.restart_mpv("process exited")
 
 if __name__ == "__main__":
-    player = Player()
-    try:
+    if len(sys.argv) > 1 and sys.argv[1] == "stats":
+        print_stats(float(sys.argv[2]) if len(sys.argv) > 2 else 24)
+    elif len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        run_benchmark(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "boot-bench":
+        run_boot_bench(int(sys.argv[2]) if len(sys.argv) > 2 else 5)
+    elif len(sys.argv) > 2 and sys.argv[1] == "sync-harness":
+        # player.py sync-harness <clip> [followers] [seconds]
+        run_harness(sys.argv[2],
+                    followers=int(sys.argv[3]) if len(sys.argv) > 3 else 2,
+                    seconds=float(sys.argv[4]) if len(sys.argv) > 4 else 60)
+    else:
+        player = Player()
         player.run()
-    except KeyboardInterrupt:
-        print("\n[PLAYER] Stopped")
-        if player.mpv_process:
-            player.mpv_process.terminate()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Playlist Module
+In-memory playlist model with a stable content fingerprint
+"""
+
+import hashlib
+import json
+from typing import Dict, List, Optional, Set
+
+
+def fingerprint(data: Dict) -> str:
+    """Stable hash of a playlist payload, independent of key order"""
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+class PlaylistItem:
+    __slots__ = ("id", "type", "duration", "order", "digest", "data")
+
+    def __init__(self, data: Dict):
+        self.id = data.get('id')
+        self.type = data.get('type')
+        self.duration = data.get('duration')
+        self.order = data.get('order', 0)
+        self.digest = fingerprint(data)
+        # The server's dict, as the media cache and downloader expect it
+        self.data = data
+
+
+class Playlist:
+    """A playlist as sent by the server, items sorted by play order"""
+
+    __slots__ = ("id", "name", "items", "fingerprint", "data")
+
+    def __init__(self, data: Dict):
+        self.id = data.get('id')
+        self.name = data.get('name')
+        self.items: List[PlaylistItem] = sorted(
+            (PlaylistItem(i) for i in data.get('items', [])), key=lambda i: i.order)
+        self.fingerprint = fingerprint(data)
+        self.data = data
+
+    def changed_items(self, previous: Optional["Playlist"]) -> Set[str]:
+        """Ids of items added, removed or modified since ``previous``"""
+        before = {i.id: i.digest for i in previous.items} if previous else {}
+        after = {i.id: i.digest for i in self.items}
+        return {key for key in before.keys() | after.keys() if before.get(key) != after.get(key)}
+
+
+class PlaylistUpdate:
+    """Result of resolving the active playlist: falsy when nothing changed"""
+
+    __slots__ = ("playlist", "changed")
+
+    def __init__(self, playlist: Playlist, changed: Set[str]):
+        self.playlist = playlist
+        self.changed = changed
+
+    @property
+    def fingerprint(self) -> str:
+        return self.playlist.fingerprint
+
+    def __bool__(self) -> bool:
+        return bool(self.changed)
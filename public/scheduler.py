@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Schedule Module
+Evaluates the cached weekly schedule locally, without the network
+"""
+
+import bisect
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_hhmm(value: str) -> int:
+    """'08:30' -> minutes since midnight ('24:00' is allowed)"""
+    hours, minutes = value.strip().split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def schedule_day(moment: datetime) -> int:
+    """Day index as stored by the server (0=Sunday ... 6=Saturday)"""
+    return (moment.weekday() + 1) % 7
+
+
+class Slot:
+    __slots__ = ("start", "end", "playlist")
+
+    def __init__(self, start: int, end: int, playlist: Dict):
+        self.start = start
+        self.end = end
+        self.playlist = playlist
+
+
+class ScheduleEvaluator:
+    """Interval index over a weekly schedule.
+
+    Each weekday holds its slots sorted by start minute plus the sorted set
+    of boundaries (starts and ends) where the active playlist may change.
+    Slots whose end is at or before their start run past midnight and are
+    split across two days. When slots overlap, the one that started last
+    wins; outside every slot the default playlist plays.
+    """
+
+    def __init__(self, schedule: Optional[Dict], default_playlist: Optional[Dict] = None):
+        self.default_playlist = default_playlist
+        self.days: Dict[int, List[Slot]] = {d: [] for d in range(7)}
+        self.boundaries: Dict[int, List[int]] = {d: [] for d in range(7)}
+
+        for item in (schedule or {}).get('items', []):
+            if not item.get('playlist'):
+                continue
+            try:
+                day = int(item['dayOfWeek']) % 7
+                start = parse_hhmm(item['startTime'])
+                end = parse_hhmm(item['endTime'])
+            except (KeyError, ValueError) as e:
+                print(f"[SCHEDULE] Skipping malformed slot {item}: {e}")
+                continue
+            if end <= start:
+                self._add(day, start, MINUTES_PER_DAY, item['playlist'])
+                if end:
+                    self._add((day + 1) % 7, 0, end, item['playlist'])
+            else:
+                self._add(day, start, min(end, MINUTES_PER_DAY), item['playlist'])
+
+        for day in range(7):
+            self.days[day].sort(key=lambda s: s.start)
+            points = {s.start for s in self.days[day]} | {s.end for s in self.days[day]}
+            self.boundaries[day] = sorted(p for p in points if 0 < p < MINUTES_PER_DAY)
+
+    def _add(self, day: int, start: int, end: int, playlist: Dict):
+        self.days[day].append(Slot(start, end, playlist))
+
+    @property
+    def has_slots(self) -> bool:
+        return any(self.days.values())
+
+    def _lookup(self, day: int, minute: int) -> Optional[Slot]:
+        slots = self.days[day]
+        # Only slots starting at or before `minute` can contain it
+        last = bisect.bisect_right([s.start for s in slots], minute)
+        for slot in reversed(slots[:last]):
+            if minute < slot.end:
+                return slot
+        return None
+
+    def active_playlist(self, now: Optional[datetime] = None) -> Optional[Dict]:
+        now = now or datetime.now()
+        slot = self._lookup(schedule_day(now), now.hour * 60 + now.minute)
+        return slot.playlist if slot else self.default_playlist
+
+    def next_transition(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Exact time of the next slot boundary after ``now``"""
+        if not self.has_slots:
+            return None
+        now = now or datetime.now()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        minute = now.hour * 60 + now.minute
+
+        for offset in range(8):
+            day = (schedule_day(now) + offset) % 7
+            points = self.boundaries[day]
+            if offset == 0:
+                idx = bisect.bisect_right(points, minute)
+                points = points[idx:]
+            elif self.days[day] or self.days[(day - 1) % 7]:
+                # Midnight itself is a boundary when either side has slots
+                points = [0] + points
+            if points:
+                return midnight + timedelta(days=offset, minutes=points[0])
+        return None
+
+    def upcoming_slots(self, now: Optional[datetime] = None,
+                       horizon: timedelta = timedelta(hours=24)) -> List[Tuple[datetime, Dict]]:
+        """(first active time, playlist) for each playlist that will be active
+        between now and now + horizon, in order; the current one comes first
+        with ``now`` as its time"""
+        now = now or datetime.now()
+        seen: Dict[str, Tuple[datetime, Dict]] = {}
+        moment = now
+        end = now + horizon
+        while moment <= end:
+            playlist = self.active_playlist(moment)
+            if playlist:
+                seen.setdefault(playlist.get('id', ''), (moment, playlist))
+            moment = self.next_transition(moment)
+            if moment is None:
+                break
+        return list(seen.values())
+
+    def upcoming_playlists(self, now: Optional[datetime] = None,
+                           horizon: timedelta = timedelta(hours=24)) -> List[Dict]:
+        """Playlists that will be active between now and now + horizon, in order"""
+        return [playlist for _, playlist in self.upcoming_slots(now, horizon)]
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Screen Sync Module
+Keeps several players' mpv instances frame-aligned (video walls, menu rows)
+"""
+
+import json
+import os
+import socket
+import statistics
+import subprocess
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from mpv_ipc import MpvIpcClient, MpvIpcError
+
+SYNC_PORT = 47802
+STATE_INTERVAL = 0.1
+PING_INTERVAL = 1.0
+# A follower that has not heard its leader for this long plays on its own
+LEADER_TIMEOUT = 3.0
+OFFSET_SAMPLES = 8
+# Beyond this a follower seeks; below it, speed is nudged
+SEEK_THRESHOLD = 0.25
+# Speed nudges correct the drift over about this many seconds...
+NUDGE_WINDOW = 1.0
+# ...but never change speed by more than this (inaudible, invisible)
+MAX_NUDGE = 0.05
+# Drift the speed controller leaves alone, so speed is not reset constantly
+DEADBAND = 0.002
+# Time a seek or playlist switch is given to settle before re-measuring
+SETTLE_TIME = 0.5
+DEFAULT_FRAME_TIME = 1 / 30
+# Harness: drift at which a follower counts as not synchronised at all, and
+# how close to the loop point a position must be to explain a loop-length jump
+UNCONVERGED = 1.0
+WRAP_MARGIN = 1.0
+
+
+class ClockOffset:
+    """Leader clock minus local clock, estimated NTP-style.
+
+    Each ping/pong exchange gives t0 (sent, local), t1 (received, leader),
+    t2 (replied, leader) and t3 (reply received, local). The exchange with
+    the smallest round-trip delay among the recent ones is the least
+    disturbed by queuing, so its offset is used.
+    """
+
+    def __init__(self, samples: int = OFFSET_SAMPLES):
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=samples)
+
+    def add(self, t0: float, t1: float, t2: float, t3: float):
+        delay = (t3 - t0) - (t2 - t1)
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        self.samples.append((delay, offset))
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.samples)
+
+    @property
+    def offset(self) -> float:
+        return min(self.samples)[1] if self.samples else 0.0
+
+    @property
+    def delay(self) -> Optional[float]:
+        return min(self.samples)[0] if self.samples else None
+
+    def to_local(self, leader_time: float) -> float:
+        return leader_time - self.offset
+
+
+def _numbers(message: Dict, *fields: str) -> bool:
+    return all(isinstance(message.get(f), (int, float)) and not isinstance(message.get(f), bool)
+               for f in fields)
+
+
+def valid_message(message: Dict) -> bool:
+    """Fields a pong or state packet must carry before we act on it; a
+    malformed or foreign packet must not kill the listener"""
+    kind = message.get("type")
+    if kind == "pong":
+        return _numbers(message, "t0", "t1", "t2")
+    if kind == "state":
+        return (_numbers(message, "seq", "at", "speed") and isinstance(message.get("file"), str)
+                and (message.get("pos") is None or _numbers(message, "pos"))
+                and ("control" not in message or _numbers(message, "control")))
+    return True
+
+
+def sample_playback(ipc: MpvIpcClient) -> Optional[Dict]:
+    """Current file, position and speed, stamped at the middle of the query"""
+    try:
+        path = ipc.command("get_property", "path")
+        before = time.monotonic()
+        position = ipc.get_property("time-pos")
+        after = time.monotonic()
+        speed = ipc.get_property("speed", 1.0)
+        paused = ipc.get_property("pause", False)
+    except MpvIpcError:
+        return None
+    return {
+        # Media blobs are named by content hash, so names agree across players
+        "file": os.path.basename(path or ""),
+        "pos": position,
+        "at": (before + after) / 2,
+        "speed": speed,
+        "paused": bool(paused),
+    }
+
+
+def _split_hostport(value: str, default_port: int) -> Tuple[str, int]:
+    host, _, port = value.rpartition(":")
+    return (host, int(port)) if host else (value, default_port)
+
+
+class ScreenSync:
+    """Leader/follower playback sync over UDP.
+
+    The leader broadcasts its playlist entry and playback position, stamped
+    with its monotonic clock, ``1 / STATE_INTERVAL`` times a second, and
+    answers pings. Followers estimate the leader's clock from the pings,
+    extrapolate where the leader is *now*, and steer their own mpv: the
+    leader's file is started if it differs, large drift is seeked away and
+    small drift is absorbed with speed changes of up to ``MAX_NUDGE``,
+    leaving less than one frame of error at steady state.
+
+    Broadcasts go to the shared group port; pings, pongs and direct state
+    updates use a second, unshared socket on each side, so a leader and any
+    number of followers can run on one host.
+    """
+
+    def __init__(self, ipc: MpvIpcClient, group: str, leader: bool,
+                 port: int = SYNC_PORT, broadcast: str = "255.255.255.255",
+                 static_peers: Optional[List[str]] = None):
+        self.ipc = ipc
+        self.group = group
+        self.leader = leader
+        self.port = port
+        self.broadcast = broadcast
+        self.static_peers = [_split_hostport(p, port) for p in static_peers or []]
+        self.instance_id = uuid.uuid4().hex
+        self.clock = ClockOffset()
+        self.drift: Optional[float] = None
+        self.frame_time = DEFAULT_FRAME_TIME
+        self.followers: Dict[Tuple[str, int], float] = {}  # control address -> last ping
+        self._leader_addr: Optional[Tuple[str, int]] = None
+        self._leader_id: Optional[str] = None
+        self._last_state = 0.0
+        self._last_seq = -1
+        self._state: Optional[Dict] = None
+        self._file: Optional[str] = None
+        self._speed = 1.0
+        self._settle_until = 0.0
+        self._lock = threading.Condition()
+        self._stop = threading.Event()
+        self._sockets: List[socket.socket] = []
+
+    # -- lifecycle ----------------------------------------------------------
+
+    def start(self) -> bool:
+        try:
+            group_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            group_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                group_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            group_sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            group_sock.bind(("", self.port))
+            control = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            control.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            control.bind(("", 0))
+            self._sockets = [group_sock, control]
+        except OSError as e:
+            print(f"[SCREENSYNC] Unavailable: {e}")
+            return False
+
+        for sock in self._sockets:
+            threading.Thread(target=self._listen, args=(sock,), daemon=True).start()
+        loop = self._lead if self.leader else self._follow
+        threading.Thread(target=loop, daemon=True).start()
+        print(f"[SCREENSYNC] {'Leading' if self.leader else 'Following'} group '{self.group}' on port {self.port}")
+        return True
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            self._lock.notify_all()
+        for sock in self._sockets:
+            sock.close()
+
+    def status(self) -> Dict:
+        return {
+            "role": "leader" if self.leader else "follower",
+            "followers": len(self.followers),
+            "leader": self._leader_addr[0] if self._leader_addr else None,
+            "offset": round(self.clock.offset, 6) if self.clock.ready else None,
+            "drift": round(self.drift, 4) if self.drift is not None else None,
+            "drift_frames": round(self.drift / self.frame_time, 2) if self.drift is not None else None,
+        }
+
+    # -- network ------------------------------------------------------------
+
+    def _send(self, message: Dict, target: Tuple[str, int]):
+        try:
+            self._sockets[1].sendto(json.dumps(message).encode(), target)
+        except OSError:
+            pass  # No route for broadcast, peer down, socket closed on stop
+
+    def _listen(self, sock: socket.socket):
+        while not self._stop.is_set():
+            try:
+                data, addr = sock.recvfrom(2048)
+                received = time.monotonic()
+                message = json.loads(data)
+            except OSError:
+                return
+            except ValueError:
+                continue
+            if not isinstance(message, dict) or message.get("group") != self.group:
+                continue
+            if message.get("id") == self.instance_id or not valid_message(message):
+                continue
+            kind = message.get("type")
+            if kind == "ping" and self.leader:
+                message.update(type="pong", id=self.instance_id, t1=received, t2=time.monotonic())
+                self._send(message, addr)
+                with self._lock:
+                    self.followers[addr] = received
+            elif kind == "pong" and not self.leader:
+                self.clock.add(message["t0"], message["t1"], message["t2"], received)
+            elif kind == "state" and not self.leader:
+                self._on_state(message, addr)
+
+    # -- leader ---------------------------------------------------------------
+
+    def _lead(self):
+        seq = 0
+        while not self._stop.wait(STATE_INTERVAL):
+            sample = sample_playback(self.ipc) if self.ipc.connected else None
+            if not sample:
+                continue
+            seq += 1
+            message = dict(sample, type="state", group=self.group, id=self.instance_id,
+                           seq=seq, control=self._sockets[1].getsockname()[1])
+            now = time.monotonic()
+            with self._lock:
+                for addr, seen in list(self.followers.items()):
+                    if now - seen > LEADER_TIMEOUT:
+                        del self.followers[addr]
+                targets = list(self.followers)
+            # Broadcast lets new followers find us; known ones get it directly
+            for target in [(self.broadcast, self.port)] + self.static_peers + targets:
+                self._send(message, target)
+
+    # -- follower -------------------------------------------------------------
+
+    def _on_state(self, message: Dict, addr: Tuple[str, int]):
+        with self._lock:
+            if self._leader_id not in (None, message.get("id")) and \
+                    time.monotonic() - self._last_state < LEADER_TIMEOUT:
+                return  # Stick with the leader we have
+            if message.get("id") != self._leader_id:
+                print(f"[SCREENSYNC] Following leader at {addr[0]}")
+                self._leader_id = message.get("id")
+                self._last_seq = -1
+                self.clock = ClockOffset()
+            if message.get("seq", 0) <= self._last_seq:
+                return  # Same packet via broadcast and unicast
+            self._last_seq = message["seq"]
+            self._leader_addr = (addr[0], message.get("control", addr[1]))
+            self._last_state = time.monotonic()
+            self._state = message
+            self._lock.notify_all()
+
+    def _follow(self):
+        last_ping = 0.0
+        while not self._stop.is_set():
+            with self._lock:
+                if self._state is None:
+                    self._lock.wait(PING_INTERVAL)
+                state, self._state = self._state, None
+                leader = self._leader_addr
+                lost = self._leader_id and time.monotonic() - self._last_state > LEADER_TIMEOUT
+
+            if leader and time.monotonic() - last_ping >= PING_INTERVAL:
+                last_ping = time.monotonic()
+                ping = {"type": "ping", "group": self.group, "id": self.instance_id, "t0": last_ping}
+                self._send(ping, leader)
+
+            try:
+                if lost:
+                    print("[SCREENSYNC] Leader lost, playing on our own")
+                    with self._lock:
+                        self._leader_id = self._leader_addr = None
+                    self.drift = None
+                    self._set_speed(1.0)
+                elif state and self.clock.ready and self.ipc.connected:
+                    self._steer(state)
+            except MpvIpcError as e:
+                print(f"[SCREENSYNC] {e}")
+
+    def _steer(self, state: Dict):
+        own = sample_playback(self.ipc)
+        if not own or time.monotonic() < self._settle_until:
+            return
+
+        if state["file"] != own["file"]:
+            names = [os.path.basename(e.get("filename", "")) for e in self.ipc.get_property("playlist", [])]
+            if state["file"] in names:
+                self.ipc.command("playlist-play-index", names.index(state["file"]))
+                self._settle_until = time.monotonic() + SETTLE_TIME
+            self.drift = None
+            return
+        if own["file"] != self._file:
+            self._file = own["file"]
+            fps = self.ipc.get_property("container-fps")
+            self.frame_time = 1 / fps if fps else DEFAULT_FRAME_TIME
+
+        if state["pos"] is None or own["pos"] is None:
+            return  # Images: following the entry is all there is
+        if state["paused"] != own["paused"]:
+            self.ipc.set_property("pause", state["paused"])
+
+        # Where the leader is at the moment we sampled ourselves
+        elapsed = 0.0 if state["paused"] else own["at"] - self.clock.to_local(state["at"])
+        expected = state["pos"] + elapsed * state["speed"]
+        drift = own["pos"] - expected
+        self.drift = drift
+
+        if abs(drift) > SEEK_THRESHOLD:
+            target = expected + (time.monotonic() - own["at"])
+            self.ipc.command("seek", round(target, 3), "absolute+exact")
+            self._set_speed(1.0)
+            self._settle_until = time.monotonic() + SETTLE_TIME
+        elif abs(drift) < DEADBAND:
+            self._set_speed(state["speed"])
+        else:
+            nudge = max(-MAX_NUDGE, min(MAX_NUDGE, drift / NUDGE_WINDOW))
+            self._set_speed(state["speed"] * (1 - nudge))
+
+    def _set_speed(self, speed: float):
+        speed = round(speed, 4)
+        if speed != self._speed and self.ipc.connected:
+            self.ipc.set_property("speed", speed)
+            self._speed = speed
+
+
+def run_harness(clip: str, followers: int = 2, seconds: float = 60, port: int = 47890,
+                vo: str = "null") -> Dict:
+    """Measure drift between a leader and followers playing ``clip`` on this host.
+
+    Starts one mpv per instance, staggers the followers' starting points,
+    and samples every instance's position over IPC. Drift is reported
+    after a 5 s convergence period; all instances share this host's clock,
+    so the numbers need no offset correction.
+    """
+    base = f"/tmp/signage-sync-harness-{os.getpid()}"
+    processes, clients, syncs = [], [], []
+    try:
+        for index in range(followers + 1):
+            socket_path = f"{base}-{index}.sock"
+            processes.append(subprocess.Popen(
+                ["mpv", "--no-config", "--idle=yes", f"--vo={vo}", "--no-audio", "--loop-file=inf",
+                 "--hr-seek=yes", f"--input-ipc-server={socket_path}"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            ipc = MpvIpcClient(socket_path)
+            if not ipc.connect():
+                raise RuntimeError(f"mpv instance {index} did not start")
+            ipc.loadfile(os.path.abspath(clip), {"start": str(0.7 * index)}, flags="replace")
+            clients.append(ipc)
+
+        for index, ipc in enumerate(clients):
+            sync = ScreenSync(ipc, "harness", leader=index == 0, port=port, broadcast="127.255.255.255")
+            sync.start()
+            syncs.append(sync)
+
+        duration = clients[0].get_property("duration")
+        drifts: List[float] = []
+        wraps = 0
+        started = time.monotonic()
+        while time.monotonic() - started < seconds:
+            time.sleep(0.2)
+            samples = [sample_playback(ipc) for ipc in clients]
+            lead = samples[0]
+            if not lead or lead["pos"] is None or time.monotonic() - started < 5:
+                continue
+            for sample in samples[1:]:
+                if not sample or sample["pos"] is None:
+                    continue
+                drift = (sample["pos"] - lead["pos"]) - (sample["at"] - lead["at"])
+                # Skip only the instant one instance has looped and the other
+                # not yet: one of them is at the loop point, drift ~ the length
+                if duration and abs(drift) > duration / 2 and \
+                        any(min(s["pos"], duration - s["pos"]) < WRAP_MARGIN for s in (lead, sample)):
+                    wraps += 1
+                    continue
+                drifts.append(abs(drift))
+
+        fps = clients[0].get_property("container-fps") or 1 / DEFAULT_FRAME_TIME
+        if not drifts:
+            print("[SCREENSYNC] No drift samples collected")
+            return {}
+        drifts.sort()
+        report = {
+            "samples": len(drifts),
+            "p50_ms": round(statistics.median(drifts) * 1000, 2),
+            "p95_ms": round(drifts[int(len(drifts) * 0.95) - 1] * 1000, 2),
+            "max_ms": round(drifts[-1] * 1000, 2),
+            "frame_ms": round(1000 / fps, 2),
+            "within_one_frame": round(sum(1 for d in drifts if d < 1 / fps) / len(drifts), 4),
+            # Followers that never locked on show up here, not as a good p50
+            "unconverged": round(sum(1 for d in drifts if d >= UNCONVERGED) / len(drifts), 4),
+            "loop_wraps_skipped": wraps,
+        }
+        print(json.dumps(report, indent=2))
+        if report["unconverged"]:
+            print(f"[SCREENSYNC] {report['unconverged']:.1%} of samples drifted {UNCONVERGED:.0f}s or more")
+        return report
+    finally:
+        for sync in syncs:
+            sync.stop()
+        for ipc in clients:
+            ipc.close()
+        for process in processes:
+            process.terminate()
+        for index in range(followers + 1):
+            try:
+                os.remove(f"{base}-{index}.sock")
+            except FileNotFoundError:
+                pass
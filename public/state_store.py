@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - State Store Module
+Crash-safe device state (config copy, schedule, media index, spool, counters) in SQLite
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS kv ("
+    " key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS spool ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT NOT NULL, record TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS spool_queue ON spool (queue, id)",
+    "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+]
+
+
+class StateStore:
+    """One SQLite database in WAL mode for everything the player must keep
+    across restarts.
+
+    Every write is a transaction that is fsynced before it returns
+    (``synchronous=FULL``), so after a power cut the store holds either the
+    old or the new state, never a torn file. If the database is damaged
+    anyway (bad SD card sectors), it is moved aside as ``*.corrupt`` and a
+    fresh one is started with ``recovered`` set; callers then rebuild what
+    they can (config from config.json, media from the blobs on disk, the
+    schedule from the next sync).
+
+    Thread-safe: one connection, serialised by a lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.recovered = False
+        self._lock = threading.RLock()
+        self._db = self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        db = None
+        try:
+            db = self._connect()
+            result = db.execute("PRAGMA quick_check").fetchone()[0]
+            if result != "ok":
+                raise sqlite3.DatabaseError(result)
+            return db
+        except sqlite3.OperationalError:
+            # Locked or an I/O error: not evidence of a damaged file
+            if db is not None:
+                db.close()
+            raise
+        except sqlite3.DatabaseError as e:
+            if db is not None:
+                db.close()
+            print(f"[STATE] {os.path.basename(self.path)} is damaged ({e}); starting a new one")
+            self._quarantine()
+            self.recovered = True
+            return self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; transactions are explicit (see ``transaction``)
+        db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=FULL")
+        for statement in SCHEMA:
+            db.execute(statement)
+        return db
+
+    def _quarantine(self):
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.replace(self.path + suffix, self.path + suffix + ".corrupt")
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def transaction(self):
+        """Group writes so that they land together or not at all"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+                self._db.execute("COMMIT")
+            except BaseException:
+                # Also after a failed COMMIT (disk full), which leaves the
+                # transaction open and would block every later write
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # -- key/value (JSON) -------------------------------------------------
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def put(self, key: str, value: Any):
+        self.put_many({key: value})
+
+    def put_many(self, values: Dict[str, Any]):
+        now = time.time()
+        rows = [(key, json.dumps(value), now) for key, value in values.items()]
+        with self.transaction() as db:
+            db.executemany("INSERT OR REPLACE INTO kv (key, value, updated) VALUES (?, ?, ?)", rows)
+
+    def delete(self, key: str):
+        with self.transaction() as db:
+            db.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def import_json(self, key: str, path: str, field: Optional[str] = None) -> bool:
+        """Move a legacy JSON state file into ``key`` unless the key is
+        already set. The file is removed once its content is stored (or if
+        it is unreadable)."""
+        if not os.path.exists(path):
+            return False
+        imported = False
+        try:
+            with open(path, 'r') as f:
+                value = json.load(f)
+            if field:
+                value = value.get(field)
+            if value is not None and self.get(key) is None:
+                self.put(key, value)
+                imported = True
+        except (ValueError, AttributeError, OSError) as e:
+            print(f"[STATE] Skipping unreadable {os.path.basename(path)}: {e}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return imported
+
+    # -- counters ---------------------------------------------------------
+
+    def incr(self, name: str, by: int = 1) -> int:
+        with self.transaction() as db:
+            db.execute("INSERT INTO counters (name, value) VALUES (?, ?) "
+                       "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value", (name, by))
+            return db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+
+    def counters(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._db.execute("SELECT name, value FROM counters ORDER BY name"))
+
+    # -- spool (append-only queues) ---------------------------------------
+
+    def spool_append(self, queue: str, records: Iterable[Dict]):
+        rows = [(queue, json.dumps(record)) for record in records]
+        if not rows:
+            return
+        with self.transaction() as db:
+            db.executemany("INSERT INTO spool (queue, record) VALUES (?, ?)", rows)
+
+    def spool_read(self, queue: str, limit: int = -1) -> List[Tuple[int, Dict]]:
+        """Oldest first, as (id, record)"""
+        with self._lock:
+            rows = self._db.execute("SELECT id, record FROM spool WHERE queue = ? ORDER BY id LIMIT ?",
+                                    (queue, limit)).fetchall()
+        return [(row_id, json.loads(record)) for row_id, record in rows]
+
+    def spool_bytes(self, queue: str) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(LENGTH(record)), 0) FROM spool WHERE queue = ?",
+                                    (queue,)).fetchone()[0]
+
+    def spool_delete(self, ids: Iterable[int]):
+        rows = [(row_id,) for row_id in ids]
+        if not rows:
+            return
+        with self.transaction() as db:
+            db.executemany("DELETE FROM spool WHERE id = ?", rows)
@@ -6,36 +6,129 @@ Handles authentication and playlist synchronization with the server
 
 import json
 import os
-import requests
 import hashlib
-from typing import Optional, Dict, List
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Dict, List, Union
+from downloader import DownloadEngine
+from media_cache import MediaCache, item_key
+from scheduler import ScheduleEvaluator
+from playlist import Playlist, PlaylistUpdate
+from peers import PeerSharing
+from bandwidth import BandwidthPolicy, BULK, WAIT
+from downloader import format_duration
+from state_store import StateStore
+
+# Returned by fetch_sync when the server reports no content change
+NOT_MODIFIED = "not-modified"
+# While the push channel is up, polling only guards against missed events
+PUSH_POLL_INTERVAL = 900
+MAX_BACKOFF = 600
+# Servers without the push channel are asked again this rarely
+PUSH_DISABLED_RETRY = 3600
 
 class SyncManager:
     def __init__(self, config_path: str = "/home/pi/signage-player/config.json"):
+        self.config_path = config_path
+        state_dir = os.path.dirname(config_path)
+        os.makedirs(state_dir, exist_ok=True)
+        # Schedule, media index, spool and counters; survives power cuts
+        self.store = StateStore(os.path.join(state_dir, "state.db"))
+        self._import_legacy_state(state_dir)
         self.config = self._load_config(config_path)
         self.server_url = self.config["server_url"]
         self.device_token = self.config["device_token"]
         self.media_dir = self.config.get("media_dir", "/home/pi/signage-player/media")
-        self.playlist_cache = os.path.join(os.path.dirname(config_path), "playlist.json")
+        self._set_schedule(self.load_cached_schedule())
+        # Playlist currently on screen; the stored copy is only read at startup
+        cached = self.load_cached_playlist()
+        self.active: Optional[Playlist] = Playlist(cached) if cached else None
+        self.sync_version = self.store.get("sync_version")
+        self.pending_version = None
+        # Proof-of-play summary to piggyback on the next sync, and its ack
+        self.stats_provider: Optional[Callable[[], Optional[Dict]]] = None
+        self.on_stats_sent: Optional[Callable[[Dict], None]] = None
+        # Hardware summary; the server picks media renditions from it
+        self.capabilities: Optional[Dict] = None
+        # Push channel (/api/device/events): the server answers a held
+        # request as soon as this device's content or pairing changes.
+        # Opt-in, like the server side (DEVICE_PUSH=1)
+        self.push_enabled = self.config.get("push_updates", False)
+        self.events_version: Optional[str] = None
+        self._push_failures = 0
+        self._push_retry_at = 0.0
+        self.sync_failures = 0
         
         # Ensure media directory exists
         os.makedirs(self.media_dir, exist_ok=True)
+
+        self.cache = MediaCache(
+            self.media_dir,
+            budget_bytes=self.config.get("media_budget_mb", 0) * 1024 * 1024,
+            store=self.store,
+        )
+        # Players at the same site fetch each asset from the WAN once
+        self.peers = None
+        if self.config.get("peer_sharing", True):
+            self.peers = PeerSharing(self.config, self.cache.blob_for_hash)
+        # Thin store uplinks: rate limits and off-hours windows for prefetch
+        self.bandwidth = BandwidthPolicy(self.config)
+        self._preempt = threading.Event()
+        self.prefetch_deferred_until: Optional[datetime] = None
+        self.downloader = DownloadEngine(
+            self.cache.staging_dir,
+            max_workers=self.config.get("download_workers", 3),
+            path_for=self.cache.staging_path,
+            on_complete=lambda item, path, digest: self.cache.admit(item, path, digest) is not None,
+            mirrors=self.peers.mirrors if self.peers else None,
+        )
     
     def _load_config(self, config_path: str) -> Dict:
-        """Load configuration from JSON file"""
+        """Load configuration from JSON file.
+
+        The last good config is kept in the state store, so a config.json
+        lost or truncated by a power cut is restored from there.
+        """
+        stored = self.store.get("config")
         try:
             with open(config_path, 'r') as f:
-                return json.load(f)
+                config = json.load(f)
+            if not isinstance(config, dict):
+                raise ValueError("not a JSON object")
         except FileNotFoundError:
-            print(f"ERROR: Config file not found at {config_path}")
-            print("Please create config.json with server_url and device_token")
-            exit(1)
-        except json.JSONDecodeError as e:
-            print(f"ERROR: Invalid JSON in config file: {e}")
-            exit(1)
+            if not stored:
+                print(f"ERROR: Config file not found at {config_path}")
+                print("Please create config.json with server_url and device_token")
+                exit(1)
+            print("[SYNC] config.json missing; restoring the last good copy")
+            config = stored
+            _atomic_write_json(config_path, config)
+        except ValueError as e:
+            if not stored:
+                print(f"ERROR: Invalid JSON in config file: {e}")
+                exit(1)
+            print(f"[SYNC] config.json damaged ({e}); restoring the last good copy")
+            config = stored
+            _atomic_write_json(config_path, config)
+        if config != stored:
+            try:
+                self.store.put("config", config)
+            except sqlite3.Error as e:
+                print(f"[SYNC] Could not keep a copy of config.json: {e}")
+        return config
+
+    def _import_legacy_state(self, state_dir: str):
+        """One-time move of the JSON state files used by earlier releases"""
+        self.store.import_json("sync_version", os.path.join(state_dir, "sync_state.json"), field="version")
+        self.store.import_json("schedule", os.path.join(state_dir, "schedule.json"))
+        self.store.import_json("playlist", os.path.join(state_dir, "playlist.json"))
     
     def register(self) -> Optional[Dict]:
         """Register device and get pairing code"""
+        import requests  # Deferred so playback from cache starts without it
         try:
             url = f"{self.server_url}/api/device/register"
             print(f"[SYNC] Registering device at {url}...")
@@ -54,6 +147,7 @@ class SyncManager:
 
     def poll_status(self, token: str) -> Optional[str]:
         """Check if device is paired"""
+        import requests
         try:
             url = f"{self.server_url}/api/device/status?token={token}"
             response = requests.get(url, timeout=10)
@@ -65,97 +159,130 @@ class SyncManager:
         except Exception:
             return None
 
+    def watch_events(self, token: Optional[str] = None, timeout: int = 50) -> Optional[Dict]:
+        """Long-poll the server until this device's version moves past the
+        last one seen, or ``timeout`` seconds pass. Blocking.
+
+        Returns the server's answer (``version``, ``paired``, ``changed``),
+        or None if the channel is unavailable; failures back off
+        exponentially, see ``push_retry_delay``.
+        """
+        token = token or self.device_token
+        if not (self.push_enabled and token):
+            return None
+        import requests
+        params = {"token": token, "timeout": timeout}
+        if self.events_version:
+            params["since"] = self.events_version
+        try:
+            response = requests.get(f"{self.server_url}/api/device/events", params=params,
+                                    timeout=(10, timeout + 15))
+            if response.status_code == 404:
+                # The server predates the channel or has it switched off
+                # (DEVICE_PUSH); poll, and look again much later
+                if self._push_failures == 0:
+                    print("[SYNC] Push channel disabled on the server; polling instead")
+                self._push_failures += 1
+                self._push_retry_at = time.monotonic() + PUSH_DISABLED_RETRY
+                return None
+            if response.status_code != 200:
+                raise ValueError(f"HTTP {response.status_code}")
+            data = response.json()
+        except Exception as e:
+            self._push_failures += 1
+            delay = min(MAX_BACKOFF, 5 * 2 ** (self._push_failures - 1))
+            self._push_retry_at = time.monotonic() + delay * random.uniform(0.8, 1.2)
+            if self._push_failures == 1:
+                print(f"[SYNC] Push channel unavailable ({e}); polling instead")
+            return None
+        if self._push_failures:
+            print("[SYNC] Push channel connected")
+        self._push_failures = 0
+        self.events_version = data.get("version")
+        return data
+
+    @property
+    def push_ready(self) -> bool:
+        return self.push_enabled and time.monotonic() >= self._push_retry_at
+
+    def push_retry_delay(self) -> float:
+        """Seconds until the push channel may be tried again"""
+        return max(0.0, self._push_retry_at - time.monotonic())
+
+    def next_poll_delay(self) -> float:
+        """Seconds until the next sync poll: slow while push works, backing
+        off while the server fails, jittered so a fleet restarted together
+        does not poll in lockstep"""
+        interval = self.config.get("sync_interval", 60)
+        if self.push_enabled and self._push_failures == 0 and self.events_version:
+            interval = max(interval, PUSH_POLL_INTERVAL)
+        if self.sync_failures:
+            interval = max(interval, min(MAX_BACKOFF, interval * 2 ** self.sync_failures))
+        return interval * random.uniform(0.8, 1.2)
+
     def save_config(self, new_token: str):
         """Update config with new token"""
         self.config["device_token"] = new_token
-        with open("/home/pi/signage-player/config.json", 'w') as f:
-            json.dump(self.config, f, indent=2)
         self.device_token = new_token
+        try:
+            self.store.put("config", self.config)
+            _atomic_write_json(self.config_path, self.config)
+        except (OSError, sqlite3.Error) as e:
+            # Paired for this run; the token is lost on restart if it never lands
+            print(f"[SYNC] Error saving device token: {e}")
+            return
         print("[SYNC] Device token saved to config.json")
 
-    def generate_pairing_image(self, code: str) -> str:
-        """Generate an image with the pairing code using PIL"""
-        try:
-            from PIL import Image, ImageDraw, ImageFont
-            
-            # Create black image 1920x1080
-            width, height = 1920, 1080
-            img = Image.new('RGB', (width, height), color='black')
-            d = ImageDraw.Draw(img)
-            
-            # Try to load a font, fallback to default
-            try:
-                # Common locations for fonts on Linux
-                font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
-                if not os.path.exists(font_path):
-                    font_path = "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf"
-                font = ImageFont.truetype(font_path, 100)
-                small_font = ImageFont.truetype(font_path, 40)
-            except:
-                font = ImageFont.load_default()
-                small_font = ImageFont.load_default()
-            
-            # Draw Text
-            text = f"Pairing Code: {code}"
-            
-            # Calculate text size (rough approximation if getbbox fails)
-            try:
-                text_bbox = d.textbbox((0, 0), text, font=font)
-                text_w = text_bbox[2] - text_bbox[0]
-                text_h = text_bbox[3] - text_bbox[1]
-            except:
-                text_w, text_h = 400, 100
-                
-            x = (width - text_w) / 2
-            y = (height - text_h) / 2
-            
-            d.text((x, y), text, fill=(255, 255, 255), font=font)
-            
-            # Subtitle
-            sub = f"Go to Dashboard > Devices > Pair Device"
-            try:
-                sub_bbox = d.textbbox((0, 0), sub, font=small_font)
-                sub_w = sub_bbox[2] - sub_bbox[0]
-            except:
-                sub_w = 300
-            
-            d.text(((width - sub_w) / 2, y + 150), sub, fill=(200, 200, 200), font=small_font)
-            
-            # Save
-            filepath = os.path.join(self.media_dir, "pairing.png")
-            img.save(filepath)
-            return filepath
-            
-        except ImportError:
-            print("[SYNC] PIL not installed. Cannot generate pairing image.")
-            return None
-        except Exception as e:
-            print(f"[SYNC] Error generating pairing image: {e}")
-            return None
+    def fetch_sync(self) -> Union[Dict, str, None]:
+        """Fetch the full sync payload (schedule, default and legacy playlist).
 
-    def fetch_playlist(self) -> Optional[Dict]:
-        """Fetch playlist from server"""
+        Returns NOT_MODIFIED when the server confirms the cached content is
+        still current (HTTP 304), which costs the server a heartbeat only.
+        """
         if not self.device_token:
             print("[SYNC] No device token. Cannot fetch playlist.")
             return None
-            
+
+        import requests
         try:
             url = f"{self.server_url}/api/device/sync"
             payload = {"device_token": self.device_token}
+            headers = {}
+            # Only claim a version if we still hold the content it describes
+            if self.sync_version and self.schedule_data:
+                payload["since_version"] = self.sync_version
+                headers["If-None-Match"] = f'"{self.sync_version}"'
+            if self.capabilities:
+                payload["capabilities"] = self.capabilities
+            stats = self.stats_provider() if self.stats_provider else None
+            if stats:
+                payload["stats"] = stats
             
             print(f"[SYNC] Fetching playlist from {url}")
-            response = requests.post(url, json=payload, timeout=10)
+            response = requests.post(url, json=payload, headers=headers, timeout=10)
             
-            if response.status_code == 200:
+            if response.status_code in (200, 304):
+                self.sync_failures = 0
+                if stats and self.on_stats_sent:
+                    self.on_stats_sent(stats)
+            else:
+                self.sync_failures += 1
+            if response.status_code == 304:
+                print(f"[SYNC] Content unchanged (version {self.sync_version})")
+                return NOT_MODIFIED
+            elif response.status_code == 200:
                 data = response.json()
                 print(f"[SYNC] Device: {data.get('device_name')}")
+                self.pending_version = data.get('version')
                 
+                if data.get('schedule'):
+                    print(f"[SYNC] Schedule: {data['schedule']['name']} ({len(data['schedule']['items'])} slots)")
                 if data.get('playlist'):
                     print(f"[SYNC] Playlist: {data['playlist']['name']} ({len(data['playlist']['items'])} items)")
-                    return data['playlist']
-                else:
+                if not (data.get('schedule') or data.get('playlist') or data.get('default_playlist')):
                     print("[SYNC] No playlist assigned")
                     return None
+                return data
             elif response.status_code == 401:
                 print("[SYNC] Unauthorized: Invalid token. Device might have been deleted.")
                 # Optional: Clear token?
@@ -165,76 +292,245 @@ class SyncManager:
                 return None
                 
         except requests.exceptions.RequestException as e:
+            self.sync_failures += 1
             print(f"[SYNC] Connection error: {e}")
             return None
     
+    def media_path(self, item: Dict) -> Optional[str]:
+        """Local path of a cached media item, or None if not available"""
+        return self.cache.path_for(item)
+
     def download_media(self, item: Dict) -> bool:
         """Download a media file if not already present"""
-        filename = item['filename']
-        url = item['url']
-        filepath = os.path.join(self.media_dir, filename)
-        
-        # Check if file already exists
-        if os.path.exists(filepath):
-            # print(f"[DOWNLOAD] Skipping {filename} (already exists)")
+        if not self.cache.needs_fetch(item):
             return True
-        
-        try:
-            print(f"[DOWNLOAD] Downloading {filename}...")
-            response = requests.get(url, stream=True, timeout=30)
-            
-            if response.status_code == 200:
-                with open(filepath, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                print(f"[DOWNLOAD] ✓ {filename} downloaded")
-                return True
-            else:
-                print(f"[DOWNLOAD] ✗ Failed to download {filename}: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            print(f"[DOWNLOAD] ✗ Error downloading {filename}: {e}")
+        ok = self.downloader.download(item)
+        self.cache.save()
+        return ok
+
+    def _missing(self, items: List[Dict]) -> Dict[str, Dict]:
+        pending = {}
+        for item in items:
+            if self.cache.needs_fetch(item):
+                pending.setdefault(item_key(item), item)
+        return pending
+
+    def _download_missing(self, items: List[Dict],
+                          throttle: Optional[Callable[[int], None]] = None) -> bool:
+        """Fetch missing or changed items, making room in the cache first"""
+        pending = self._missing(items)
+        if not pending:
+            return True
+
+        needed = sum(i.get('size') or 0 for i in pending.values())
+        if not self.cache.ensure_space(needed):
+            print(f"[SYNC] Not enough space for {needed / 1e6:.1f} MB of new media. Keeping current content.")
             return False
+
+        results = self.downloader.download_all(list(pending.values()), throttle)
+        self.cache.save()
+        return all(results.values())
     
-    def sync(self) -> bool:
-        """Sync playlist and download new media"""
-        playlist = self.fetch_playlist()
+    def refresh(self) -> Optional[bool]:
+        """Fetch and cache the sync payload without downloading media.
+
+        Returns True if the content changed, False if it did not, and None
+        if the server could not be reached or assigned nothing.
+        """
+        data = self.fetch_sync()
         
-        if not playlist:
-            # print("[SYNC] No playlist to sync")
+        if data == NOT_MODIFIED:
             return False
+        if not data:
+            # print("[SYNC] No playlist to sync")
+            return None
         
-        # Download all media files
+        # Cache the whole schedule so it can be evaluated offline. The
+        # version is stored with it: failed downloads are retried on
+        # NOT_MODIFIED syncs as well.
+        changed = data != self.schedule_data
+        state = {}
+        if changed:
+            # New content may be needed now: stop trickling old prefetch
+            self.interrupt_prefetch()
+            state["schedule"] = data
+        if self.pending_version != self.sync_version:
+            state["sync_version"] = self.pending_version
+        if state:
+            try:
+                self.store.put_many(state)
+                self.sync_version = self.pending_version
+            except sqlite3.Error as e:
+                print(f"[SYNC] Error saving schedule: {e}")
+        if changed:
+            self._set_schedule(data)
+        
+        playlists = scheduled_playlists(data)
+        self.cache.set_references(playlists)
+        # After a lost index the blobs are still on disk: verify and reuse
+        # them rather than download everything again. The same goes for
+        # files stored by name before an upgrade, which must be migrated
+        # before cleanup_media purges strays.
+        adopted = [item for playlist in playlists for item in playlist.get('items', [])
+                   if self.cache.needs_fetch(item)
+                   and (self.cache.adopt(item) or self.cache.migrate_legacy(item))]
+        if adopted:
+            self.cache.set_references(playlists)
+            self.cache.save()
+        return changed
+
+    def sync(self, prefetch: bool = True) -> Optional[PlaylistUpdate]:
+        """Sync schedule and playlists and download new media.
+
+        Returns the active playlist (with its fingerprint and the ids of
+        items that changed), or None if there is nothing to play. With
+        ``prefetch=False`` only the active and next slot are downloaded.
+        """
+        changed = self.refresh()
+        if changed is None:
+            return self.apply_schedule()
+        
+        # Download new or changed media files in parallel
+        self.download_scheduled(prefetch)
+        update = self.apply_schedule()
+        if changed:
+            self.cleanup_media()
+        return update
+
+    def cleanup_media(self):
+        """Drop unreferenced media once over budget, plus leftovers from
+        releases that stored files by name"""
+        self.cache.enforce_budget()
+        self.cache.purge_strays()
+        self.cache.save()
+
+    def _set_schedule(self, data: Optional[Dict]):
+        self.schedule_data = data
+        data = data or {}
+        self.evaluator = ScheduleEvaluator(
+            data.get('schedule'),
+            data.get('playlist') or data.get('default_playlist'),
+        )
+
+    def load_cached_schedule(self) -> Optional[Dict]:
+        """Load the last sync payload from local cache"""
+        return self.store.get("schedule")
+
+    def download_scheduled(self, prefetch: bool = True) -> bool:
+        """Fetch media for the active and the next slot right away, then
+        prefetch later slots as the bandwidth policy allows"""
+        self._preempt.clear()
+        now = datetime.now()
+        horizon = timedelta(hours=self.config.get("prefetch_hours", 24))
+        slots = self.evaluator.upcoming_slots(now, horizon=horizon)
+        urgent = [playlist for at, playlist in slots if at <= now]
+        later = [(at, playlist) for at, playlist in slots if at > now]
+        if later:
+            urgent.append(later.pop(0)[1])
+
         success = True
-        for item in playlist['items']:
-            if not self.download_media(item):
+        for playlist in urgent:
+            success = self._download_missing(playlist['items'], self.bandwidth.throttle()) and success
+        if not prefetch:
+            return success
+
+        self.prefetch_deferred_until = None
+        for at, playlist in later:
+            if self._preempt.is_set():
+                return False
+            missing = self._missing(playlist['items'])
+            if not missing:
+                continue
+            nbytes = sum(i.get('size') or 0 for i in missing.values())
+            mode = self.bandwidth.plan(nbytes, at, now)
+            if self.bandwidth.limited:
+                eta = self.bandwidth.eta(nbytes, mode, now)
+                print(f"[DOWNLOAD] Prefetch for {at:%a %H:%M}: {len(missing)} file(s), "
+                      f"{nbytes / 1e6:.1f} MB, {mode}"
+                      + (f", ETA {format_duration(eta)}" if eta is not None else ""))
+            if mode == WAIT:
+                self.prefetch_deferred_until = self.bandwidth.next_window(now)
                 success = False
-        
-        # Save playlist to cache
+                continue
+            throttle = self.bandwidth.throttle(bulk=mode == BULK, cancelled=self._preempt.is_set)
+            if not self._download_missing(playlist['items'], throttle):
+                success = False
+                if self.bandwidth.windows:
+                    # Possibly paused when the window closed; resume at the next
+                    self.prefetch_deferred_until = self.bandwidth.next_window()
+        return success
+
+    def interrupt_prefetch(self):
+        """Pause bulk prefetch so that a new download pass can start"""
+        self._preempt.set()
+
+    def prefetch_delay(self) -> Optional[float]:
+        """Seconds until deferred prefetch may run, or None if none is waiting"""
+        if self.prefetch_deferred_until is None:
+            return None
+        return max(0.0, (self.prefetch_deferred_until - datetime.now()).total_seconds())
+
+    def next_transition(self) -> Optional[datetime]:
+        """When the active playlist may next change, per the cached schedule"""
+        return self.evaluator.next_transition()
+
+    def apply_schedule(self) -> Optional[PlaylistUpdate]:
+        """Make the currently scheduled playlist the active one.
+
+        The returned update is falsy when the content did not change; the
+        stored copy is rewritten only when it did. Works offline.
+        """
+        data = self.evaluator.active_playlist()
+        if not data:
+            # Nothing scheduled right now: keep showing the last content
+            return PlaylistUpdate(self.active, set()) if self.active else None
+        if self.active and self.active.data is data:
+            return PlaylistUpdate(self.active, set())
+
+        playlist = Playlist(data)
+        if self.active and self.active.fingerprint == playlist.fingerprint:
+            self.active = playlist
+            return PlaylistUpdate(playlist, set())
+
+        changed = playlist.changed_items(self.active)
+        self.active = playlist
         try:
-            with open(self.playlist_cache, 'w') as f:
-                json.dump(playlist, f, indent=2)
-            print(f"[SYNC] Playlist cached to {self.playlist_cache}")
-        except Exception as e:
+            self.store.put("playlist", data)
+        except sqlite3.Error as e:
             print(f"[SYNC] Error saving playlist cache: {e}")
-            success = False
-        
-        # TODO: Clean up old media files not in current playlist
-        
-        return success
+        print(f"[SYNC] Now playing {playlist.name} ({len(changed)} item(s) changed)")
+        return PlaylistUpdate(playlist, changed)
     
     def load_cached_playlist(self) -> Optional[Dict]:
         """Load playlist from local cache"""
-        try:
-            with open(self.playlist_cache, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
+        playlist = self.store.get("playlist")
+        if playlist is None:
             print("[SYNC] No cached playlist found")
-            return None
-        except json.JSONDecodeError as e:
-            print(f"[SYNC] Error reading cached playlist: {e}")
-            return None
+        return playlist
+
+
+def scheduled_playlists(data: Dict) -> List[Dict]:
+    """Every playlist referenced by a sync payload"""
+    playlists = [data.get('playlist'), data.get('default_playlist')]
+    for slot in (data.get('schedule') or {}).get('items', []):
+        playlists.append(slot.get('playlist'))
+    return [p for p in playlists if p]
+
+
+def _atomic_write_json(path: str, data: Dict):
+    """Write JSON so readers never observe a partially written file"""
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    # Make the rename itself durable
+    fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
 if __name__ == "__main__":
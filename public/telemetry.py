@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Telemetry Module
+Batched, compressed log shipping with an offline spool
+"""
+
+import gzip
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional
+
+from state_store import StateStore
+
+# Lower value = more important; dropped last under pressure
+PRIORITY = {"error": 0, "warning": 1, "info": 2}
+# The server stores at most this many logs per request
+BATCH_SIZE = 50
+# Queue name in the state store's spool
+SPOOL = "telemetry"
+
+
+class Telemetry:
+    """Non-blocking event logger that ships batches to /api/device/logs.
+
+    ``log()`` only appends to a bounded in-memory queue, so it is safe to
+    call from the playback path and from any thread. ``flush()`` (run by the
+    player's telemetry task) sends gzip-compressed batches; while the server
+    is unreachable they go to a spool of bounded size in the state store and
+    are replayed, oldest first, once a send succeeds again. When the queue or
+    the spool is full, the least important and then oldest events go first.
+    """
+
+    def __init__(self, server_url: str, token_getter: Callable[[], Optional[str]],
+                 store: StateStore, max_queue: int = 500,
+                 spool_max_bytes: int = 1024 * 1024,
+                 max_backoff: float = 300.0):
+        self.server_url = server_url
+        self.token_getter = token_getter
+        self.store = store
+        self.max_queue = max_queue
+        self.spool_max_bytes = spool_max_bytes
+        self.max_backoff = max_backoff
+        self.on_ready: Optional[Callable[[], None]] = None
+        self.dropped = 0
+        self._queue: Deque[Dict] = deque()
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._retry_at = 0.0
+        self._session = None  # requests.Session, created on first send
+
+    # -- producer side ----------------------------------------------------
+
+    def log(self, level: str, message: str, timestamp: Optional[str] = None):
+        """Queue an event. Never blocks on I/O."""
+        record = {
+            "level": level if level in PRIORITY else "info",
+            "message": message,
+            "timestamp": timestamp or datetime.now().isoformat(),
+        }
+        with self._lock:
+            if len(self._queue) >= self.max_queue and not self._make_room(record):
+                self.dropped += 1
+                return
+            self._queue.append(record)
+            ready = len(self._queue) >= BATCH_SIZE or record["level"] == "error"
+        if ready and self.on_ready:
+            self.on_ready()
+
+    def _make_room(self, incoming: Dict) -> bool:
+        """Drop the oldest least-important event if it ranks below incoming"""
+        victim = max(self._queue, key=lambda r: PRIORITY[r["level"]])
+        if PRIORITY[victim["level"]] < PRIORITY[incoming["level"]]:
+            return False
+        # First (oldest) event of that level
+        victim = next(r for r in self._queue if r["level"] == victim["level"])
+        self._queue.remove(victim)
+        self.dropped += 1
+        return True
+
+    # -- consumer side ----------------------------------------------------
+
+    def next_delay(self, interval: float) -> float:
+        """Seconds until the next flush should run"""
+        return max(interval, self._retry_at - time.monotonic())
+
+    def flush(self) -> bool:
+        """Send queued events, then replay the spool. Blocking."""
+        with self._lock:
+            pending = list(self._queue)
+            self._queue.clear()
+        if not pending and not self._spooled_bytes():
+            return True
+        if time.monotonic() < self._retry_at:
+            self._spool(pending)
+            return False
+
+        for start in range(0, len(pending), BATCH_SIZE):
+            if not self._send(pending[start:start + BATCH_SIZE]):
+                self._spool(pending[start:])
+                self._backoff()
+                return False
+
+        if not self._replay():
+            self._backoff()
+            return False
+        self._failures = 0
+        self._retry_at = 0.0
+        return True
+
+    def persist(self):
+        """Move queued events to the spool without touching the network"""
+        with self._lock:
+            pending = list(self._queue)
+            self._queue.clear()
+        self._spool(pending)
+
+    def _backoff(self):
+        self._failures += 1
+        delay = min(self.max_backoff, 5 * 2 ** (self._failures - 1))
+        self._retry_at = time.monotonic() + delay * random.uniform(0.8, 1.2)
+
+    def _send(self, batch: List[Dict]) -> bool:
+        """True once the batch is settled: delivered, or rejected by the server
+        (4xx), in which case resending cannot help and it is dropped. False
+        when it should be retried (network error, 5xx, 408/429)."""
+        token = self.token_getter()
+        if not token or not batch:
+            return not batch
+        body = gzip.compress(json.dumps({"device_token": token, "logs": batch}).encode())
+        import requests  # Deferred: not needed to start playback
+        if self._session is None:
+            self._session = requests.Session()
+        try:
+            response = self._session.post(
+                f"{self.server_url}/api/device/logs",
+                data=body,
+                headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+                timeout=10,
+            )
+            status = response.status_code
+            if 400 <= status < 500 and status not in (408, 429):
+                self.dropped += len(batch)
+                print(f"[TELEMETRY] Server rejected {len(batch)} event(s) ({status}); dropping them")
+                return True
+            return status == 200
+        except requests.exceptions.RequestException as e:
+            print(f"[TELEMETRY] Send failed: {e}")
+            return False
+
+    # -- offline spool ----------------------------------------------------
+
+    def import_spool(self, path: str):
+        """Move a spool file left by an earlier release into the store"""
+        if not os.path.exists(path):
+            return
+        records = []
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue  # Torn write from a power cut
+            self._spool(records)
+            os.remove(path)
+        except OSError as e:
+            print(f"[TELEMETRY] Could not import {path}: {e}")
+
+    def _spooled_bytes(self) -> int:
+        try:
+            return self.store.spool_bytes(SPOOL)
+        except sqlite3.Error:
+            return 0
+
+    def _spool(self, records: List[Dict]):
+        if not records:
+            return
+        try:
+            self.store.spool_append(SPOOL, records)
+            if self.store.spool_bytes(SPOOL) > self.spool_max_bytes:
+                self._compact()
+        except sqlite3.Error as e:
+            print(f"[TELEMETRY] Spool write failed: {e}")
+
+    def _compact(self):
+        """Shrink the spool to half its cap, dropping info before warnings
+        before errors, oldest first"""
+        rows = self.store.spool_read(SPOOL)
+        budget = self.spool_max_bytes // 2
+        ranked = sorted(range(len(rows)),
+                        key=lambda i: (PRIORITY.get(rows[i][1].get("level"), 2), -i))
+        keep, used = set(), 0
+        for i in ranked:
+            size = len(json.dumps(rows[i][1]))
+            if used + size > budget:
+                continue
+            keep.add(i)
+            used += size
+        drop = [row_id for i, (row_id, _) in enumerate(rows) if i not in keep]
+        self.dropped += len(drop)
+        self.store.spool_delete(drop)
+
+    def _replay(self) -> bool:
+        try:
+            rows = self.store.spool_read(SPOOL)
+        except sqlite3.Error as e:
+            print(f"[TELEMETRY] Spool unreadable: {e}")
+            return True
+        if not rows:
+            return True
+        print(f"[TELEMETRY] Replaying {len(rows)} spooled event(s)")
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            if not self._send([record for _, record in batch]):
+                return False
+            try:
+                self.store.spool_delete(row_id for row_id, _ in batch)
+            except sqlite3.Error as e:
+                # Sent already; at worst the batch is sent again next time
+                print(f"[TELEMETRY] Could not clear spooled events: {e}")
+        return True
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Timeline Module
+Per-item playback timing and wall-clock alignment of the playlist loop
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from mpv_ipc import Entry, MpvIpcClient, MpvIpcError
+
+# Property observer ids (the watchdog uses 1-7, metrics 101-105)
+OBSERVED_PROPERTIES = {201: "playlist-pos", 202: "duration"}
+# How far ahead of its slot an image may be held on screen. Also how long mpv
+# keeps an image up by itself if the clock misses a deadline.
+MAX_HOLD = 10.0
+# Drift below this is left alone: a correction would be more visible
+RESYNC_THRESHOLD = 0.5
+WARM_BLOCK = 1024 * 1024
+
+
+def _seconds(value: float) -> str:
+    return f"{value:g}"
+
+
+class TimelineEntry:
+    __slots__ = ("path", "item", "image", "duration", "offset")
+
+    def __init__(self, path: str, item: Dict, image: bool, duration: Optional[float]):
+        self.path = path
+        self.item = item
+        self.image = image
+        # None for a video whose length is not known yet
+        self.duration = duration
+        self.offset: Optional[float] = None
+
+
+class Timeline:
+    """The playlist as timed entries laid out over one loop (``cycle``).
+
+    ``cycle`` is None until the length of every video is known; until then
+    the loop cannot be aligned to the wall clock and items run back to back.
+    """
+
+    def __init__(self, entries: List[TimelineEntry]):
+        self.entries = entries
+        self.cycle: Optional[float] = None
+        self._layout()
+
+    def _layout(self):
+        offset: Optional[float] = 0.0
+        for entry in self.entries:
+            entry.offset = offset
+            if offset is not None:
+                offset = None if entry.duration is None else offset + entry.duration
+        self.cycle = offset if offset else None
+
+    def set_length(self, index: int, seconds: float) -> bool:
+        """Record a video's real length; True if the layout changed"""
+        entry = self.entries[index]
+        if entry.image or (entry.duration is not None and abs(entry.duration - seconds) < 0.05):
+            return False
+        entry.duration = seconds
+        self._layout()
+        return True
+
+    @property
+    def items(self) -> Dict[str, Dict]:
+        return {entry.path: entry.item for entry in self.entries}
+
+    @property
+    def still_allowances(self) -> Dict[int, float]:
+        """Playlist index -> extra time that image may hold one position
+        without being stalled (videos get none)"""
+        return {index: e.duration + MAX_HOLD for index, e in enumerate(self.entries) if e.image}
+
+    def mpv_entries(self) -> List[Entry]:
+        """Entries for IPC playback, where the clock advances images.
+
+        Images get their duration plus ``MAX_HOLD`` so that mpv still moves
+        on by itself if a deadline is ever missed.
+        """
+        return [(e.path, {"image-display-duration": _seconds(e.duration + MAX_HOLD)} if e.image else {})
+                for e in self.entries]
+
+    def cli_args(self) -> List[str]:
+        """Command-line playlist with per-file option blocks, for playback without IPC"""
+        args: List[str] = []
+        for entry in self.entries:
+            if entry.image:
+                args += ["--{", f"--image-display-duration={_seconds(entry.duration)}", entry.path, "--}"]
+            else:
+                args.append(entry.path)
+        return args
+
+    def expected_start(self, index: int, at: float, anchor: float) -> Optional[float]:
+        """Wall time of the slot of entry ``index`` closest to ``at``"""
+        entry = self.entries[index]
+        if not self.cycle or entry.offset is None:
+            return None
+        base = anchor + entry.offset
+        return base + round((at - base) / self.cycle) * self.cycle
+
+    def position(self, at: float, anchor: float) -> Optional[Tuple[int, float]]:
+        """Entry that should be on screen at ``at`` and how far into it"""
+        if not self.cycle:
+            return None
+        into_cycle = (at - anchor) % self.cycle
+        for index, entry in enumerate(self.entries):
+            if into_cycle < entry.offset + entry.duration:
+                return index, into_cycle - entry.offset
+        return len(self.entries) - 1, 0.0
+
+
+def build_timeline(playlist, media_path: Callable[[Dict], Optional[str]],
+                   length_for: Callable[[Dict], Optional[float]],
+                   image_duration: float = 10) -> Timeline:
+    """Timed entries for the cached items of ``playlist``, in play order"""
+    entries = []
+    for item in playlist.items:
+        # The cache index only lists blobs that were verified on disk
+        path = media_path(item.data)
+        if not path:
+            continue
+        if item.type == "image":
+            entries.append(TimelineEntry(path, item.data, True, float(item.duration or image_duration)))
+        else:
+            entries.append(TimelineEntry(path, item.data, False, length_for(item.data)))
+    return Timeline(entries)
+
+
+def warm(path: str):
+    """Pull a file into the page cache so mpv opens and decodes it without waiting on storage"""
+    try:
+        with open(path, 'rb') as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            while f.read(WARM_BLOCK):
+                pass
+    except OSError:
+        pass
+
+
+class TimelineClock:
+    """Keeps the playlist loop on a fixed wall-clock grid.
+
+    Every entry has a slot at ``anchor + offset + k * cycle``. When an entry
+    shows its first frame (``playback-restart``) the clock compares that
+    moment with the entry's slot: images are advanced with ``playlist-next``
+    at the absolute end of their slot, so lateness is absorbed instead of
+    accumulated; videos that are off by more than ``RESYNC_THRESHOLD`` are
+    seeked forward or held on their first frame. Screens with synchronised
+    clocks, the same playlist and the same anchor therefore show the same
+    item at the same time, however long the loop runs.
+
+    Events arrive on the IPC reader thread; all mpv commands are issued from
+    the clock's own thread.
+    """
+
+    def __init__(self, ipc: MpvIpcClient, anchor: float = 0.0, align: bool = True,
+                 on_length: Optional[Callable[[Dict, float], None]] = None):
+        self.ipc = ipc
+        self.anchor = anchor
+        self.align = align
+        self.on_length = on_length
+        # Follower in a screen sync group: the leader decides what plays
+        # when, so only lengths are learned and images warmed
+        self.passive = False
+        self.timeline: Optional[Timeline] = None
+        self.last_drift: Optional[float] = None
+        self._pos: Optional[int] = None
+        self._starting = False
+        self._events: List[Tuple] = []
+        self._deadline: Optional[float] = None
+        self._action: Optional[Tuple[str, int]] = None
+        self._armed = False
+        self._changed = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        ipc.listeners.append(self._on_event)
+
+    def attach(self):
+        """Subscribe on a freshly connected mpv and jump to the current slot"""
+        for observer_id, name in OBSERVED_PROPERTIES.items():
+            self.ipc.observe_property(observer_id, name)
+        with self._changed:
+            self._pos = None
+            self._starting = False
+            self._events = []
+            self._deadline = self._action = None
+            self._armed = True
+            self._changed.notify_all()
+        if not self._thread or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self.jump()
+
+    def detach(self):
+        with self._changed:
+            self._armed = False
+            self._deadline = self._action = None
+            self._changed.notify_all()
+
+    def set_timeline(self, timeline: Timeline):
+        with self._changed:
+            self.timeline = timeline
+
+    def jump(self):
+        """Start the entry whose slot is now (no-op while the loop length is unknown)"""
+        timeline = self.timeline
+        if self.passive or not timeline or not self.align:
+            return
+        position = timeline.position(time.time(), self.anchor)
+        if position:
+            try:
+                self.ipc.command("playlist-play-index", position[0])
+            except MpvIpcError as e:
+                print(f"[TIMELINE] Could not jump to slot: {e}")
+
+    # -- events (IPC reader thread) -----------------------------------------
+
+    def _on_event(self, message: Dict):
+        event = message.get("event")
+        with self._changed:
+            if event == "property-change" and message.get("id") in OBSERVED_PROPERTIES:
+                if message.get("name") == "playlist-pos":
+                    self._pos = message.get("data")
+                elif message.get("data") and self._pos is not None:
+                    self._events.append(("length", self._pos, float(message["data"])))
+            elif event == "start-file":
+                self._starting = True
+                self._deadline = self._action = None
+            elif event == "playback-restart" and self._starting and self._pos is not None:
+                # First frame of a new entry (later restarts are seeks)
+                self._starting = False
+                self._events.append(("start", self._pos, time.time()))
+            else:
+                return
+            self._changed.notify_all()
+
+    # -- clock thread -------------------------------------------------------
+
+    def _run(self):
+        while True:
+            with self._changed:
+                while not (self._armed and self._events):
+                    if self._armed and self._deadline is not None:
+                        # Re-read the wall clock at least every second so an
+                        # NTP step moves the deadline with it
+                        remaining = self._deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        self._changed.wait(min(remaining, 1.0))
+                    else:
+                        self._changed.wait()
+                events, self._events = self._events, []
+                action = None
+                if not events:
+                    action, self._deadline, self._action = self._action, None, None
+                timeline = self.timeline
+            try:
+                for event in events:
+                    if timeline and 0 <= event[1] < len(timeline.entries):
+                        getattr(self, "_" + event[0])(timeline, *event[1:])
+                if action:
+                    self._fire(*action)
+            except MpvIpcError as e:
+                print(f"[TIMELINE] {e}")
+
+    def _length(self, timeline: Timeline, index: int, seconds: float):
+        if timeline.set_length(index, seconds):
+            if self.on_length:
+                self.on_length(timeline.entries[index].item, seconds)
+            if timeline.cycle:
+                print(f"[TIMELINE] Loop length {timeline.cycle:.1f}s")
+
+    def _start(self, timeline: Timeline, index: int, started: float):
+        entry = timeline.entries[index]
+        slot = timeline.expected_start(index, started, self.anchor) if self.align else None
+        drift = started - slot if slot is not None else 0.0
+        self.last_drift = drift if slot is not None else None
+
+        following = timeline.entries[(index + 1) % len(timeline.entries)]
+        if following.image and following.path != entry.path:
+            threading.Thread(target=warm, args=(following.path,), daemon=True).start()
+
+        if self.passive:
+            return
+        if entry.image:
+            # Absolute end of the slot; free-running until the loop is known
+            end = (slot if slot is not None else started) + entry.duration
+            if -drift > MAX_HOLD:
+                self.jump()
+            else:
+                self._schedule(end, "next", index)
+            return
+
+        if slot is None or abs(drift) < RESYNC_THRESHOLD:
+            return
+        if drift < -MAX_HOLD or drift > entry.duration - RESYNC_THRESHOLD:
+            self.jump()
+        elif drift > 0:
+            self.ipc.command("seek", round(time.time() - slot, 3), "absolute+exact")
+        else:
+            self.ipc.set_property("pause", True)
+            self._schedule(slot, "resume", index)
+
+    def _schedule(self, at: float, action: str, index: int):
+        with self._changed:
+            self._deadline = at
+            self._action = (action, index)
+            self._changed.notify_all()
+
+    def _fire(self, action: str, index: int):
+        if self._pos != index:
+            return  # Something else moved playback on meanwhile
+        if action == "next":
+            # Wraps to the first entry under --loop-playlist
+            self.ipc.command("playlist-next")
+        elif action == "resume":
+            self.ipc.set_property("pause", False)
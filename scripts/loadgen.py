@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Digital Signage Player - Fleet Load Generator
+Simulates many players against the device API and reports latency per endpoint
+
+Each virtual player speaks the same protocol as public/sync.py: optional
+pairing (register, then status polls), an initial sync, media downloads
+(some resumed with a Range request), then periodic syncs that carry the
+last version (answered 304 while nothing changed), capabilities and a
+proof-of-play summary. With --push the players hold /api/device/events
+open and sync slowly, like players on a server with the push channel.
+
+Seed a database first (node scripts/seed-load.js --devices N), then e.g.:
+
+    python3 scripts/loadgen.py --url http://localhost:3000 --devices 2000 \\
+        --ramp 60 --duration 300 --json run.json
+    python3 scripts/loadgen.py ... --compare run.json   # exit 1 on regression
+
+Only the standard library is used, so it runs anywhere Python 3.8+ does.
+Raise the open file limit (ulimit -n) for more than ~1000 players.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+CAPABILITY_MIX = [
+    # (weight, capabilities) - roughly a mixed Pi 3 / Pi 4 / Pi 5 fleet
+    (3, {"display": {"width": 1920, "height": 1080}, "hwdec_codecs": ["h264"],
+         "max_video_height": 1080, "max_fps": 30, "ram_mb": 1024, "board": "Raspberry Pi 3 Model B Plus"}),
+    (5, {"display": {"width": 1920, "height": 1080}, "hwdec_codecs": ["h264", "hevc"],
+         "max_video_height": 1080, "max_fps": 60, "ram_mb": 4096, "board": "Raspberry Pi 4 Model B"}),
+    (2, {"display": {"width": 3840, "height": 2160}, "hwdec_codecs": ["hevc"],
+         "max_video_height": 2160, "max_fps": 60, "ram_mb": 8192, "board": "Raspberry Pi 5 Model B"}),
+]
+READ_BLOCK = 256 * 1024
+
+
+class HttpError(Exception):
+    pass
+
+
+class Connection:
+    """Minimal keep-alive HTTP/1.1 client; one request at a time"""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, target: str, body: Optional[bytes] = None,
+                      headers: Optional[Dict[str, str]] = None,
+                      timeout: Optional[float] = None) -> Tuple[int, Dict[str, str], bytes]:
+        # A server may close an idle keep-alive connection at any time:
+        # retry once on a fresh connection before reporting an error
+        for attempt in (0, 1):
+            fresh = self.writer is None
+            try:
+                if fresh:
+                    self.reader, self.writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port), self.timeout)
+                return await asyncio.wait_for(self._exchange(method, target, body, headers or {}),
+                                              timeout or self.timeout)
+            except (OSError, asyncio.IncompleteReadError, HttpError, asyncio.TimeoutError):
+                self.close()
+                if fresh or attempt:
+                    raise
+        raise HttpError("unreachable")
+
+    async def _exchange(self, method, target, body, headers):
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                 "User-Agent: signage-loadgen", "Accept-Encoding: identity"]
+        if body is not None:
+            lines += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + (body or b""))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise HttpError("connection closed")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if method == "HEAD" or status in (204, 304):
+            data = b""
+        elif response_headers.get("transfer-encoding", "").lower() == "chunked":
+            data = await self._read_chunked()
+        elif "content-length" in response_headers:
+            data = await self._read_exactly(int(response_headers["content-length"]))
+        else:
+            data = await self.reader.read()
+            response_headers["connection"] = "close"
+        if response_headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, response_headers, data
+
+    async def _read_exactly(self, length: int) -> bytes:
+        # Media bodies are drained in blocks rather than held whole
+        if length <= READ_BLOCK:
+            return await self.reader.readexactly(length)
+        while length:
+            block = await self.reader.readexactly(min(length, READ_BLOCK))
+            length -= len(block)
+        return b""
+
+    async def _read_chunked(self) -> bytes:
+        parts = []
+        while True:
+            size = int((await self.reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await self.reader.readline()
+                return b"".join(parts)
+            parts.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Counter = Counter()
+        self.bytes = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.started = time.monotonic()
+
+    def begin(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def end(self, endpoint: str, seconds: float, status: Optional[int]):
+        self.in_flight -= 1
+        self.latencies[endpoint].append(seconds * 1000)
+        if status is None:
+            self.errors[endpoint] += 1
+            self.statuses[endpoint]["error"] += 1
+        else:
+            self.statuses[endpoint][str(status)] += 1
+            if status >= 500 or status in (401, 403, 429):
+                self.errors[endpoint] += 1
+
+    def report(self) -> Dict:
+        elapsed = time.monotonic() - self.started
+        endpoints = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            endpoints[endpoint] = {
+                "count": len(values),
+                "errors": self.errors[endpoint],
+                "error_rate": round(self.errors[endpoint] / len(values), 4),
+                "rps": round(len(values) / elapsed, 2),
+                "p50_ms": round(percentile(values, 50), 1),
+                "p90_ms": round(percentile(values, 90), 1),
+                "p99_ms": round(percentile(values, 99), 1),
+                "max_ms": round(values[-1], 1),
+                "status": dict(self.statuses[endpoint]),
+            }
+        return {
+            "elapsed_s": round(elapsed, 1),
+            "requests": sum(len(v) for v in self.latencies.values()),
+            "rps": round(sum(len(v) for v in self.latencies.values()) / elapsed, 2),
+            "downloaded_mb": round(self.bytes / 1e6, 1),
+            "max_in_flight": self.max_in_flight,
+            "endpoints": endpoints,
+        }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return values[rank]
+
+
+class VirtualPlayer:
+    def __init__(self, index: int, args, stats: Stats, stop: asyncio.Event):
+        self.index = index
+        self.args = args
+        self.stats = stats
+        self.stop = stop
+        self.token = f"{args.token_prefix}{index}"
+        self.version: Optional[str] = None
+        self.events_version: Optional[str] = None
+        self.capabilities = random.choices([c for _, c in CAPABILITY_MIX],
+                                           weights=[w for w, _ in CAPABILITY_MIX])[0]
+        url = urlsplit(args.url)
+        self.origin = (url.hostname, url.port or 80)
+        self.connection = Connection(url.hostname, url.port or 80, args.timeout)
+        # Long-polls get their own connection, as a player's push thread does
+        self.events_connection = Connection(url.hostname, url.port or 80, args.timeout)
+
+    async def call(self, endpoint: str, method: str, target: str, payload=None,
+                   headers=None, connection: Optional[Connection] = None, timeout=None):
+        body = json.dumps(payload).encode() if payload is not None else None
+        self.stats.begin()
+        started = time.monotonic()
+        status = None
+        try:
+            status, response_headers, data = await (connection or self.connection).request(
+                method, target, body, headers, timeout)
+            if method == "GET" and endpoint.startswith("download"):
+                self.stats.bytes += int(response_headers.get("content-length") or 0)
+            return status, data
+        except (OSError, asyncio.IncompleteReadError, HttpError, asyncio.TimeoutError, ValueError):
+            return None, b""
+        finally:
+            self.stats.end(endpoint, time.monotonic() - started, status)
+
+    async def sleep(self, seconds: float) -> bool:
+        """False once the run is over"""
+        try:
+            await asyncio.wait_for(self.stop.wait(), seconds)
+            return False
+        except asyncio.TimeoutError:
+            return True
+
+    async def run(self):
+        if not await self.sleep(random.uniform(0, self.args.ramp)):
+            return
+        try:
+            if random.random() < self.args.pair_fraction:
+                await self.pair()
+            items = await self.sync(initial=True)
+            if items and random.random() < self.args.download_fraction:
+                await self.download(items)
+            if self.args.push:
+                await asyncio.gather(self.sync_loop(), self.push_loop())
+            else:
+                await self.sync_loop()
+        finally:
+            self.connection.close()
+            self.events_connection.close()
+
+    async def pair(self):
+        """Register like an unpaired player, then poll status a few times"""
+        status, data = await self.call("register", "POST", "/api/device/register", {})
+        if status != 200:
+            return
+        registration = json.loads(data)
+        interval = registration.get("poll_interval", 5000) / 1000.0
+        query = urlencode({"token": registration["device_token"]})
+        for _ in range(self.args.pair_polls):
+            if not await self.sleep(interval * random.uniform(0.9, 1.1)):
+                return
+            await self.call("status", "GET", f"/api/device/status?{query}")
+
+    async def sync(self, initial: bool = False) -> List[Dict]:
+        payload = {"device_token": self.token, "capabilities": self.capabilities}
+        headers = {}
+        if self.version:
+            payload["since_version"] = self.version
+            headers["If-None-Match"] = f'"{self.version}"'
+        if not initial and random.random() < self.args.stats_fraction:
+            payload["stats"] = fake_summary(self.args.sync_interval)
+        status, data = await self.call("sync" if not initial else "sync (initial)", "POST",
+                                       "/api/device/sync", payload, headers)
+        if status != 200:
+            return []
+        data = json.loads(data)
+        self.version = data.get("version")
+        playlists = [data.get("playlist"), data.get("default_playlist")]
+        playlists += [slot.get("playlist") for slot in (data.get("schedule") or {}).get("items", [])]
+        items = {}
+        for playlist in filter(None, playlists):
+            for item in playlist.get("items", []):
+                items.setdefault(item.get("url"), item)
+        return list(items.values())
+
+    async def download(self, items: List[Dict]):
+        for item in random.sample(items, min(len(items), self.args.max_downloads)):
+            url = urlsplit(item.get("url") or "")
+            if (url.hostname, url.port or 80) != self.origin:
+                continue  # Blob storage or a remote URL: not this server's load
+            target = url.path + (f"?{url.query}" if url.query else "")
+            headers = {}
+            size = item.get("size") or 0
+            endpoint = "download"
+            if size > 1 and random.random() < self.args.range_fraction:
+                # A download resumed after a dropped connection
+                headers["Range"] = f"bytes={random.randrange(size // 2, size)}-"
+                endpoint = "download (range)"
+            await self.call(endpoint, "GET", target, headers=headers,
+                            timeout=self.args.download_timeout)
+            if self.stop.is_set():
+                return
+
+    async def sync_loop(self):
+        interval = self.args.push_sync_interval if self.args.push else self.args.sync_interval
+        while await self.sleep(interval * random.uniform(0.8, 1.2)):
+            await self.sync()
+
+    async def push_loop(self):
+        while not self.stop.is_set():
+            params = {"token": self.token, "timeout": self.args.push_timeout}
+            if self.events_version:
+                params["since"] = self.events_version
+            status, data = await self.call("events", "GET", f"/api/device/events?{urlencode(params)}",
+                                           connection=self.events_connection,
+                                           timeout=self.args.push_timeout + 15)
+            if status != 200:
+                if not await self.sleep(random.uniform(5, 15)):
+                    return
+                continue
+            event = json.loads(data)
+            changed = self.events_version is not None and event.get("changed")
+            self.events_version = event.get("version")
+            if changed:
+                await self.sync()
+
+
+def fake_summary(period: float) -> Dict:
+    now = time.time()
+    media = {f"m{random.randrange(50)}": {"plays": 3, "seconds": 30.0, "drift": 0.02,
+                                           "dropped": 0, "sw_decode": 0}
+             for _ in range(random.randint(1, 5))}
+    return {"from": now - period, "to": now, "plays": sum(m["plays"] for m in media.values()),
+            "media": media, "device": {"cpu_temp_max": 55.0, "cpu_temp_avg": 51.2,
+                                       "throttled": 0, "mem_used_mb_max": 310}}
+
+
+async def run(args) -> Dict:
+    stats = Stats()
+    stop = asyncio.Event()
+    players = [VirtualPlayer(args.first + i, args, stats, stop) for i in range(args.devices)]
+    tasks = [asyncio.ensure_future(p.run()) for p in players]
+
+    async def progress():
+        while not stop.is_set():
+            await asyncio.sleep(10)
+            done = sum(len(v) for v in stats.latencies.values())
+            errors = sum(stats.errors.values())
+            print(f"[LOADGEN] {time.monotonic() - stats.started:5.0f}s  {done} requests, "
+                  f"{errors} errors, {stats.in_flight} in flight", file=sys.stderr)
+
+    reporter = asyncio.ensure_future(progress())
+    await asyncio.sleep(args.ramp + args.duration)
+    stop.set()
+    # Held long-polls and downloads end by themselves or time out
+    await asyncio.wait(tasks, timeout=args.timeout + args.push_timeout + 20)
+    for task in tasks:
+        task.cancel()
+    reporter.cancel()
+    return stats.report()
+
+
+def print_report(report: Dict):
+    print(f"\n{report['requests']} requests in {report['elapsed_s']}s "
+          f"({report['rps']} req/s, {report['downloaded_mb']} MB downloaded, "
+          f"max {report['max_in_flight']} in flight)\n")
+    print(f"{'endpoint':<18}{'count':>8}{'errors':>8}{'req/s':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  status")
+    for name, e in report["endpoints"].items():
+        codes = " ".join(f"{code}:{n}" for code, n in sorted(e["status"].items()))
+        print(f"{name:<18}{e['count']:>8}{e['errors']:>8}{e['rps']:>9}{e['p50_ms']:>9}"
+              f"{e['p90_ms']:>9}{e['p99_ms']:>9}{e['max_ms']:>9}  {codes}")
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions of p50/p99 latency or error rate against a baseline run"""
+    regressions = []
+    for name, base in baseline.get("endpoints", {}).items():
+        current = report["endpoints"].get(name)
+        if not current:
+            continue
+        for key in ("p50_ms", "p99_ms"):
+            # Small absolute changes are noise, whatever the ratio
+            if current[key] > base[key] * (1 + tolerance) and current[key] - base[key] > 5:
+                regressions.append(f"{name} {key}: {base[key]} -> {current[key]}")
+        if current["error_rate"] > base["error_rate"] + 0.01:
+            regressions.append(f"{name} error rate: {base['error_rate']:.2%} -> {current['error_rate']:.2%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a fleet of players against the device API")
+    parser.add_argument("--url", default="http://localhost:3000", help="server base URL (http only)")
+    parser.add_argument("--devices", type=int, default=100, help="virtual players")
+    parser.add_argument("--first", type=int, default=0, help="index of the first seeded device token")
+    parser.add_argument("--token-prefix", default="loadtest-", help="seeded device tokens are <prefix><index>")
+    parser.add_argument("--ramp", type=float, default=30, help="seconds over which players start")
+    parser.add_argument("--duration", type=float, default=120, help="seconds to run after the ramp")
+    parser.add_argument("--sync-interval", type=float, default=60, help="seconds between syncs (polling)")
+    parser.add_argument("--push", action="store_true", help="hold /api/device/events open and sync slowly")
+    parser.add_argument("--push-timeout", type=int, default=50, help="long-poll timeout sent to the server")
+    parser.add_argument("--push-sync-interval", type=float, default=900, help="seconds between syncs with --push")
+    parser.add_argument("--pair-fraction", type=float, default=0.0,
+                        help="share of players that first register and poll pairing status")
+    parser.add_argument("--pair-polls", type=int, default=3, help="status polls per pairing player")
+    parser.add_argument("--download-fraction", type=float, default=0.2,
+                        help="share of players that download media after the initial sync")
+    parser.add_argument("--max-downloads", type=int, default=3, help="files per downloading player")
+    parser.add_argument("--range-fraction", type=float, default=0.25, help="share of downloads resumed with Range")
+    parser.add_argument("--stats-fraction", type=float, default=0.2, help="share of syncs carrying play stats")
+    parser.add_argument("--timeout", type=float, default=30, help="request timeout in seconds")
+    parser.add_argument("--download-timeout", type=float, default=300, help="download timeout in seconds")
+    parser.add_argument("--seed", type=int, help="random seed, for repeatable runs")
+    parser.add_argument("--json", metavar="FILE", help="write the report as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="baseline report; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed latency increase for --compare")
+    args = parser.parse_args()
+
+    if urlsplit(args.url).scheme != "http":
+        parser.error("only http:// URLs are supported; test against the app server directly")
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    print(f"[LOADGEN] {args.devices} players against {args.url} "
+          f"({'push' if args.push else 'polling'})", file=sys.stderr)
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+
+// Media processing worker: probes uploads with ffprobe and transcodes them
+// into the device-profile renditions listed in lib/media-profiles.json.
+//
+// Pending MediaRendition rows are the job queue. Run alongside the app:
+//   node scripts/media-worker.js [--concurrency N] [--once] [--backfill]
+// --once exits when no job is due, --backfill queues renditions for media
+// uploaded before the worker existed. The worker also records each
+// original's SHA-256, which the sync API hands to players. Requires
+// ffmpeg/ffprobe on PATH.
+// Renditions go to Vercel Blob when BLOB_READ_WRITE_TOKEN is set, otherwise
+// to public/uploads.
+
+require('dotenv').config();
+const { PrismaClient } = require('@prisma/client');
+const { spawn } = require('child_process');
+const crypto = require('crypto');
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const { Readable } = require('stream');
+const { pipeline } = require('stream/promises');
+const profiles = require('../lib/media-profiles.json');
+
+const prisma = new PrismaClient();
+
+const UPLOADS_DIR = path.join(__dirname, '..', 'public', 'uploads');
+const MAX_ATTEMPTS = 3;
+// A failed job waits RETRY_MS, doubling with each attempt, before it is
+// claimed again: most failures (source unreachable, blob store down) are
+// not fixed by retrying right away
+const RETRY_MS = 60 * 1000;
+const POLL_MS = 5000;
+// Jobs stuck in "processing" this long belonged to a worker that died
+const STALE_MS = 2 * 60 * 60 * 1000;
+
+const args = process.argv.slice(2);
+const option = (name, fallback) => {
+    const i = args.indexOf(name);
+    return i >= 0 && args[i + 1] ? args[i + 1] : fallback;
+};
+const concurrency = parseInt(option('--concurrency', Math.max(1, Math.floor(os.cpus().length / 2))), 10);
+const ffmpegThreads = Math.max(1, Math.floor(os.cpus().length / concurrency));
+let running = true;
+
+function profileFor(name) {
+    for (const kind of ['video', 'image']) {
+        const profile = profiles[kind].find((p) => p.name === name);
+        if (profile) return { kind, profile };
+    }
+    return null;
+}
+
+function run(cmd, cmdArgs) {
+    return new Promise((resolve, reject) => {
+        const child = spawn(cmd, cmdArgs, { stdio: ['ignore', 'pipe', 'pipe'] });
+        let stdout = '';
+        let stderr = '';
+        child.stdout.on('data', (d) => { stdout += d; });
+        child.stderr.on('data', (d) => { stderr = (stderr + d).slice(-2000); });
+        child.on('error', reject);
+        child.on('close', (code) => {
+            if (code === 0) resolve(stdout);
+            else reject(new Error(`${cmd} exited with ${code}: ${stderr.trim()}`));
+        });
+    });
+}
+
+function parseRate(rate) {
+    const [num, den] = String(rate || '0/1').split('/').map(Number);
+    return den ? num / den : num || 0;
+}
+
+async function probe(file) {
+    const out = await run('ffprobe', ['-v', 'error', '-print_format', 'json', '-show_streams', file]);
+    const streams = JSON.parse(out).streams || [];
+    const video = streams.find((s) => s.codec_type === 'video');
+    if (!video) throw new Error('no video stream');
+    return {
+        codec: video.codec_name,
+        width: video.width,
+        height: video.height,
+        fps: parseRate(video.avg_frame_rate) || parseRate(video.r_frame_rate),
+        hasAudio: streams.some((s) => s.codec_type === 'audio'),
+    };
+}
+
+// Profiles describe a landscape box; portrait sources use it rotated
+function box(profile, src) {
+    const portrait = src.height > src.width;
+    return portrait
+        ? { width: profile.maxHeight, height: profile.maxWidth }
+        : { width: profile.maxWidth, height: profile.maxHeight };
+}
+
+function needsRendition(kind, profile, src, ext) {
+    const { width, height } = box(profile, src);
+    const oversized = src.width > width || src.height > height;
+    if (kind === 'image') return oversized && ext !== '.gif'; // keep animations
+    return oversized || src.codec !== profile.codec || src.fps > profile.maxFps + 0.5;
+}
+
+function ffmpegArgs(kind, profile, src, input, output) {
+    const { width, height } = box(profile, src);
+    let filter = `scale=w=${width}:h=${height}:force_original_aspect_ratio=decrease`;
+    if (kind === 'image') {
+        return ['-y', '-v', 'error', '-i', input, '-vf', filter, '-frames:v', '1', ...profile.args, output];
+    }
+    filter += ':force_divisible_by=2';
+    if (src.fps > profile.maxFps + 0.5) filter += `,fps=${profile.maxFps}`;
+    let encode = profile.args;
+    if (!src.hasAudio) {
+        const i = encode.indexOf('-c:a');
+        encode = [...encode.slice(0, i), '-an'];
+    }
+    return ['-y', '-v', 'error', '-i', input, '-vf', filter, '-threads', String(ffmpegThreads), ...encode, output];
+}
+
+async function fetchSource(media, dir) {
+    if (!media.url.startsWith('http')) {
+        return path.join(UPLOADS_DIR, path.basename(media.filename || media.url));
+    }
+    const file = path.join(dir, 'source' + path.extname(new URL(media.url).pathname));
+    const res = await fetch(media.url);
+    if (!res.ok || !res.body) throw new Error(`source download failed: ${res.status}`);
+    await pipeline(Readable.fromWeb(res.body), fs.createWriteStream(file));
+    return file;
+}
+
+function sha256File(file) {
+    return new Promise((resolve, reject) => {
+        const hash = crypto.createHash('sha256');
+        fs.createReadStream(file)
+            .on('data', (d) => hash.update(d))
+            .on('end', () => resolve(hash.digest('hex')))
+            .on('error', reject);
+    });
+}
+
+async function store(file, name) {
+    if (process.env.BLOB_READ_WRITE_TOKEN) {
+        const { put } = require('@vercel/blob');
+        const blob = await put(`renditions/${name}`, fs.createReadStream(file), {
+            access: 'public',
+            addRandomSuffix: false,
+        });
+        return { url: blob.url, filename: blob.pathname };
+    }
+    fs.mkdirSync(UPLOADS_DIR, { recursive: true });
+    await fs.promises.copyFile(file, path.join(UPLOADS_DIR, name));
+    return { url: `/uploads/${name}`, filename: name };
+}
+
+// Bump the playlists using this media so devices get a new sync version
+async function touchPlaylists(mediaItemId) {
+    await prisma.playlist.updateMany({
+        where: { items: { some: { mediaItemId } } },
+        data: { updatedAt: new Date() },
+    });
+}
+
+async function processJob(job) {
+    const media = job.mediaItem;
+    const target = profileFor(job.profile);
+    const dir = await fs.promises.mkdtemp(path.join(os.tmpdir(), 'media-worker-'));
+    const label = `${media.name} → ${job.profile}`;
+
+    try {
+        if (!target) throw new Error(`unknown profile ${job.profile}`);
+        const { kind, profile } = target;
+        const input = await fetchSource(media, dir);
+        const src = await probe(input);
+        const sha256 = media.sha256 || await sha256File(input);
+
+        // Record what the upload really is; sync uses it to pick renditions
+        // and passes the hash on so players can verify copies from peers
+        await prisma.mediaItem.update({
+            where: { id: media.id },
+            data: {
+                width: src.width,
+                height: src.height,
+                fps: kind === 'video' ? src.fps : media.fps,
+                codec: src.codec,
+                sha256,
+            },
+        });
+        if (!media.sha256) await touchPlaylists(media.id);
+
+        const ext = path.extname(media.filename || media.url).toLowerCase();
+        if (!needsRendition(kind, profile, src, ext)) {
+            await prisma.mediaRendition.update({ where: { id: job.id }, data: { status: 'skipped', error: null } });
+            console.log(`[WORKER] ${label}: original already fits`);
+            return;
+        }
+
+        const started = Date.now();
+        const output = path.join(dir, 'out' + profile.ext);
+        await run('ffmpeg', ffmpegArgs(kind, profile, src, input, output));
+        const result = await probe(output);
+        const stored = await store(output, `r-${media.id}-${profile.name}${profile.ext}`);
+
+        await prisma.mediaRendition.update({
+            where: { id: job.id },
+            data: {
+                status: 'ready',
+                ...stored,
+                width: result.width,
+                height: result.height,
+                fps: kind === 'video' ? result.fps : null,
+                size: (await fs.promises.stat(output)).size,
+                sha256: await sha256File(output),
+                error: null,
+            },
+        });
+        await touchPlaylists(media.id);
+        console.log(`[WORKER] ${label}: ready in ${((Date.now() - started) / 1000).toFixed(1)}s`);
+    } catch (error) {
+        const failed = job.attempts >= MAX_ATTEMPTS;
+        await prisma.mediaRendition.update({
+            where: { id: job.id },
+            data: {
+                status: failed ? 'failed' : 'pending',
+                error: String(error.message || error).slice(0, 1000),
+                nextAttemptAt: failed ? null : new Date(Date.now() + RETRY_MS * 2 ** (job.attempts - 1)),
+            },
+        });
+        console.error(`[WORKER] ${label}: ${failed ? 'failed' : 'will retry'}: ${error.message || error}`);
+    } finally {
+        await fs.promises.rm(dir, { recursive: true, force: true });
+    }
+}
+
+// Atomically move the oldest pending job that is due to "processing"
+async function claim() {
+    for (;;) {
+        const job = await prisma.mediaRendition.findFirst({
+            where: {
+                status: 'pending',
+                OR: [{ nextAttemptAt: null }, { nextAttemptAt: { lte: new Date() } }],
+            },
+            orderBy: { createdAt: 'asc' },
+            include: { mediaItem: true },
+        });
+        if (!job) return null;
+        const { count } = await prisma.mediaRendition.updateMany({
+            where: { id: job.id, status: 'pending' },
+            data: { status: 'processing', attempts: { increment: 1 } },
+        });
+        if (count === 1) return { ...job, attempts: job.attempts + 1 };
+        // Another worker took it first
+    }
+}
+
+async function backfill() {
+    const media = await prisma.mediaItem.findMany({ select: { id: true, type: true } });
+    const data = [];
+    for (const item of media) {
+        const kind = item.type === 'video' || item.type === 'image' ? item.type : null;
+        if (!kind) continue;
+        for (const profile of profiles[kind]) data.push({ mediaItemId: item.id, profile: profile.name });
+    }
+    const { count } = await prisma.mediaRendition.createMany({ data, skipDuplicates: true });
+    console.log(`[WORKER] Backfill queued ${count} rendition(s)`);
+
+    // Hashes for media whose jobs all finished before hashes were recorded
+    const unhashed = await prisma.mediaItem.findMany({
+        where: { sha256: null, type: { in: ['video', 'image'] } },
+        select: { id: true, url: true, filename: true },
+    });
+    for (const item of unhashed) {
+        const dir = await fs.promises.mkdtemp(path.join(os.tmpdir(), 'media-worker-'));
+        try {
+            const sha256 = await sha256File(await fetchSource(item, dir));
+            await prisma.mediaItem.update({ where: { id: item.id }, data: { sha256 } });
+            await touchPlaylists(item.id);
+        } catch (error) {
+            console.error(`[WORKER] Could not hash media ${item.id}: ${error.message || error}`);
+        } finally {
+            await fs.promises.rm(dir, { recursive: true, force: true });
+        }
+    }
+    if (unhashed.length) console.log(`[WORKER] Backfill hashed ${unhashed.length} original(s)`);
+}
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+async function main() {
+    console.log(`[WORKER] Starting with ${concurrency} concurrent job(s)`);
+    const stale = await prisma.mediaRendition.updateMany({
+        where: { status: 'processing', updatedAt: { lt: new Date(Date.now() - STALE_MS) } },
+        data: { status: 'pending' },
+    });
+    if (stale.count) console.log(`[WORKER] Requeued ${stale.count} stale job(s)`);
+    if (args.includes('--backfill')) await backfill();
+
+    const active = new Set();
+    while (running) {
+        while (running && active.size < concurrency) {
+            const job = await claim();
+            if (!job) break;
+            const task = processJob(job).finally(() => active.delete(task));
+            active.add(task);
+        }
+        if (!active.size && args.includes('--once')) break;
+        await Promise.race([...active, sleep(POLL_MS)]);
+    }
+    await Promise.all(active);
+}
+
+for (const signal of ['SIGINT', 'SIGTERM']) {
+    process.on(signal, () => {
+        console.log('[WORKER] Finishing running jobs...');
+        running = false;
+    });
+}
+
+main()
+    .catch(e => console.error(e))
+    .finally(async () => await prisma.$disconnect());
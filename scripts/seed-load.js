@@ -0,0 +1,170 @@
+// Seeds a database for scripts/loadgen.py: one user owning media, playlists,
+// schedules and N paired devices whose tokens are loadtest-0..loadtest-N-1.
+//
+//   node scripts/seed-load.js [--devices 1000] [--media 20] [--playlists 10]
+//                             [--schedules 5] [--size-mb 2]
+//   node scripts/seed-load.js --cleanup                   # remove the seed
+//   node scripts/seed-load.js --cleanup-unpaired 60       # devices registered
+//                                                         # by the last hour's runs
+//
+// Media files are random bytes written to public/uploads, so downloads go
+// through the app's own download route. Re-running replaces the seed.
+// Use a dedicated database: --cleanup-unpaired does not know which unpaired
+// devices came from the load generator.
+
+require('dotenv').config();
+const { PrismaClient } = require('@prisma/client');
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+
+const prisma = new PrismaClient();
+
+const UPLOADS_DIR = path.join(__dirname, '..', 'public', 'uploads');
+const EMAIL = 'loadtest@example.invalid';
+const PREFIX = 'loadtest-';
+const BATCH = 1000;
+
+function option(name, fallback) {
+    const index = process.argv.indexOf(`--${name}`);
+    if (index === -1) return fallback;
+    const value = Number(process.argv[index + 1]);
+    return Number.isFinite(value) ? value : fallback;
+}
+
+async function cleanup() {
+    const user = await prisma.user.findUnique({ where: { email: EMAIL } });
+    if (!user) {
+        console.log('No load test seed found.');
+        return;
+    }
+    const devices = await prisma.device.deleteMany({ where: { token: { startsWith: PREFIX } } });
+    await prisma.schedule.deleteMany({ where: { userId: user.id } });
+    await prisma.playlist.deleteMany({ where: { userId: user.id } });
+    const media = await prisma.mediaItem.findMany({ where: { userId: user.id }, select: { filename: true } });
+    await prisma.mediaItem.deleteMany({ where: { userId: user.id } });
+    await prisma.user.delete({ where: { id: user.id } });
+    for (const { filename } of media) {
+        if (filename) fs.rmSync(path.join(UPLOADS_DIR, filename), { force: true });
+    }
+    console.log(`Removed ${devices.count} devices and ${media.length} media items.`);
+}
+
+async function cleanupUnpaired(minutes) {
+    const since = new Date(Date.now() - minutes * 60 * 1000);
+    const { count } = await prisma.device.deleteMany({
+        where: { userId: null, status: 'unpaired', createdAt: { gte: since } },
+    });
+    console.log(`Removed ${count} unpaired devices registered since ${since.toISOString()}.`);
+}
+
+function pick(list, count) {
+    return [...list].sort(() => Math.random() - 0.5).slice(0, count);
+}
+
+async function seed() {
+    const deviceCount = option('devices', 1000);
+    const mediaCount = option('media', 20);
+    const playlistCount = option('playlists', 10);
+    const scheduleCount = option('schedules', 5);
+    const sizeBytes = Math.round(option('size-mb', 2) * 1024 * 1024);
+
+    await cleanup();
+
+    const user = await prisma.user.create({
+        data: {
+            email: EMAIL,
+            name: 'Load test',
+            // Not a valid bcrypt hash: nobody can log in as this user
+            password: crypto.randomBytes(16).toString('hex'),
+        },
+    });
+
+    fs.mkdirSync(UPLOADS_DIR, { recursive: true });
+    const media = [];
+    for (let i = 0; i < mediaCount; i++) {
+        const video = i % 3 !== 0;
+        const filename = `${PREFIX}${i}.${video ? 'mp4' : 'jpg'}`;
+        const size = video ? sizeBytes : Math.round(sizeBytes / 8);
+        fs.writeFileSync(path.join(UPLOADS_DIR, filename), crypto.randomBytes(size));
+        media.push(await prisma.mediaItem.create({
+            data: {
+                name: filename,
+                type: video ? 'video' : 'image',
+                url: `/uploads/${filename}`,
+                filename,
+                duration: 10,
+                size,
+                userId: user.id,
+            },
+        }));
+    }
+
+    const playlists = [];
+    for (let i = 0; i < playlistCount; i++) {
+        const items = pick(media, Math.min(media.length, 5 + (i % 6)));
+        playlists.push(await prisma.playlist.create({
+            data: {
+                name: `Load test ${i}`,
+                userId: user.id,
+                items: { create: items.map((m, order) => ({ order, mediaItemId: m.id })) },
+            },
+        }));
+    }
+
+    const schedules = [];
+    for (let i = 0; i < scheduleCount; i++) {
+        const slots = [];
+        for (let day = 0; day < 7; day++) {
+            slots.push(
+                { dayOfWeek: day, startTime: '08:00', endTime: '12:00', playlistId: playlists[(i + day) % playlists.length].id },
+                { dayOfWeek: day, startTime: '12:00', endTime: '20:00', playlistId: playlists[(i + day + 1) % playlists.length].id }
+            );
+        }
+        schedules.push(await prisma.schedule.create({
+            data: { name: `Load test ${i}`, userId: user.id, items: { create: slots } },
+        }));
+    }
+
+    // Half the fleet on schedules, half on a single playlist; all with a fallback
+    for (let start = 0; start < deviceCount; start += BATCH) {
+        const data = [];
+        for (let i = start; i < Math.min(start + BATCH, deviceCount); i++) {
+            const scheduled = schedules.length > 0 && i % 2 === 0;
+            data.push({
+                name: `Load test ${i}`,
+                token: `${PREFIX}${i}`,
+                status: 'offline',
+                userId: user.id,
+                defaultPlaylistId: playlists[i % playlists.length].id,
+                ...(scheduled
+                    ? { scheduleId: schedules[i % schedules.length].id }
+                    : { activePlaylistId: playlists[(i + 1) % playlists.length].id }),
+            });
+        }
+        await prisma.device.createMany({ data });
+        console.log(`Created devices ${start}..${start + data.length - 1}`);
+    }
+
+    console.log(`Seeded ${deviceCount} devices (tokens ${PREFIX}0..${PREFIX}${deviceCount - 1}), ` +
+        `${media.length} media, ${playlists.length} playlists, ${schedules.length} schedules.`);
+}
+
+async function main() {
+    if (process.argv.includes('--cleanup')) {
+        await cleanup();
+    } else if (process.argv.includes('--cleanup-unpaired')) {
+        await cleanupUnpaired(option('cleanup-unpaired', 60));
+    } else {
+        if (option('media', 20) < 1 || option('playlists', 10) < 1) {
+            throw new Error('--media and --playlists must be at least 1');
+        }
+        await seed();
+    }
+}
+
+main()
+    .catch(e => console.error(e))
+    .finally(async () => {
+        await prisma.$disconnect();
+    });
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The player modules are installed flat on devices; import them the same way
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "public"))
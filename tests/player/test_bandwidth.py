@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import bandwidth
+from bandwidth import BULK, URGENT, WAIT, BandwidthPolicy, TokenBucket, parse_windows
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(bandwidth.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(bandwidth.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_unlimited_bucket_never_waits(clock):
+    TokenBucket(0).consume(10 ** 9)
+    assert clock.sleeps == []
+
+
+def test_bucket_holds_the_rate(clock):
+    bucket = TokenBucket(100_000)
+    for _ in range(10):
+        bucket.consume(50_000)
+    assert clock.now - 1000.0 == pytest.approx(5.0)
+
+
+def test_idle_bucket_refills_to_one_second(clock):
+    bucket = TokenBucket(100_000)
+    clock.now += 60
+    bucket.consume(300_000)
+    assert clock.sleeps == [pytest.approx(2.0)]
+
+
+def test_concurrent_consumers_share_the_debt(clock, monkeypatch):
+    bucket = TokenBucket(100_000)
+    # Workers sleeping side by side: the clock does not move in between
+    monkeypatch.setattr(bandwidth.time, "sleep", clock.sleeps.append)
+    bucket.consume(50_000)
+    bucket.consume(50_000)
+    assert clock.sleeps == [pytest.approx(0.5), pytest.approx(1.0)]
+
+
+def test_parse_windows():
+    assert parse_windows(["22:00-06:00", "12:30-13:00", "bad", "24:00-01:00"]) == [
+        (22 * 60, 6 * 60), (12 * 60 + 30, 13 * 60), (0, 60)]
+    assert parse_windows(None) == []
+
+
+def test_overnight_window():
+    policy = BandwidthPolicy({"download_windows": ["22:00-06:00"]})
+    evening = datetime(2026, 10, 17, 21, 0)
+    assert not policy.in_window(evening)
+    assert policy.in_window(evening.replace(hour=23))
+    assert policy.in_window(evening.replace(hour=5, minute=59))
+    assert not policy.in_window(evening.replace(hour=6))
+    assert policy.next_window(evening) == evening.replace(hour=22)
+    assert policy.next_window(evening.replace(hour=23)) == datetime(2026, 10, 18, 22, 0)
+
+
+def test_plan():
+    policy = BandwidthPolicy({"download_windows": ["22:00-06:00"], "bulk_rate_kbps": 800})
+    now = datetime(2026, 10, 17, 12, 0)
+    # 100 kB/s trickle: 1 MB takes 10s
+    assert policy.plan(10 ** 6, now + timedelta(minutes=1), now) == BULK
+    assert policy.plan(10 ** 9, now + timedelta(hours=1), now) == URGENT
+    assert policy.plan(10 ** 9, now + timedelta(days=1), now) == BULK
+    assert policy.plan(10 ** 9, now, now.replace(hour=23)) == BULK
+
+    waiting = BandwidthPolicy({"download_windows": ["22:00-06:00"]})
+    assert waiting.plan(10 ** 6, now + timedelta(days=1), now) == WAIT
+    assert waiting.plan(10 ** 6, now + timedelta(hours=1), now) == URGENT
@@ -0,0 +1,36 @@
+import hashlib
+
+from media_cache import MediaCache
+
+
+def test_files_stored_by_name_are_migrated_before_purge(tmp_path):
+    media = tmp_path / "media"
+    media.mkdir()
+    content = b"frame" * 1000
+    (media / "intro.mp4").write_bytes(content)
+    (media / "stale.jpg").write_bytes(b"old")
+    (media / "pairing.png").write_bytes(b"png")
+    item = {"media_id": "m1", "filename": "intro.mp4", "size": len(content),
+            "sha256": hashlib.sha256(content).hexdigest()}
+    stale = {"media_id": "m2", "filename": "stale.jpg", "size": 10}
+
+    cache = MediaCache(str(media))
+    assert cache.needs_fetch(item)
+    assert cache.migrate_legacy(item)
+    assert not cache.migrate_legacy(stale)
+    cache.purge_strays()
+
+    blob = cache.path_for(item)
+    assert blob.endswith(item["sha256"] + ".mp4")
+    assert not cache.needs_fetch(item)
+    assert sorted(p.name for p in media.iterdir()) == [".incoming", item["sha256"] + ".mp4"]
+
+
+def test_unverifiable_files_are_not_migrated(tmp_path):
+    media = tmp_path / "media"
+    media.mkdir()
+    (media / "clip.mp4").write_bytes(b"data")
+
+    cache = MediaCache(str(media))
+    assert not cache.migrate_legacy({"media_id": "m1", "filename": "clip.mp4"})
+    assert (media / "clip.mp4").exists()
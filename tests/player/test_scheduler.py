@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+from scheduler import ScheduleEvaluator
+
+DEFAULT = {"id": "default"}
+NIGHT = {"id": "night"}
+MORNING = {"id": "morning"}
+WEDNESDAY = {"id": "wednesday"}
+
+# 2026-10-16 is a Friday; the server numbers days from Sunday = 0
+FRIDAY, SATURDAY, WEDNESDAY_DAY, MONDAY = 5, 6, 3, 1
+
+
+def at(day: int, hhmm: str) -> datetime:
+    """A moment in the week of Sunday 2026-10-11"""
+    hours, minutes = map(int, hhmm.split(":"))
+    return datetime(2026, 10, 11 + day, hours, minutes)
+
+
+def slot(day: int, start: str, end: str, playlist: dict) -> dict:
+    return {"dayOfWeek": day, "startTime": start, "endTime": end, "playlist": playlist}
+
+
+def evaluator(*slots) -> ScheduleEvaluator:
+    return ScheduleEvaluator({"items": list(slots)}, DEFAULT)
+
+
+def test_overnight_slot_runs_past_midnight():
+    schedule = evaluator(slot(FRIDAY, "22:00", "06:00", NIGHT))
+    assert schedule.active_playlist(at(FRIDAY, "21:59")) is DEFAULT
+    assert schedule.active_playlist(at(FRIDAY, "22:00")) is NIGHT
+    assert schedule.active_playlist(at(SATURDAY, "00:00")) is NIGHT
+    assert schedule.active_playlist(at(SATURDAY, "05:59")) is NIGHT
+    assert schedule.active_playlist(at(SATURDAY, "06:00")) is DEFAULT
+
+
+def test_whole_day_slots():
+    for end in ("00:00", "24:00"):
+        schedule = evaluator(slot(WEDNESDAY_DAY, "00:00", end, WEDNESDAY))
+        assert schedule.active_playlist(at(WEDNESDAY_DAY - 1, "23:59")) is DEFAULT
+        assert schedule.active_playlist(at(WEDNESDAY_DAY, "00:00")) is WEDNESDAY
+        assert schedule.active_playlist(at(WEDNESDAY_DAY, "23:59")) is WEDNESDAY
+        assert schedule.active_playlist(at(WEDNESDAY_DAY + 1, "00:00")) is DEFAULT
+
+
+def test_later_start_wins_when_slots_overlap():
+    schedule = evaluator(slot(MONDAY, "08:00", "12:00", MORNING),
+                         slot(MONDAY, "10:00", "11:00", NIGHT))
+    assert schedule.active_playlist(at(MONDAY, "09:00")) is MORNING
+    assert schedule.active_playlist(at(MONDAY, "10:30")) is NIGHT
+    assert schedule.active_playlist(at(MONDAY, "11:00")) is MORNING
+
+
+def test_next_transition_is_the_next_boundary():
+    schedule = evaluator(slot(FRIDAY, "22:00", "06:00", NIGHT))
+    assert schedule.next_transition(at(FRIDAY, "12:00")) == at(FRIDAY, "22:00")
+    # A boundary that has just been reached is not returned again
+    assert schedule.next_transition(at(SATURDAY, "03:00")) == at(SATURDAY, "06:00")
+    # Midnight counts when the day on either side of it has slots
+    assert schedule.next_transition(at(SATURDAY, "06:00")) == at(SATURDAY + 1, "00:00")
+    assert schedule.next_transition(at(FRIDAY, "22:00")) == at(SATURDAY, "00:00")
+
+
+def test_next_transition_a_week_ahead():
+    schedule = evaluator(slot(MONDAY, "09:00", "10:00", MORNING))
+    assert schedule.next_transition(at(MONDAY, "09:00")) == at(MONDAY, "10:00")
+    assert schedule.next_transition(at(MONDAY, "10:30")) == at(MONDAY + 1, "00:00")
+    assert schedule.next_transition(at(MONDAY + 1, "00:00")) == at(MONDAY, "00:00") + timedelta(days=7)
+
+
+def test_next_transition_at_midnight_of_a_whole_day_slot():
+    schedule = evaluator(slot(WEDNESDAY_DAY, "00:00", "00:00", WEDNESDAY))
+    assert schedule.next_transition(at(WEDNESDAY_DAY - 1, "12:00")) == at(WEDNESDAY_DAY, "00:00")
+    assert schedule.next_transition(at(WEDNESDAY_DAY, "12:00")) == at(WEDNESDAY_DAY + 1, "00:00")
+
+
+def test_next_transition_without_slots():
+    assert evaluator().next_transition(at(MONDAY, "12:00")) is None
+
+
+def test_upcoming_slots_in_order():
+    schedule = evaluator(slot(FRIDAY, "22:00", "06:00", NIGHT),
+                         slot(SATURDAY, "06:00", "09:00", MORNING))
+    now = at(FRIDAY, "20:00")
+    assert [(t, p["id"]) for t, p in schedule.upcoming_slots(now)] == [
+        (now, "default"),
+        (at(FRIDAY, "22:00"), "night"),
+        (at(SATURDAY, "06:00"), "morning"),
+    ]
+    assert schedule.upcoming_playlists(now, timedelta(hours=1)) == [DEFAULT]
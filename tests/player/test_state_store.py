@@ -0,0 +1,52 @@
+import sqlite3
+
+import pytest
+
+from state_store import StateStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    yield store
+    store.close()
+
+
+def test_values_and_counters_round_trip(store):
+    store.put_many({"schedule": {"items": []}, "sync_version": "v1"})
+    assert store.get("schedule") == {"items": []}
+    assert store.get("sync_version") == "v1"
+    assert store.get("missing", "default") == "default"
+    assert store.incr("boots") == 1
+    assert store.incr("boots") == 2
+    assert store.counters() == {"boots": 2}
+
+
+def test_failed_commit_is_rolled_back(store):
+    # A deferred constraint fails at COMMIT, like SQLITE_FULL on a full card
+    store._db.execute("CREATE TABLE parent (id INTEGER PRIMARY KEY)")
+    store._db.execute("CREATE TABLE child (parent INTEGER REFERENCES parent (id) "
+                      "DEFERRABLE INITIALLY DEFERRED)")
+    store._db.execute("PRAGMA foreign_keys = ON")
+    with pytest.raises(sqlite3.Error):
+        with store.transaction() as db:
+            db.execute("INSERT INTO child (parent) VALUES (1)")
+            db.execute("INSERT OR REPLACE INTO kv (key, value, updated) VALUES ('lost', '1', 0)")
+
+    assert not store._db.in_transaction
+    store.put("running", True)
+    assert store.get("running") is True
+    assert store.get("lost") is None
+
+
+def test_damaged_file_is_quarantined(tmp_path):
+    path = tmp_path / "state.db"
+    path.write_bytes(b"not a database" * 100)
+    store = StateStore(str(path))
+    try:
+        assert store.recovered
+        assert (tmp_path / "state.db.corrupt").exists()
+        store.put("config", {"device_token": "t"})
+        assert store.get("config") == {"device_token": "t"}
+    finally:
+        store.close()
@@ -0,0 +1,79 @@
+import pytest
+
+from state_store import StateStore
+from telemetry import BATCH_SIZE, SPOOL, Telemetry
+
+
+@pytest.fixture
+def telemetry(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    telemetry = Telemetry("http://server", lambda: "token", store)
+    telemetry.sent = []
+    telemetry.online = True
+
+    def send(batch):
+        if telemetry.online:
+            telemetry.sent.append([r["message"] for r in batch])
+        return telemetry.online
+
+    telemetry._send = send
+    yield telemetry
+    store.close()
+
+
+def spooled(telemetry):
+    return [record["message"] for _, record in telemetry.store.spool_read(SPOOL)]
+
+
+def test_offline_events_are_spooled_and_replayed_oldest_first(telemetry):
+    telemetry.online = False
+    for n in range(3):
+        telemetry.log("info", f"offline {n}")
+        assert not telemetry.flush()
+        telemetry._retry_at = 0.0
+    assert spooled(telemetry) == ["offline 0", "offline 1", "offline 2"]
+
+    telemetry.online = True
+    telemetry.log("info", "online")
+    assert telemetry.flush()
+    assert telemetry.sent == [["online"], ["offline 0", "offline 1", "offline 2"]]
+    assert spooled(telemetry) == []
+
+
+def test_replay_stops_at_the_first_failed_batch(telemetry):
+    telemetry.store.spool_append(SPOOL, [{"level": "info", "message": str(n), "timestamp": ""}
+                                         for n in range(BATCH_SIZE + 5)])
+    calls = []
+
+    def send(batch):
+        calls.append(batch)
+        return len(calls) == 1
+
+    telemetry._send = send
+    assert not telemetry.flush()
+    assert [r["message"] for r in calls[0]] == [str(n) for n in range(BATCH_SIZE)]
+    assert spooled(telemetry) == [str(n) for n in range(BATCH_SIZE, BATCH_SIZE + 5)]
+
+
+def test_deferred_flush_spools_without_sending(telemetry):
+    telemetry._retry_at = float("inf")
+    telemetry.log("warning", "later")
+    assert not telemetry.flush()
+    assert telemetry.sent == []
+    assert spooled(telemetry) == ["later"]
+
+
+def test_compaction_drops_info_before_errors_and_oldest_first(telemetry):
+    telemetry.spool_max_bytes = 1000
+    telemetry.online = False
+    records = [("error", "error 0")] + [("info", f"info {n}") for n in range(20)] + [("error", "error 1")]
+    for level, message in records:
+        telemetry.log(level, message, timestamp="2026-10-17T12:00:00")
+    telemetry.flush()
+
+    kept = spooled(telemetry)
+    assert telemetry.store.spool_bytes(SPOOL) <= telemetry.spool_max_bytes // 2
+    assert kept[0] == "error 0" and kept[-1] == "error 1"
+    infos = [m for m in kept if m.startswith("info")]
+    assert infos and infos == [f"info {n}" for n in range(20 - len(infos), 20)]
+    assert telemetry.dropped == len(records) - len(kept)